@@ -0,0 +1,130 @@
+import binascii
+import datetime
+
+import pytest
+
+from lnk_model import ShellLinkRecord
+from lnk_writer import encode_link
+
+# a small fixed set of shortcuts, one per shape the parser has to handle, written by lnk_writer
+# kept apart from lnk_bench's random corpus so retuning the benchmark doesn't change what the tests cover
+
+MY_COMPUTER = binascii.unhexlify('1f50e04fd020ea3a6910a2d808002b30309d')
+VOLUME_C = b'\x2fC:\\' + b'\x00' * 19
+WINDOWS_DIR = b'\x31\x00' + b'\x00' * 8 + b'\x10\x00WINDOWS\x00'
+NOTEPAD = b'\x32\x00' + b'\x00' * 8 + b'\x20\x00NOTEPAD.EXE\x00'
+DOCUMENTS_FOLDER = '{FDD39AD0-238F-46AF-ADB4-6C85480369C7}'
+
+TIME = datetime.datetime(2021, 3, 4, 5, 6, 7, 890000)
+
+
+def header(is_unicode=True, **fields):
+    out = {'LinkFlags': {'IsUnicode': is_unicode}, 'file_attrs': {'FILE_ATTRIBUTE_ARCHIVE': True},
+           'create_time': TIME, 'access_time': TIME, 'write_time': TIME, 'file_size': 193536}
+    out.update(fields)
+    return out
+
+
+def id_list(*item_ids):
+    return dict(('item_id_%d' % (i + 1), item_id) for i, item_id in enumerate(item_ids))
+
+
+def local_info(path, **fields):
+    out = {'local_base_path': path, 'common_path_suffix': b'', 'drive_type_key': 3,
+           'drive_serial_number': 0x307A8A81, 'volume_label': b'OS'}
+    out.update(fields)
+    return out
+
+
+def extra_data(**blocks):
+    blocks['blocks'] = sorted(blocks)
+    return blocks
+
+
+FIXTURE_LINKS = [
+    ('id_list_only', {
+        'ShellLinkHeader': header(),
+        'link_target_id_list': id_list(MY_COMPUTER, VOLUME_C, WINDOWS_DIR, NOTEPAD),
+        'StringData': {},
+        'ExtraData': extra_data(),
+    }),
+    ('local_ansi', {
+        'ShellLinkHeader': header(is_unicode=False, show_command='SW_SHOWMAXIMIZED', icon_index=2),
+        'link_info': local_info(b'C:\\Windows\\notepad.exe'),
+        'StringData': {'name_string': b'Notepad', 'working_dir': b'C:\\Windows',
+                       'relative_path': b'..\\Windows\\notepad.exe'},
+        'ExtraData': extra_data(),
+    }),
+    ('local_unicode', {
+        'ShellLinkHeader': header(hotkey=['CTRL', 'ALT', 'F5']),
+        'link_target_id_list': id_list(MY_COMPUTER, VOLUME_C, WINDOWS_DIR, NOTEPAD),
+        'link_info': local_info(b'C:\\Windows\\notepad.exe', volume_label=u'B\xfcro'),
+        'StringData': {'name_string': u'Notepad \u65e5\u672c\u8a9e', 'working_dir': u'C:\\Windows',
+                       'command_line_arguments': u'--opt1 --opt2', 'icon_location': u'%SystemRoot%\\notepad.exe'},
+        'ExtraData': extra_data(
+            TrackerDataBlock={'machine_id': b'desktop-0001', 'droid_volume_id': DOCUMENTS_FOLDER,
+                              'droid_file_id': DOCUMENTS_FOLDER, 'droid_birth_volume_id': DOCUMENTS_FOLDER,
+                              'droid_birth_file_id': DOCUMENTS_FOLDER},
+            VistaAndAboveIDListDataBlock={'item_ids': [MY_COMPUTER, VOLUME_C]}),
+    }),
+    ('local_unicode_path', {
+        'ShellLinkHeader': header(),
+        'link_info': local_info(b'?', local_base_path_unicode=u'D:\\Dokumente\\\xe9t\xe9.txt', drive_type_key=2),
+        'StringData': {'working_dir': u'D:\\Dokumente'},
+        'ExtraData': extra_data(
+            EnvironmentVariableDataBlock={'target_ansi': b'%USERPROFILE%\\?t?.txt',
+                                          'target_unicode': u'%USERPROFILE%\\\xe9t\xe9.txt'}),
+    }),
+    ('network', {
+        'ShellLinkHeader': header(),
+        'link_info': {'net_name': b'\\\\fileserver\\share', 'network_provider_type_val': 0x003B0000,
+                      'common_path_suffix': b'reports\\q3.xlsx'},
+        'StringData': {'relative_path': u'..\\reports\\q3.xlsx'},
+        'ExtraData': extra_data(KnownFolderDataBlock={'known_folder_id': DOCUMENTS_FOLDER, 'offset': 0}),
+    }),
+    ('network_drive', {
+        'ShellLinkHeader': header(is_unicode=False),
+        'link_info': {'net_name': b'\\\\fileserver\\home', 'network_provider_type_val': 0x003B0000,
+                      'device_name': b'Z:', 'common_path_suffix': b'notes.txt'},
+        'StringData': {'working_dir': b'Z:\\'},
+        'ExtraData': extra_data(SpecialFolderDataBlock={'special_folder_id': 5, 'offset': 0}),
+    }),
+    ('console', {
+        'ShellLinkHeader': header(show_command='SW_SHOWMINNOACTIVE'),
+        'link_info': local_info(b'C:\\Windows\\System32\\cmd.exe'),
+        'StringData': {'command_line_arguments': u'/k echo hi'},
+        'ExtraData': extra_data(
+            ConsoleDataBlock={'fill_attributes_val': 7, 'screen_buffer_size_x': 120, 'screen_buffer_size_y': 9001,
+                              'window_size_x': 120, 'window_size_y': 30, 'font_size': 16 << 16,
+                              'font_family': 'FF_MODERN', 'font_weight_val': 400, 'font_name': u'Consolas',
+                              'cursor_size_val': 25, 'history_buffer_size': 50, 'num_of_history_buffers': 4,
+                              'color_table': list(range(16))},
+            ConsoleFEDataBlock={'code_page': 437},
+            ShimDataBlock={'layer_name': u'WinXPSp3'}),
+    }),
+    ('empty', {
+        'ShellLinkHeader': header(),
+        'StringData': {},
+        'ExtraData': extra_data(),
+    }),
+]
+
+
+@pytest.fixture(scope='session')
+def corpus(tmp_path_factory):
+    corpus_dir = tmp_path_factory.mktemp('corpus')
+    paths = []
+    for name, info in FIXTURE_LINKS:
+        path = corpus_dir / (name + '.lnk')
+        path.write_bytes(encode_link(ShellLinkRecord.from_info(info)))
+        paths.append(str(path))
+    return paths
+
+
+@pytest.fixture(scope='session')
+def corpus_data(corpus):
+    out = []
+    for path in corpus:
+        with open(path, 'rb') as f:
+            out.append(f.read())
+    return out
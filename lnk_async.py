@@ -0,0 +1,35 @@
+import asyncio
+import functools
+
+from lnk_scan import parse_buffer
+
+# asyncio entry points (python 3.7+): receive the shortcut bytes without blocking the event loop,
+# then parse them off the loop in an executor, with no temp files
+
+
+async def read_all(reader, max_size=1 << 20):
+    # read a StreamReader to EOF, refusing anything larger than max_size
+    data = await reader.read(max_size + 1)
+    chunks = [data]
+    size = len(data)
+    while data and size <= max_size:
+        data = await reader.read(max_size + 1 - size)
+        chunks.append(data)
+        size += len(data)
+    if size > max_size:
+        raise ValueError('shortcut is larger than %d bytes' % max_size)
+    return b''.join(chunks)
+
+
+async def parse_bytes(data, sections=None, path=None, executor=None):
+    """
+    parse a received buffer in an executor (the default thread pool unless one is given)
+    returns a lnk_scan.ScanResult, which also pickles across a ProcessPoolExecutor
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(parse_buffer, data, sections, path))
+
+
+async def parse_reader(reader, sections=None, path=None, executor=None, max_size=1 << 20):
+    data = await read_all(reader, max_size)
+    return await parse_bytes(data, sections, path, executor)
@@ -0,0 +1,291 @@
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import timeit
+import uuid
+
+from lnk_model import ShellLinkRecord
+from lnk_stats import ParseStats
+from lnk_tool import ShellLink
+from lnk_validate import validate_bytes
+from lnk_writer import encode_link
+
+try:
+    import resource
+except ImportError:
+    resource = None  # not on windows, peak RSS is left out
+
+# reproducible synthetic corpus + parse benchmarks, results are appended to bench_output.txt (one JSON per run)
+# so consecutive versions can be compared with --compare
+
+MY_COMPUTER = '{20D04FE0-3AEA-1069-A2D8-08002B30309D}'
+DOCUMENTS_FOLDER = '{FDD39AD0-238F-46AF-ADB4-6C85480369C7}'
+
+WORDS = ['Users', 'Public', 'Program Files', 'Windows', 'System32', 'Documents', 'Reports', 'Q3', 'build',
+         'tools', 'data', 'archive', 'shared', 'projects', 'temp']
+UNICODE_WORDS = [u'Dokumente', u'\xe9t\xe9', u'\u65e5\u672c\u8a9e', u'\u0434\u0430\u043d\u043d\u044b\u0435']
+EXTENSIONS = ['.exe', '.txt', '.docx', '.xlsx', '.pdf', '.bat']
+
+SECTIONS = [section for section, _ in ShellLink.SECTION_PARSERS]
+
+
+def root_item(clsid):
+    return b'\x1f\x50' + uuid.UUID(clsid.strip('{}')).bytes_le
+
+
+def volume_item(drive):
+    return b'\x2f' + drive.encode('ascii') + b'\x00' * (22 - len(drive))
+
+
+def file_entry_item(name, is_dir):
+    name = name.encode('ascii', 'replace') + b'\x00'
+    return struct.pack('<BBIIH', 0x31 if is_dir else 0x32, 0, 0, 0, 0x10 if is_dir else 0x20) + name + \
+        b'\x00' * (len(name) % 2)
+
+
+def random_path(rng, unicode_names):
+    words = WORDS + UNICODE_WORDS if unicode_names else WORDS
+    parts = [rng.choice(words) for _ in range(rng.randint(1, 5))]
+    return parts + ['file%04d%s' % (rng.randint(0, 9999), rng.choice(EXTENSIONS))]
+
+
+def random_time(rng):
+    return datetime.datetime(2010, 1, 1) + datetime.timedelta(seconds=rng.randint(0, 12 * 365 * 86400))
+
+
+def random_guid(rng):
+    return '{%s}' % str(uuid.UUID(int=rng.getrandbits(128))).upper()
+
+
+def random_info(rng):
+    # one shortcut in one of the shapes seen in the wild, as a ShellLink.info style dict
+    unicode_strings = rng.random() < 0.8
+    network = rng.random() < 0.25
+    drive = rng.choice('CDEHZ') + ':\\'
+    parts = random_path(rng, unicode_strings and rng.random() < 0.3)
+    info = {
+        'ShellLinkHeader': {
+            'LinkFlags': {'IsUnicode': unicode_strings},
+            'file_attrs': {'FILE_ATTRIBUTE_ARCHIVE': True},
+            'create_time': random_time(rng),
+            'access_time': random_time(rng),
+            'write_time': random_time(rng),
+            'file_size': rng.randint(0, 1 << 30),
+            'icon_index': rng.randint(0, 10),
+            'show_command': rng.choice(['SW_SHOWNORMAL', 'SW_SHOWMAXIMIZED', 'SW_SHOWMINNOACTIVE']),
+            'hotkey': rng.choice([None, None, None, ['CTRL', 'ALT', 'F%d' % rng.randint(1, 12)]]),
+        },
+    }
+
+    if rng.random() < 0.7:
+        item_ids = [root_item(MY_COMPUTER), volume_item(drive)]
+        item_ids.extend(file_entry_item(part, i < len(parts) - 1) for i, part in enumerate(parts))
+        info['link_target_id_list'] = dict(('item_id_%d' % (i + 1), item_id) for i, item_id in enumerate(item_ids))
+
+    if rng.random() < 0.9:
+        if network:
+            share = u'\\\\fileserver%d\\share%d' % (rng.randint(1, 20), rng.randint(1, 5))
+            link_info = {'net_name': share.encode('ascii'), 'network_provider_type_val': 0x003B0000,
+                         'common_path_suffix': u'\\'.join(parts)}
+            if rng.random() < 0.5:
+                link_info['device_name'] = b'Z:'
+        else:
+            link_info = {'local_base_path': drive + u'\\'.join(parts), 'common_path_suffix': b'',
+                         'drive_type_key': rng.choice([2, 3, 3, 3, 4]), 'drive_serial_number': rng.getrandbits(32),
+                         'volume_label': rng.choice([b'', b'OS', b'DATA', u'B\xfcro'])}
+        for key in ['local_base_path', 'common_path_suffix']:
+            value = link_info.get(key)
+            if value is not None and not isinstance(value, bytes):
+                try:
+                    link_info[key] = value.encode('ascii')
+                except UnicodeEncodeError:
+                    link_info[key] = b'?'
+                    link_info[key + '_unicode'] = value
+        info['link_info'] = link_info
+
+    string_data = {}
+    if rng.random() < 0.5:
+        string_data['name_string'] = u'Shortcut to %s' % parts[-1]
+    if rng.random() < 0.3:
+        string_data['relative_path'] = u'..\\' + u'\\'.join(parts)
+    if rng.random() < 0.8:
+        string_data['working_dir'] = drive + u'\\'.join(parts[:-1])
+    if rng.random() < 0.4:
+        string_data['command_line_arguments'] = u' '.join('--opt%d' % i for i in range(rng.randint(1, 8)))
+    if rng.random() < 0.4:
+        string_data['icon_location'] = u'%SystemRoot%\\System32\\shell32.dll'
+    if not unicode_strings:
+        string_data = dict((key, value.encode('cp1252', 'replace')) for key, value in string_data.items())
+    info['StringData'] = string_data
+
+    blocks = {}
+    if rng.random() < 0.2:
+        target = u'%USERPROFILE%\\' + u'\\'.join(parts)
+        blocks['EnvironmentVariableDataBlock'] = {'target_ansi': target.encode('ascii', 'replace'),
+                                                  'target_unicode': target}
+    if rng.random() < 0.1:
+        blocks['ConsoleDataBlock'] = {'fill_attributes_val': 7, 'screen_buffer_size_x': 120,
+                                      'screen_buffer_size_y': 9001, 'window_size_x': 120, 'window_size_y': 30,
+                                      'font_size': 16 << 16, 'font_family': 'FF_MODERN', 'font_weight_val': 400,
+                                      'font_name': u'Consolas', 'cursor_size_val': 25, 'history_buffer_size': 50,
+                                      'num_of_history_buffers': 4, 'color_table': list(range(16))}
+        blocks['ConsoleFEDataBlock'] = {'code_page': 437}
+    if rng.random() < 0.6:
+        blocks['TrackerDataBlock'] = {'machine_id': ('desktop-%04d' % rng.randint(0, 9999)).encode('ascii'),
+                                      'droid_volume_id': random_guid(rng), 'droid_file_id': random_guid(rng),
+                                      'droid_birth_volume_id': random_guid(rng),
+                                      'droid_birth_file_id': random_guid(rng)}
+    if rng.random() < 0.3:
+        blocks['KnownFolderDataBlock'] = {'known_folder_id': DOCUMENTS_FOLDER, 'offset': 0}
+    if rng.random() < 0.1:
+        blocks['SpecialFolderDataBlock'] = {'special_folder_id': 5, 'offset': 0}
+    if rng.random() < 0.05:
+        blocks['ShimDataBlock'] = {'layer_name': u'WinXPSp3'}
+    if rng.random() < 0.2 and 'link_target_id_list' in info:
+        blocks['VistaAndAboveIDListDataBlock'] = {'item_ids': [root_item(MY_COMPUTER), volume_item(drive)]}
+    blocks['blocks'] = sorted(blocks)
+    info['ExtraData'] = blocks
+    return info
+
+
+def generate_corpus(out_dir, count=1000, seed=0):
+    # same seed and python version, same bytes, so runs of different revisions parse the same corpus
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        path = os.path.join(out_dir, '%06d.lnk' % i)
+        with io.open(path, mode='wb') as f:
+            f.write(encode_link(ShellLinkRecord.from_info(random_info(rng))))
+        paths.append(path)
+    return paths
+
+
+def peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # bytes on macos, KiB elsewhere
+
+
+def time_pass(paths, parse_one, repeat):
+    # best of `repeat` passes over the whole corpus
+    best = None
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        for path in paths:
+            parse_one(path)
+        elapsed = timeit.default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def section_costs(paths, repeat):
+    # seconds per section over the corpus, measured by the parser's own instrumentation hooks
+    stats = ParseStats()
+    for _ in range(repeat):
+        for path in paths:
+            link = ShellLink(path, lazy=True, stats=stats)
+            for section in SECTIONS:
+                link.load_section(section)
+            link.close()
+    return dict((section, totals.seconds / repeat) for section, totals in stats.sections.items())
+
+
+def read_file(path):
+    with io.open(path, mode='rb') as f:
+        return f.read()
+
+
+def run_benchmarks(paths, repeat=3):
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    modes = [
+        ('full_parse', lambda path: ShellLink(path)),
+        ('full_parse_zero_copy', lambda path: ShellLink(path, zero_copy=True).close()),
+        ('header_only', lambda path: ShellLink(path, lazy=True).header),
+        ('link_info_only', lambda path: ShellLink(path, lazy=True).link_info),
+        ('validate_only', lambda path: validate_bytes(read_file(path))),
+    ]
+    results = {'files': len(paths), 'bytes': total_bytes, 'modes': {}}
+    for mode, parse_one in modes:
+        elapsed = time_pass(paths, parse_one, repeat)
+        results['modes'][mode] = {
+            'seconds': elapsed,
+            'files_per_sec': len(paths) / elapsed,
+            'bytes_per_sec': total_bytes / elapsed,
+        }
+    results['section_seconds'] = section_costs(paths, repeat)
+    results['peak_rss_bytes'] = peak_rss()
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.STDOUT,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_runs(output_path):
+    if not os.path.exists(output_path):
+        return []
+    with io.open(output_path, mode='r', encoding='utf8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def print_run(run, previous=None):
+    print('%s  python %s  %d files, %d bytes' % (run['revision'], run['python'], run['files'], run['bytes']))
+    for mode, stats in sorted(run['modes'].items()):
+        line = '  %-22s %10.0f files/s %12.0f bytes/s' % (mode, stats['files_per_sec'], stats['bytes_per_sec'])
+        if previous and mode in previous['modes']:
+            line += '  %+6.1f%%' % (100.0 * stats['files_per_sec'] / previous['modes'][mode]['files_per_sec'] - 100)
+        print(line)
+    for section in SECTIONS:
+        print('  %-22s %10.1f us/file' % (section, 1e6 * run['section_seconds'][section] / run['files']))
+    if run['peak_rss_bytes'] is not None:
+        print('  peak RSS %.1f MiB' % (run['peak_rss_bytes'] / 1048576.0))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmark ShellLink parsing on a synthetic corpus')
+    parser.add_argument('--count', type=int, default=2000, help='shortcuts to generate')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='passes per mode, the best one counts')
+    parser.add_argument('--corpus', default=None, help='generate into (and keep) this directory')
+    parser.add_argument('--output', default='bench_output.txt', help='results are appended here as JSON lines')
+    parser.add_argument('--compare', action='store_true', help='show the change against the previous run')
+    args = parser.parse_args(argv)
+
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix='lnk_bench_')
+    try:
+        if not os.path.isdir(corpus_dir):
+            os.makedirs(corpus_dir)
+        paths = generate_corpus(corpus_dir, args.count, args.seed)
+        run = run_benchmarks(paths, args.repeat)
+    finally:
+        if args.corpus is None:
+            shutil.rmtree(corpus_dir)
+
+    run.update({
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'seed': args.seed,
+        'timestamp': datetime.datetime.utcnow().isoformat(),
+    })
+    previous_runs = load_runs(args.output)
+    with io.open(args.output, mode='ab') as f:
+        f.write((json.dumps(run, sort_keys=True) + '\n').encode('utf8'))
+    print_run(run, previous_runs[-1] if args.compare and previous_runs else None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+import collections
+import hashlib
+import io
+import json
+import os
+import pickle
+import sqlite3
+import time
+
+from lnk_scan import ALL_SECTIONS
+from lnk_scan import ScanResult
+from lnk_scan import find_lnk_files
+from lnk_scan import parse_path
+from lnk_scan import scan
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS parsed (
+    path      TEXT NOT NULL,
+    options   TEXT NOT NULL,
+    size      INTEGER NOT NULL,
+    mtime     REAL NOT NULL,
+    digest    TEXT,
+    info      BLOB,
+    error     TEXT,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (path, options)
+)
+'''
+
+
+def parse_options(sections, timestamps, strict):
+    # everything that changes what a parse returns, as part of the cache key
+    return json.dumps([sorted(set(sections or ALL_SECTIONS)), timestamps, strict])
+
+
+def file_digest(path):
+    digest = hashlib.sha1()
+    with io.open(path, mode='rb') as f:
+        for chunk in iter(lambda: f.read(0x10000), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ParseCache(object):
+    """
+    on-disk (sqlite) cache of parse results, keyed by path and parse options and validated against (size, mtime)
+    and optionally a sha1 of the content, with a bounded in-memory LRU in front of it
+    """
+
+    def __init__(self, db_path, memory_entries=1024, verify_digest=False, max_entries=None, max_bytes=None,
+                 sections=None, timestamps='local', strict=False):
+        self.db = sqlite3.connect(db_path)
+        self.db.execute(SCHEMA)
+        self.lru = collections.OrderedDict()
+        self.memory_entries = memory_entries
+        self.verify_digest = verify_digest
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sections = sections
+        self.timestamps = timestamps
+        self.strict = strict
+        # results parsed with other options (by another ParseCache on the same database) are never returned
+        self.options = parse_options(sections, timestamps, strict)
+        self.touched = set()
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def remember(self, path, entry):
+        self.lru.pop(path, None)
+        self.lru[path] = entry
+        while len(self.lru) > self.memory_entries:
+            self.lru.popitem(last=False)
+
+    def lookup(self, path, size, mtime):
+        # returns a ScanResult if there is a fresh entry for this path, else None
+        entry = self.lru.get(path)
+        if entry is None:
+            row = self.db.execute('SELECT size, mtime, digest, info, error FROM parsed '
+                                  'WHERE path = ? AND options = ?', (path, self.options)).fetchone()
+            if row is None:
+                return None
+            info = pickle.loads(bytes(row[3])) if row[3] is not None else None
+            entry = (row[0], row[1], row[2], info, row[4])
+
+        if entry[:2] != (size, mtime):
+            return None
+        if self.verify_digest and entry[2] != file_digest(path):
+            return None
+
+        self.remember(path, entry)
+        self.touched.add(path)
+        return ScanResult(path, entry[3], entry[4])
+
+    def store(self, result, size, mtime):
+        digest = file_digest(result.path) if self.verify_digest else None
+        info_blob = sqlite3.Binary(pickle.dumps(result.info, 2)) if result.info is not None else None
+        self.db.execute('INSERT OR REPLACE INTO parsed VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        (result.path, self.options, size, mtime, digest, info_blob, result.error, time.time()))
+        self.remember(result.path, (size, mtime, digest, result.info, result.error))
+
+    def get(self, path):
+        stat = os.stat(path)
+        result = self.lookup(path, stat.st_size, stat.st_mtime)
+        if result is not None:
+            self.hits += 1
+            return result
+
+        self.misses += 1
+        result = parse_path(path, self.sections, timestamps=self.timestamps, strict=self.strict)
+        self.store(result, stat.st_size, stat.st_mtime)
+        return result
+
+    def scan(self, roots, processes=None, chunk_size=64):
+        """
+        like lnk_scan.scan, but only files that changed since they were cached get re-parsed
+        cached results are yielded first, then fresh parses as they complete
+        a file that disappears before it can be looked at is yielded as an error and never cached;
+        what was stored is committed even if the caller stops early
+        """
+        if isinstance(roots, (str, bytes, type(u''))):
+            roots = [roots]
+
+        try:
+            stale = {}
+            for root in roots:
+                for path in find_lnk_files(root):
+                    try:
+                        stat = os.stat(path)
+                    except OSError as e:
+                        yield ScanResult(path, None, '%s: %s' % (type(e).__name__, e))
+                        continue
+                    result = self.lookup(path, stat.st_size, stat.st_mtime)
+                    if result is not None:
+                        self.hits += 1
+                        yield result
+                    else:
+                        stale[path] = (stat.st_size, stat.st_mtime)
+
+            self.misses += len(stale)
+            for result in scan(sorted(stale), processes=processes, chunk_size=chunk_size, sections=self.sections,
+                               timestamps=self.timestamps, strict=self.strict):
+                self.store(result, *stale[result.path])
+                yield result
+        finally:
+            self.commit()
+
+    def invalidate(self, path=None):
+        # drop one path, or everything if no path is given
+        if path is None:
+            self.lru.clear()
+            self.db.execute('DELETE FROM parsed')
+        else:
+            self.lru.pop(path, None)
+            self.db.execute('DELETE FROM parsed WHERE path = ?', (path,))
+
+    def evict(self, max_entries=None, max_bytes=None):
+        # drop least recently used entries until the store is within the given limits
+        if max_entries is not None:
+            self.db.execute('DELETE FROM parsed WHERE rowid IN '
+                            '(SELECT rowid FROM parsed ORDER BY last_used DESC LIMIT -1 OFFSET ?)', (max_entries,))
+        if max_bytes is not None:
+            total = 0
+            rows = self.db.execute('SELECT path, options, IFNULL(LENGTH(info), 0) FROM parsed '
+                                   'ORDER BY last_used DESC')
+            doomed = []
+            for path, options, info_size in rows:
+                total += info_size
+                if total > max_bytes:
+                    doomed.append((path, options))
+            self.db.executemany('DELETE FROM parsed WHERE path = ? AND options = ?', doomed)
+        for path in list(self.lru):
+            if not self.db.execute('SELECT 1 FROM parsed WHERE path = ? AND options = ?',
+                                   (path, self.options)).fetchone():
+                del self.lru[path]
+
+    def commit(self):
+        now = time.time()
+        self.db.executemany('UPDATE parsed SET last_used = ? WHERE path = ? AND options = ?',
+                            ((now, path, self.options) for path in self.touched))
+        self.touched.clear()
+        if self.max_entries is not None or self.max_bytes is not None:
+            self.evict(self.max_entries, self.max_bytes)
+        self.db.commit()
+
+    def close(self):
+        self.commit()
+        self.db.close()
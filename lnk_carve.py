@@ -0,0 +1,93 @@
+import collections
+import functools
+import io
+import mmap
+import os
+import struct
+
+from lnk_scan import imap_paths
+from lnk_tool import ShellLink
+from lnk_validate import Validator
+from shell_link_const import *
+
+# carve shortcuts out of raw images (unallocated space, pagefiles, memory dumps)
+# the 0x4c HeaderSize followed by the CLSID is searched for with mmap.find, so the per-byte work happens in C;
+# python only ever sees the candidates, which go through the structural validator before any real parsing
+
+CarveResult = collections.namedtuple('CarveResult', ['offset', 'size', 'info', 'error'])
+
+SIGNATURE = struct.pack('<I', HEADER_SIZE) + CLSID
+
+
+def iter_chunks(image_path, chunk_size):
+    image_size = os.path.getsize(image_path)
+    for start in range(0, image_size, chunk_size):
+        yield image_path, start, min(start + chunk_size, image_size)
+
+
+def carve_candidate(image, offset, max_link_size, parse, sections, timestamps):
+    # returns a CarveResult, or None if the bytes at offset aren't a well-formed shortcut
+    window = image[offset:min(offset + max_link_size, len(image))]
+    validator = Validator(window, fail_fast=True)
+    if validator.validate() or validator.end is None:
+        return None
+
+    if not parse:
+        return CarveResult(offset, validator.end, None, None)
+    try:
+        link = ShellLink.from_bytes(window[:validator.end], lazy=True, timestamps=timestamps)
+        for section in sections or [section for section, _ in ShellLink.SECTION_PARSERS]:
+            link.load_section(section)
+        return CarveResult(offset, validator.end, link.info, None)
+    except Exception as e:
+        return CarveResult(offset, validator.end, None, '%s: %s' % (type(e).__name__, e))
+
+
+def carve_chunk(chunk, max_link_size=0x10000, parse=True, sections=None, timestamps='raw'):
+    # every signature that *starts* in [start, end); the search runs past end just far enough to see a
+    # signature straddling the boundary, which the next chunk will not report again
+    image_path, start, end = chunk
+    results = []
+    with io.open(image_path, mode='rb') as f:
+        image = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            search_end = min(end + len(SIGNATURE) - 1, len(image))
+            offset = image.find(SIGNATURE, start, search_end)
+            while offset >= 0:
+                result = carve_candidate(image, offset, max_link_size, parse, sections, timestamps)
+                if result is not None:
+                    results.append(result)
+                offset = image.find(SIGNATURE, offset + 1, search_end)
+        finally:
+            image.close()
+    return results
+
+
+def carve(image_path, processes=None, chunk_size=64 << 20, max_link_size=0x10000, parse=True, sections=None,
+          timestamps='raw'):
+    """
+    find every well-formed shortcut in a raw image, scanning chunks of it in parallel
+    yields CarveResult(offset, size, info, error), in offset order within a chunk but chunks in completion order
+
+    :param max_link_size: how far past a signature a shortcut may extend
+    :param parse: decode carved shortcuts, or only report where they are and how big
+    :param sections: only decode these sections (see ShellLink.SECTION_PARSERS)
+    :param timestamps: see lnk_scan.scan
+    """
+    worker = functools.partial(carve_chunk, max_link_size=max_link_size, parse=parse, sections=sections,
+                               timestamps=timestamps)
+    for results in imap_paths(worker, iter_chunks(image_path, chunk_size), processes, chunk_size=1):
+        for result in results:
+            yield result
+
+
+def extract(image_path, out_dir, **kwargs):
+    # write every carved shortcut to out_dir as <offset>.lnk, returns the CarveResults
+    results = []
+    with io.open(image_path, mode='rb') as f:
+        for result in carve(image_path, **kwargs):
+            f.seek(result.offset)
+            with io.open(os.path.join(out_dir, '%012X.lnk' % result.offset), mode='wb') as out:
+                out.write(f.read(result.size))
+            results.append(result)
+    return results
@@ -0,0 +1,152 @@
+import argparse
+import collections
+import csv
+import datetime
+import errno
+import json
+import os
+import sys
+
+from lnk_scan import scan
+from lnk_tool import flag_dict_to_int
+from lnk_tool import link_info_target_path
+from shell_link_const import *
+
+# stable output schema, one flat record per shortcut
+COLUMNS = [
+    'path',
+    'error',
+    'link_flags',
+    'file_attrs',
+    'create_time',
+    'access_time',
+    'write_time',
+    'file_size',
+    'icon_index',
+    'show_command',
+    'hotkey',
+    'drive_type',
+    'drive_serial_number',
+    'volume_label',
+    'local_base_path',
+    'net_name',
+    'device_name',
+    'common_path_suffix',
+    'target_path',
+    'name_string',
+    'relative_path',
+    'working_dir',
+    'command_line_arguments',
+    'icon_location',
+]
+
+# everything the columns are built from, so the rest of the file is never decoded
+EXPORT_SECTIONS = ['ShellLinkHeader', 'link_info', 'StringData']
+
+PY2 = bytes is str
+
+
+def format_value(value, codepage):
+    if isinstance(value, bytes):
+        return value.decode(codepage, 'replace')  # non-unicode strings are in the system default code page
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, list):
+        return '+'.join(value)
+    return value
+
+
+def flatten(path, info, error, codepage='cp1252'):
+    record = dict.fromkeys(COLUMNS)
+    record['error'] = error
+
+    header = (info or {}).get('ShellLinkHeader') or {}
+    if 'LinkFlags' in header:
+        record['link_flags'] = flag_dict_to_int(header['LinkFlags'], LINK_FLAGS_NAMES)
+    if 'file_attrs' in header:
+        record['file_attrs'] = flag_dict_to_int(header['file_attrs'], FILE_ATTRS_FLAGS_NAMES)
+    for field_name in ['create_time', 'access_time', 'write_time', 'file_size', 'icon_index', 'show_command',
+                       'hotkey']:
+        record[field_name] = header.get(field_name)
+
+    link_info = (info or {}).get('link_info') or {}
+    for field_name in ['drive_type', 'drive_serial_number', 'volume_label']:
+        record[field_name] = link_info.get(field_name)
+    for field_name in ['local_base_path', 'net_name', 'device_name', 'common_path_suffix']:
+        record[field_name] = link_info.get(field_name + '_unicode', link_info.get(field_name))
+    record['target_path'] = link_info_target_path(link_info, codepage)
+
+    string_data = (info or {}).get('StringData') or {}
+    for _, field_name in STRING_DATA_FIELDS:
+        record[field_name] = string_data.get(field_name)
+
+    out = collections.OrderedDict((column, format_value(record[column], codepage)) for column in COLUMNS)
+    out['path'] = path.decode(sys.getfilesystemencoding(), 'replace') if isinstance(path, bytes) else path
+    return out
+
+
+def iter_records(roots, processes=None, chunk_size=64, codepage='cp1252'):
+    for result in scan(roots, processes=processes, chunk_size=chunk_size, sections=EXPORT_SECTIONS,
+                       timestamps='local'):
+        yield flatten(result.path, result.info, result.error, codepage)
+
+
+def write_ndjson(records, out):
+    for record in records:
+        out.write(json.dumps(record) + '\n')
+        out.flush()
+
+
+def write_csv(records, out):
+    writer = csv.writer(out)
+    writer.writerow(COLUMNS)
+    for record in records:
+        row = []
+        for value in record.values():
+            if value is None:
+                value = ''
+            elif PY2 and isinstance(value, type(u'')):
+                value = value.encode('utf8')  # python 2 csv only writes byte strings
+            row.append(value)
+        writer.writerow(row)
+        out.flush()
+
+
+def iter_roots(paths):
+    for path in paths:
+        if path == '-':
+            for line in sys.stdin:
+                line = line.rstrip('\r\n')
+                if line:
+                    yield line
+        else:
+            yield path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='stream one flat record per .lnk file as NDJSON or CSV')
+    parser.add_argument('paths', nargs='+', help='.lnk files or directories to search, "-" reads paths from stdin')
+    parser.add_argument('-f', '--format', choices=['ndjson', 'csv'], default='ndjson')
+    parser.add_argument('-j', '--processes', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--chunk-size', type=int, default=64)
+    parser.add_argument('--codepage', default='cp1252', help='code page of non-unicode strings')
+    args = parser.parse_args(argv)
+
+    records = iter_records(iter_roots(args.paths), args.processes, args.chunk_size, args.codepage)
+    try:
+        if args.format == 'csv':
+            write_csv(records, sys.stdout)
+        else:
+            write_ndjson(records, sys.stdout)
+    except IOError as e:
+        # the reader went away (e.g. `| head`): stop the scan quietly, and point stdout at devnull so the
+        # interpreter's final flush doesn't complain about the pipe again
+        if e.errno != errno.EPIPE:
+            raise
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    finally:
+        records.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+import bisect
+import io
+import pickle
+
+from lnk_scan import scan
+
+# inverted index over the target fields of parsed shortcuts: field -> value -> ids of the links that have it
+# exact lookups are a dict hit, prefix lookups a bisect into the sorted values, both with or without case folding
+
+INDEX_VERSION = 2
+
+# field -> (section, keys to try in order), unicode variants first
+INDEX_FIELDS = {
+    'local_base_path': ('link_info', ['local_base_path_unicode', 'local_base_path']),
+    'net_name': ('link_info', ['net_name_unicode', 'net_name']),
+    'device_name': ('link_info', ['device_name_unicode', 'device_name']),
+    'drive_serial_number': ('link_info', ['drive_serial_number']),
+    'volume_label': ('link_info', ['volume_label']),
+    'common_path_suffix': ('link_info', ['common_path_suffix_unicode', 'common_path_suffix']),
+    'relative_path': ('StringData', ['relative_path']),
+    'working_dir': ('StringData', ['working_dir']),
+}
+
+# fields whose values aren't strings, so they have exact lookups only
+NUMERIC_FIELDS = frozenset(['drive_serial_number'])
+
+
+def fold(value):
+    return value.lower() if hasattr(value, 'lower') else value
+
+
+class LinkIndex(object):
+    """
+    index of link_info and StringData fields across a corpus, see INDEX_FIELDS
+    non-unicode strings are decoded with the given code page so every string key is text
+    a path can be re-added (replacing what was indexed for it) or removed, see apply_changes
+    """
+
+    def __init__(self, codepage='cp1252'):
+        self.codepage = codepage
+        self.paths = []  # link id -> path, None once removed
+        self.link_values = []  # link id -> {field: value} as indexed, so a link can be taken out again
+        self.ids = {}  # path -> link id
+        self.exact = dict((field, {}) for field in INDEX_FIELDS)
+        self.folded = dict((field, {}) for field in INDEX_FIELDS)
+        self.sorted_keys = {}  # (field, case_sensitive) -> sorted values, rebuilt after changes
+
+    def __len__(self):
+        return len(self.ids)
+
+    def field_value(self, info, field):
+        section, keys = INDEX_FIELDS[field]
+        parsed_data = info.get(section) or {}
+        for key in keys:
+            value = parsed_data.get(key)
+            if value is not None:
+                if isinstance(value, bytes):
+                    value = value.decode(self.codepage, 'replace')
+                return value
+        return None
+
+    def add(self, path, info):
+        # indexing a path again replaces its old values
+        self.remove(path)
+        link_id = len(self.paths)
+        self.paths.append(path)
+        self.ids[path] = link_id
+        values = {}
+        for field in INDEX_FIELDS:
+            value = self.field_value(info, field)
+            if value is not None:
+                values[field] = value
+                self.exact[field].setdefault(value, []).append(link_id)
+                self.folded[field].setdefault(fold(value), []).append(link_id)
+        self.link_values.append(values)
+        self.sorted_keys.clear()
+
+    def remove(self, path):
+        # returns whether the path was indexed
+        link_id = self.ids.pop(path, None)
+        if link_id is None:
+            return False
+        for field, value in self.link_values[link_id].items():
+            for table, key in ((self.exact[field], value), (self.folded[field], fold(value))):
+                table[key].remove(link_id)
+                if not table[key]:
+                    del table[key]
+        self.paths[link_id] = None
+        self.link_values[link_id] = None
+        self.sorted_keys.clear()
+        return True
+
+    def add_results(self, results):
+        # ScanResults (from lnk_scan.scan or lnk_cache.ParseCache.scan), failed parses are skipped
+        for result in results:
+            if result.info is not None:
+                self.add(result.path, result.info)
+        return self
+
+    def apply_changes(self, events):
+        # lnk_watch ChangeEvents: added/modified links are (re-)indexed, deleted ones and ones that no longer
+        # parse are taken out
+        for event in events:
+            if event.result is not None and event.result.info is not None:
+                self.add(event.path, event.result.info)
+            else:
+                self.remove(event.path)
+        return self
+
+    @classmethod
+    def build(cls, roots, processes=None, chunk_size=64, codepage='cp1252'):
+        sections = sorted(set(section for section, _ in INDEX_FIELDS.values()))
+        return cls(codepage).add_results(scan(roots, processes, chunk_size, ['ShellLinkHeader'] + sections))
+
+    def table(self, field, case_sensitive):
+        if field not in INDEX_FIELDS:
+            raise KeyError('%r is not an indexed field' % field)
+        return self.exact[field] if case_sensitive else self.folded[field]
+
+    def ids_to_paths(self, link_ids):
+        return [self.paths[link_id] for link_id in sorted(set(link_ids))]
+
+    def lookup(self, field, value, case_sensitive=True):
+        table = self.table(field, case_sensitive)
+        return self.ids_to_paths(table.get(value if case_sensitive else fold(value), ()))
+
+    def prefix(self, field, prefix, case_sensitive=True):
+        # plain string prefix, so 'C:\\Users' also matches 'C:\\UsersOld'; end with a separator to avoid that
+        if field in NUMERIC_FIELDS:
+            raise ValueError('%r is not a string field, it only has exact lookups' % field)
+        table = self.table(field, case_sensitive)
+        if not case_sensitive:
+            prefix = fold(prefix)
+        keys = self.sorted_keys.get((field, case_sensitive))
+        if keys is None:
+            keys = self.sorted_keys[(field, case_sensitive)] = sorted(table)
+
+        link_ids = []
+        for key in keys[bisect.bisect_left(keys, prefix):]:
+            if not key.startswith(prefix):
+                break
+            link_ids.extend(table[key])
+        return self.ids_to_paths(link_ids)
+
+    def values(self, field):
+        # distinct values of a field and how many links have each
+        return dict((value, len(link_ids)) for value, link_ids in self.exact[field].items())
+
+    def save(self, index_path):
+        state = {
+            'version': INDEX_VERSION,
+            'codepage': self.codepage,
+            'paths': self.paths,
+            'link_values': self.link_values,
+            'exact': self.exact,
+            'folded': self.folded,
+        }
+        with io.open(index_path, mode='wb') as f:
+            pickle.dump(state, f, 2)
+
+    @classmethod
+    def load(cls, index_path):
+        with io.open(index_path, mode='rb') as f:
+            state = pickle.load(f)
+        if state.get('version') != INDEX_VERSION:
+            raise ValueError('unsupported index version %r' % state.get('version'))
+        index = cls(state['codepage'])
+        index.paths = state['paths']
+        index.link_values = state['link_values']
+        index.ids = dict((path, link_id) for link_id, path in enumerate(index.paths) if path is not None)
+        index.exact = state['exact']
+        index.folded = state['folded']
+        return index
@@ -0,0 +1,315 @@
+import collections
+import functools
+import os
+import struct
+
+from lnk_carve import SIGNATURE
+from lnk_scan import find_lnk_files
+from lnk_scan import imap_paths
+from lnk_scan import parse_buffer
+from lnk_tool import MappedFile
+from lnk_tool import ParseError
+from lnk_tool import TIMESTAMP_MODES
+from lnk_tool import decode_fixed_ascii
+from lnk_tool import format_guid
+from lnk_tool import to_bytes
+from lnk_validate import Validator
+
+# windows jump lists, with every embedded shortcut parsed straight out of the container:
+# *.customDestinations-ms files are shortcuts back to back (between small category headers), so they are
+# found by signature and delimited by the structural validator, like lnk_carve does for raw images;
+# *.automaticDestinations-ms files are OLE compound files (MS-CFB) holding one shortcut stream per entry,
+# named by its entry number in hex, and a DestList stream with the MRU record of every entry
+
+JumpListEntry = collections.namedtuple('JumpListEntry', ['path', 'entry', 'dest_list', 'info', 'error'])
+
+DestListEntry = collections.namedtuple('DestListEntry', [
+    'entry_number', 'path', 'hostname', 'last_access', 'pin_status', 'access_count',
+    'volume_droid', 'file_droid', 'birth_volume_droid', 'birth_file_droid', 'checksum',
+])
+
+JUMP_LIST_EXTENSIONS = ('.automaticdestinations-ms', '.customdestinations-ms')
+
+CFB_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+CFB_HEADER = struct.Struct('<8s16sHHHHH6sIIIIIIIII')
+CFB_DIRECTORY_ENTRY = struct.Struct('<64sHBBIII16sIQQIQ')
+CFB_HEADER_DIFAT = 109  # FAT sector numbers kept in the header itself
+
+END_OF_CHAIN = 0xFFFFFFFE
+NO_STREAM = 0xFFFFFFFF
+STREAM_OBJECT = 2
+ROOT_STORAGE_OBJECT = 5
+
+CFBEntry = collections.namedtuple('CFBEntry', ['name', 'object_type', 'start_sector', 'size'])
+
+# DestList layouts, as documented by the libyal and SANS jump list write-ups:
+# version 1 (windows 7/8) and 3+ (windows 10) share the first 0x6c bytes and differ in what precedes the path,
+# which starts at 0x72 in version 1 entries and at 0x7e in version 3+ ones (130 bytes with the trailer)
+DEST_LIST_HEADER = struct.Struct('<IIIfQQ')  # version, entries, pinned entries, ?, last entry number, revision
+DEST_LIST_ENTRY = struct.Struct('<Q16s16s16s16s16sI4sQi')  # checksum, 4 droids, hostname, entry number, ?, time, pin
+DEST_LIST_TAIL_V1 = struct.Struct('<4sH')  # ?, path length
+DEST_LIST_TAIL_V3 = struct.Struct('<4sI8sH')  # ?, access count, ?, path length (a 4 byte trailer follows the path)
+
+
+class CompoundFile(object):
+    """
+    read-only view of an OLE compound file in a buffer (bytes, or a memoryview of a mapped file), just enough to
+    pull streams out of jump lists; streams are sliced out of the buffer, so only ones spread over
+    non-adjacent sectors are copied
+    every sector chain is bounded by the size of its allocation table, so a corrupt file raises ParseError
+    instead of looping
+    """
+
+    def __init__(self, data):
+        self.data = data
+        if len(data) < CFB_HEADER.size + 4 * CFB_HEADER_DIFAT:
+            raise ParseError('too small for a compound file header', 0, 'cfb_header')
+        (signature, _, _, major_version, byte_order, sector_shift, mini_sector_shift, _, _, num_fat_sectors,
+         first_dir_sector, _, self.mini_stream_cutoff, first_mini_fat_sector, num_mini_fat_sectors,
+         first_difat_sector, num_difat_sectors) = CFB_HEADER.unpack_from(data, 0)
+        if signature != CFB_SIGNATURE or byte_order != 0xFFFE:
+            raise ParseError('not a compound file', 0, 'cfb_header')
+        if sector_shift not in (9, 12) or mini_sector_shift != 6:
+            raise ParseError('unsupported sector size', 0x1e, 'cfb_header')
+        self.major_version = major_version
+        self.sector_size = 1 << sector_shift
+        self.mini_sector_size = 1 << mini_sector_shift
+        self.sector_count = (len(data) + self.sector_size - 1) // self.sector_size - 1
+
+        fat_sectors = self.difat(num_fat_sectors, first_difat_sector, num_difat_sectors)
+        self.fat = self.u32_array(self.read_sectors(fat_sectors))
+        self.entries = self.read_directory(first_dir_sector)
+
+        self.mini_fat = self.u32_array(self.read_chain(first_mini_fat_sector, self.fat)) \
+            if num_mini_fat_sectors else ()
+        self.mini_stream_sectors = None  # the root entry's chain, found the first time a small stream is asked for
+
+    @staticmethod
+    def u32_array(data):
+        return struct.unpack('<%dI' % (len(data) // 4), data[:len(data) // 4 * 4])
+
+    def difat(self, num_fat_sectors, first_difat_sector, num_difat_sectors):
+        # the FAT's own sector numbers: 109 in the header, the rest in a chain of DIFAT sectors
+        fat_sectors = list(self.u32_array(self.data[CFB_HEADER.size:CFB_HEADER.size + 4 * CFB_HEADER_DIFAT]))
+        sector = first_difat_sector
+        for _ in range(min(num_difat_sectors, self.sector_count)):
+            if sector >= self.sector_count:
+                break
+            entries = self.u32_array(self.read_sectors([sector]))
+            fat_sectors.extend(entries[:-1])
+            sector = entries[-1]
+        if num_fat_sectors > len(fat_sectors):
+            raise ParseError('DIFAT lists %d of %d FAT sectors' % (len(fat_sectors), num_fat_sectors), None,
+                             'cfb_difat')
+        return fat_sectors[:num_fat_sectors]
+
+    def sector_offset(self, sector):
+        if sector >= self.sector_count:
+            raise ParseError('sector %d is outside the file' % sector, None, 'cfb_chain')
+        return (sector + 1) * self.sector_size
+
+    def read_sectors(self, sectors):
+        # runs of adjacent sectors are sliced in one go, a chain that is one run isn't copied at all
+        runs = []
+        for offset in map(self.sector_offset, sectors):
+            if runs and runs[-1][1] == offset:
+                runs[-1][1] = offset + self.sector_size
+            else:
+                runs.append([offset, offset + self.sector_size])
+        if len(runs) == 1:
+            return self.data[runs[0][0]:runs[0][1]]
+        return b''.join(self.data[start:end] for start, end in runs)
+
+    @staticmethod
+    def chain(start, table):
+        # a chain can't be longer than its table, anything longer has a cycle in it
+        sectors = []
+        sector = start
+        while sector != END_OF_CHAIN:
+            if sector >= len(table) or len(sectors) >= len(table):
+                raise ParseError('broken sector chain at sector %d' % sector, None, 'cfb_chain')
+            sectors.append(sector)
+            sector = table[sector]
+        return sectors
+
+    def read_chain(self, start, table):
+        return self.read_sectors(self.chain(start, table))
+
+    def read_directory(self, first_dir_sector):
+        data = self.read_chain(first_dir_sector, self.fat)
+        entries = []
+        for pos in range(0, len(data) - CFB_DIRECTORY_ENTRY.size + 1, CFB_DIRECTORY_ENTRY.size):
+            (name_bytes, name_size, object_type, _, _, _, _, _, _, _, _, start_sector,
+             size) = CFB_DIRECTORY_ENTRY.unpack_from(data, pos)
+            if self.major_version == 3:
+                size &= 0xFFFFFFFF  # the high half is undefined in version 3 files
+            name = name_bytes[:max(min(name_size, 64) - 2, 0)].decode('utf-16-le', 'replace')
+            entries.append(CFBEntry(name, object_type, start_sector, size))
+        if not entries or entries[0].object_type != ROOT_STORAGE_OBJECT:
+            raise ParseError('no root entry in the directory', None, 'cfb_directory')
+        return entries
+
+    def streams(self):
+        return collections.OrderedDict((entry.name, entry) for entry in self.entries
+                                       if entry.object_type == STREAM_OBJECT)
+
+    def mini_sector_offset(self, mini_sector):
+        # mini sectors never straddle sectors, so each one maps to a single range of the file
+        start = mini_sector * self.mini_sector_size
+        if start + self.mini_sector_size > self.entries[0].size:
+            raise ParseError('mini sector %d is outside the mini stream' % mini_sector, None, 'cfb_chain')
+        index, within = divmod(start, self.sector_size)
+        if index >= len(self.mini_stream_sectors):
+            raise ParseError('mini sector %d is outside the mini stream' % mini_sector, None, 'cfb_chain')
+        return self.sector_offset(self.mini_stream_sectors[index]) + within
+
+    def read_stream(self, entry):
+        if entry.size < self.mini_stream_cutoff:
+            if self.mini_stream_sectors is None:
+                self.mini_stream_sectors = self.chain(self.entries[0].start_sector, self.fat)
+            size = self.mini_sector_size
+            data = b''.join(self.data[offset:offset + size] for offset in
+                            map(self.mini_sector_offset, self.chain(entry.start_sector, self.mini_fat)))
+        else:
+            data = self.read_chain(entry.start_sector, self.fat)
+        if len(data) < entry.size:
+            raise ParseError('stream %r is truncated' % entry.name, None, 'cfb_chain')
+        return data[:entry.size]
+
+
+def parse_dest_list(data, timestamps='raw'):
+    """
+    DestListEntries of an automaticDestinations-ms DestList stream, keyed by entry number
+    stops quietly at the first record that doesn't fit, so a damaged DestList still pairs what it can
+    """
+    if len(data) < DEST_LIST_HEADER.size:
+        return {}
+    convert_time = TIMESTAMP_MODES[timestamps]
+    version, num_entries = DEST_LIST_HEADER.unpack_from(data, 0)[:2]
+    tail = DEST_LIST_TAIL_V1 if version < 3 else DEST_LIST_TAIL_V3
+    trailer_size = 0 if version < 3 else 4
+
+    records = {}
+    pos = DEST_LIST_HEADER.size
+    for _ in range(num_entries):
+        path_pos = pos + DEST_LIST_ENTRY.size + tail.size
+        if path_pos > len(data):
+            break
+        (checksum, volume_droid, file_droid, birth_volume_droid, birth_file_droid, hostname, entry_number, _,
+         last_access, pin_status) = DEST_LIST_ENTRY.unpack_from(data, pos)
+        tail_values = tail.unpack_from(data, pos + DEST_LIST_ENTRY.size)
+        access_count = tail_values[1] if version >= 3 else None
+        path_end = path_pos + 2 * tail_values[-1]
+        if path_end + trailer_size > len(data):
+            break
+        try:
+            last_access = convert_time(last_access)
+        except (ValueError, OverflowError, OSError):
+            last_access = None
+        path = to_bytes(data[path_pos:path_end]).decode('utf-16-le', 'replace')
+        records[entry_number] = DestListEntry(
+            entry_number, path, decode_fixed_ascii(hostname), last_access, None if pin_status < 0 else pin_status,
+            access_count,
+            format_guid(volume_droid), format_guid(file_droid), format_guid(birth_volume_droid),
+            format_guid(birth_file_droid), checksum)
+        pos = path_end + trailer_size
+    return records
+
+
+def iter_automatic(data, path, sections, timestamps, strict):
+    cfb = CompoundFile(data)
+    streams = cfb.streams()
+    dest_list = {}
+    if 'DestList' in streams:
+        try:
+            dest_list = parse_dest_list(cfb.read_stream(streams.pop('DestList')), timestamps)
+        except ParseError:
+            pass  # the shortcuts are still worth having without their MRU records
+
+    for name, entry in streams.items():
+        try:
+            record = dest_list.get(int(name, 16))
+        except ValueError:
+            record = None
+        try:
+            link_data = cfb.read_stream(entry)
+        except ParseError as e:
+            yield JumpListEntry(path, name, record, None, '%s: %s' % (type(e).__name__, e))
+            continue
+        result = parse_buffer(link_data, sections, path, timestamps, strict)
+        yield JumpListEntry(path, name, record, result.info, result.error)
+
+
+def iter_custom(data, path, sections, timestamps, strict, max_link_size):
+    # shortcuts that don't validate far enough to know where they end are skipped, like in lnk_carve
+    offset = data.find(SIGNATURE)
+    while offset >= 0:
+        validator = Validator(data[offset:offset + max_link_size])
+        validator.validate()
+        if validator.end is None:
+            offset = data.find(SIGNATURE, offset + 1)
+            continue
+        result = parse_buffer(data[offset:offset + validator.end], sections, path, timestamps, strict)
+        yield JumpListEntry(path, offset, None, result.info, result.error)
+        offset = data.find(SIGNATURE, offset + validator.end)
+
+
+def iter_jump_list(path, sections=None, timestamps='raw', strict=False, max_link_size=0x10000):
+    """
+    every shortcut embedded in one jump list, parsed in memory and yielded one at a time
+    as JumpListEntry(path, entry, dest_list, info, error)
+
+    entry is the stream name in an automaticDestinations-ms file and the byte offset in a customDestinations-ms
+    one, dest_list the DestListEntry paired with it (automaticDestinations-ms only, None if it has none)
+    never raises: a container that can't be read yields one entry with only the error set
+
+    :param sections: only decode these sections (see ShellLink.SECTION_PARSERS)
+    :param timestamps: see lnk_scan.scan, also applies to DestList access times
+    :param strict: see ShellLink
+    :param max_link_size: how far a customDestinations-ms shortcut may extend
+    """
+    mapped = None
+    try:
+        if os.path.getsize(path) == 0:
+            return  # can't be mapped, and holds nothing anyway
+        # the container is mapped rather than read, only the sectors that are looked at get paged in
+        mapped = MappedFile(path)
+        if mapped.peek(0, len(CFB_SIGNATURE)) == CFB_SIGNATURE:
+            # python 2 maps don't export memoryviews, their slices are copies
+            data = mapped.data if mapped.data is not None else mapped.source
+            entries = iter_automatic(data, path, sections, timestamps, strict)
+        else:
+            entries = iter_custom(mapped.source, path, sections, timestamps, strict, max_link_size)
+        for entry in entries:
+            yield entry
+    except Exception as e:
+        yield JumpListEntry(path, None, None, None, '%s: %s' % (type(e).__name__, e))
+    finally:
+        if mapped is not None:
+            mapped.close()
+
+
+def read_jump_list(path, **kwargs):
+    return list(iter_jump_list(path, **kwargs))
+
+
+def scan_jump_lists(roots, processes=None, chunk_size=4, sections=None, timestamps='raw', strict=False,
+                    max_pending=None):
+    """
+    iter_jump_list over every *Destinations-ms file under the given roots (e.g. a profile's Recent folder)
+    with processes=1 entries stream straight through, otherwise each worker hands back one file at a time
+    """
+    if isinstance(roots, (str, bytes, type(u''))):
+        roots = [roots]
+    paths = (path for root in roots for path in find_lnk_files(root, JUMP_LIST_EXTENSIONS))
+    kwargs = dict(sections=sections, timestamps=timestamps, strict=strict)
+    if processes == 1:
+        for path in paths:
+            for entry in iter_jump_list(path, **kwargs):
+                yield entry
+        return
+
+    for entries in imap_paths(functools.partial(read_jump_list, **kwargs), paths, processes, chunk_size,
+                              max_pending):
+        for entry in entries:
+            yield entry
@@ -0,0 +1,218 @@
+from lnk_tool import flag_dict_to_int
+from lnk_tool import parse_flag_dict
+from shell_link_const import *
+
+# compact, __slots__-based records for parsed links
+# flags are kept as integer bitmasks and validity checks as two bitsets (checks that ran, checks that failed),
+# with bit positions fixed by each class's VALIDITY_CHECKS, so a bitset means the same in every process
+# fields that the parser never set stay unset, so to_dict() gives back exactly what ShellLink.info had
+
+
+class Record(object):
+    __slots__ = ('checked', 'failed')
+
+    FIELDS = ()
+    FLAG_FIELDS = {}  # field -> flag names, stored as an int and expanded again by to_dict
+    VALIDITY_CHECKS = []  # bit index -> check name, append (never reorder) when the parser grows a new check
+
+    def __getattr__(self, name):
+        # unset fields read as None
+        if name in self.FIELDS:
+            return None
+        raise AttributeError(name)
+
+    @classmethod
+    def check_bit(cls, check_name):
+        if check_name not in cls.VALIDITY_CHECKS:
+            raise ValueError('%r is not one of the %s validity checks' % (check_name, cls.__name__))
+        return 1 << cls.VALIDITY_CHECKS.index(check_name)
+
+    @classmethod
+    def from_dict(cls, parsed_data):
+        record = cls.__new__(cls)
+        record.checked = 0
+        record.failed = 0
+        for key, value in parsed_data.items():
+            if key == 'validity_checks':
+                for check_name, passed in value.items():
+                    bit = cls.check_bit(check_name)
+                    record.checked |= bit
+                    if not passed:
+                        record.failed |= bit
+            elif key in cls.FLAG_FIELDS:
+                setattr(record, key, flag_dict_to_int(value, cls.FLAG_FIELDS[key]))
+            else:
+                setattr(record, key, value)
+        return record
+
+    def replace(self, **changes):
+        # shallow copy with some fields changed, like namedtuple._replace
+        record = self.__class__.__new__(self.__class__)
+        for slot in Record.__slots__ + self.FIELDS:
+            try:
+                setattr(record, slot, object.__getattribute__(self, slot))
+            except AttributeError:
+                pass
+        for field, value in changes.items():
+            setattr(record, field, value)
+        return record
+
+    @property
+    def valid(self):
+        return not self.failed
+
+    def failed_checks(self):
+        return [check_name for i, check_name in enumerate(self.VALIDITY_CHECKS) if self.failed >> i & 1]
+
+    def to_dict(self):
+        out = {}
+        for field in self.FIELDS:
+            try:
+                value = object.__getattribute__(self, field)
+            except AttributeError:
+                continue
+            if field in self.FLAG_FIELDS:
+                value = parse_flag_dict(value, self.FLAG_FIELDS[field])
+            out[field] = value
+        out['validity_checks'] = dict((check_name, not self.failed >> i & 1)
+                                      for i, check_name in enumerate(self.VALIDITY_CHECKS) if self.checked >> i & 1)
+        return out
+
+
+class HeaderRecord(Record):
+    FIELDS = ('LinkFlags', 'file_attrs', 'create_time', 'access_time', 'write_time', 'file_size', 'icon_index',
+              'show_command', 'hotkey')
+    __slots__ = FIELDS
+    FLAG_FIELDS = {
+        'LinkFlags': LINK_FLAGS_NAMES,
+        'file_attrs': FILE_ATTRS_FLAGS_NAMES,
+    }
+    VALIDITY_CHECKS = ['header_size', 'CLSID', 'link_flags_tail', 'file_attrs_flags_tail',
+                       'file_attrs_flags_reserved_1', 'file_attrs_flags_reserved_2', 'normal_file_attrs_are_blank',
+                       'reserved_1', 'reserved_2', 'reserved_3', 'read_0x4c_byte_header', 'sane_hotkey',
+                       'sane_create_time', 'sane_access_time', 'sane_write_time']
+
+
+class IDListRecord(Record):
+    FIELDS = ('id_list_size', 'item_ids')
+    __slots__ = FIELDS
+    VALIDITY_CHECKS = ['read_0x4c_byte_header', 'sane_id_list_size', 'id_list_byte_count_okay', 'terminal_id_zeroes',
+                       'read_complete_id_list', 'sane_item_id_size']
+
+    @classmethod
+    def from_dict(cls, parsed_data):
+        # item_id_1 .. item_id_n become a single tuple
+        parsed_data = dict(parsed_data)
+        item_ids = []
+        while 'item_id_%d' % (len(item_ids) + 1) in parsed_data:
+            item_ids.append(parsed_data.pop('item_id_%d' % (len(item_ids) + 1)))
+        record = super(IDListRecord, cls).from_dict(parsed_data)
+        record.item_ids = tuple(item_ids)
+        return record
+
+    def to_dict(self):
+        out = super(IDListRecord, self).to_dict()
+        for i, item_id in enumerate(out.pop('item_ids', ())):
+            out['item_id_%d' % (i + 1)] = item_id
+        return out
+
+
+class LinkInfoRecord(Record):
+    FIELDS = ('link_info_size', 'link_info_header_size', 'link_info_flags',
+              'volume_id_offset', 'volume_id_offset_abs',
+              'local_base_path_offset', 'local_base_path_offset_abs',
+              'common_net_rel_link_offset', 'common_net_rel_link_offset_abs',
+              'common_path_suffix_offset', 'common_path_suffix_offset_abs',
+              'local_base_path_offset_unicode', 'local_base_path_unicode_offset_abs',
+              'common_path_suffix_unicode_offset', 'common_path_suffix_unicode_offset_abs',
+              'volume_id_size', 'drive_type_key', 'drive_type', 'drive_serial_number',
+              'volume_label_offset', 'volume_label_offset_abs',
+              'volume_label_unicode_offset', 'volume_label_unicode_offset_abs', 'volume_label',
+              'local_base_path',
+              'common_network_rel_link_size', 'common_net_rel_link_flags',
+              'net_name_offset', 'net_name_offset_abs', 'device_name_offset', 'device_name_offset_abs',
+              'network_provider_type_val', 'network_provider_type',
+              'net_name_unicode_offset', 'net_name_unicode_offset_abs',
+              'device_name_unicode_offset', 'device_name_unicode_offset_abs',
+              'net_name', 'device_name', 'net_name_unicode', 'device_name_unicode',
+              'common_path_suffix', 'local_base_path_unicode', 'common_path_suffix_unicode')
+    __slots__ = FIELDS
+    FLAG_FIELDS = {
+        'link_info_flags': LINK_INFO_FLAGS_NAMES,
+        'common_net_rel_link_flags': NET_REL_LINK_FLAGS_NAMES,
+    }
+    VALIDITY_CHECKS = ['sane_link_info_header_size', 'only_two_info_flags', 'null_volume_id', 'null_local_path',
+                       'null_net_rel_link', 'null_local_path_unicode', 'volume_id_no_overlap', 'sane_volume_id_size',
+                       'sane_drive_type', 'volume_id_within_bounds', 'local_path_no_overlap',
+                       'net_rel_link_no_overlap', 'sane_common_network_rel_link_size', 'only_two_net_rel_link_flags',
+                       'null_device_name', 'valid_network_provider_type_val', 'no_name_means_no_unicode',
+                       'net_name_no_overlap', 'device_name_no_overlap', 'net_name_unicode_no_overlap',
+                       'device_name_unicode_no_overlap', 'read_full_net', 'common_path_suffix_no_overlap',
+                       'local_base_path_unicode_no_overlap', 'common_path_suf_unicode_no_overlap',
+                       'read_entire_link_info', 'link_info_within_file', 'link_info_header_within_link_info',
+                       'volume_id_within_link_info', 'net_rel_link_within_link_info', 'volume_label_terminated',
+                       'local_base_path_terminated', 'net_name_terminated', 'device_name_terminated',
+                       'net_name_unicode_terminated', 'device_name_unicode_terminated',
+                       'common_path_suffix_terminated', 'local_base_path_unicode_terminated',
+                       'common_path_suffix_unicode_terminated']
+
+
+class StringDataRecord(Record):
+    FIELDS = tuple(field_name for _, field_name in STRING_DATA_FIELDS)
+    __slots__ = FIELDS
+    VALIDITY_CHECKS = []
+
+
+class ExtraDataRecord(Record):
+    # decoded blocks stay as small dicts, keyed by block name
+    FIELDS = ('blocks', 'block_data')
+    __slots__ = FIELDS
+    VALIDITY_CHECKS = ['terminal_block', 'sane_block_size']
+
+    @classmethod
+    def from_dict(cls, parsed_data):
+        parsed_data = dict(parsed_data)
+        block_data = dict((block_name, parsed_data.pop(block_name)) for block_name in list(parsed_data)
+                          if block_name not in ('blocks', 'validity_checks'))
+        record = super(ExtraDataRecord, cls).from_dict(parsed_data)
+        record.blocks = tuple(parsed_data.get('blocks', ()))
+        record.block_data = block_data
+        return record
+
+    def to_dict(self):
+        out = super(ExtraDataRecord, self).to_dict()
+        out['blocks'] = list(out.get('blocks', ()))
+        out.update(out.pop('block_data', {}))
+        return out
+
+
+class ShellLinkRecord(object):
+    __slots__ = ('header', 'id_list', 'link_info', 'string_data', 'extra_data')
+
+    # info key -> (slot, record class)
+    SECTIONS = [
+        ('ShellLinkHeader', 'header', HeaderRecord),
+        ('link_target_id_list', 'id_list', IDListRecord),
+        ('link_info', 'link_info', LinkInfoRecord),
+        ('StringData', 'string_data', StringDataRecord),
+        ('ExtraData', 'extra_data', ExtraDataRecord),
+    ]
+
+    @classmethod
+    def from_info(cls, info):
+        record = cls()
+        for section, slot, record_class in cls.SECTIONS:
+            setattr(record, slot, record_class.from_dict(info[section]) if section in info else None)
+        return record
+
+    @classmethod
+    def from_shell_link(cls, shell_link):
+        return cls.from_info(shell_link.info)
+
+    @property
+    def valid(self):
+        return all(getattr(self, slot) is None or getattr(self, slot).valid for _, slot, _ in self.SECTIONS)
+
+    def to_dict(self):
+        return dict((section, getattr(self, slot).to_dict())
+                    for section, slot, _ in self.SECTIONS if getattr(self, slot) is not None)
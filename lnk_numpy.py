@@ -0,0 +1,123 @@
+import io
+import struct
+
+import numpy as np
+
+from shell_link_const import *
+
+# same layout as lnk_tool.SHELL_LINK_HEADER, with the CLSID split into two integers for cheap comparison
+HEADER_DTYPE = np.dtype([
+    ('header_size', '<u4'),
+    ('clsid_lo', '<u8'),
+    ('clsid_hi', '<u8'),
+    ('link_flags', '<u4'),
+    ('file_attrs', '<u4'),
+    ('create_time', '<u8'),
+    ('access_time', '<u8'),
+    ('write_time', '<u8'),
+    ('file_size', '<u4'),
+    ('icon_index', '<u4'),
+    ('show_command', '<u4'),
+    ('hotkey', '<u2'),
+    ('reserved_1', '<u2'),
+    ('reserved_2', '<u4'),
+    ('reserved_3', '<u4'),
+])
+assert HEADER_DTYPE.itemsize == HEADER_SIZE
+
+CLSID_LO, CLSID_HI = struct.unpack('<QQ', CLSID if isinstance(CLSID, bytes) else CLSID.encode('latin-1'))
+
+
+def decode_headers(buffers):
+    """
+    decode the ShellLinkHeader of many lnk files at once
+    buffers shorter than 0x4c bytes become all-zero rows, which fail header_valid
+
+    :param buffers: iterable of bytes-like objects, each starting at a ShellLinkHeader
+    :return: structured array of HEADER_DTYPE, one row per buffer
+    """
+    raw = bytearray()
+    for buffer in buffers:
+        head = memoryview(buffer)[:HEADER_SIZE].tobytes()
+        # zero-padding the part that is there could pass for a header with every field blank
+        raw += head if len(head) == HEADER_SIZE else b'\x00' * HEADER_SIZE
+    return np.frombuffer(bytes(raw), dtype=HEADER_DTYPE)
+
+
+def read_headers(paths):
+    def heads():
+        for path in paths:
+            with io.open(path, mode='rb') as f:
+                yield f.read(HEADER_SIZE)
+
+    return decode_headers(heads())
+
+
+def header_valid(headers):
+    return ((headers['header_size'] == HEADER_SIZE) &
+            (headers['clsid_lo'] == CLSID_LO) &
+            (headers['clsid_hi'] == CLSID_HI) &
+            (headers['link_flags'] >> len(LINK_FLAGS_NAMES) == 0) &
+            (headers['file_attrs'] >> len(FILE_ATTRS_FLAGS_NAMES) == 0) &
+            (headers['reserved_1'] == 0) &
+            (headers['reserved_2'] == 0) &
+            (headers['reserved_3'] == 0))
+
+
+def flag_columns(flags, flag_names):
+    flags = np.asarray(flags)
+    return dict((flag_name, (flags >> flag_index & 1).astype(bool)) for flag_index, flag_name in enumerate(flag_names))
+
+
+def filetime_to_datetime64(filetimes):
+    # zero means "not set", and becomes NaT, as do ticks of 2^63 and up, which would wrap around in int64
+    filetimes = np.asarray(filetimes, dtype=np.uint64)
+    unset = (filetimes == 0) | (filetimes >= np.uint64(1 << 63))
+    ticks = np.where(unset, np.uint64(FILETIME_UNIX_EPOCH), filetimes).astype(np.int64)
+    out = ((ticks - FILETIME_UNIX_EPOCH) // 10).astype('datetime64[us]')
+    out[unset] = np.datetime64('NaT')
+    return out
+
+
+def filetime_columns(results, fields=('create_time', 'access_time', 'write_time')):
+    """
+    convert the header times of many ScanResults in one step per field, without a datetime per value
+    the results must come from a timestamps='raw' (the default) or 'lazy' scan
+
+    :return: (paths, {field: UTC datetime64[us] array}), failed parses and unset times are NaT
+    """
+    paths = []
+    raw = dict((field, []) for field in fields)
+    for result in results:
+        header = (result.info or {}).get('ShellLinkHeader') or {}
+        paths.append(result.path)
+        for field in fields:
+            raw[field].append(header.get(field) or 0)
+    return paths, dict((field, filetime_to_datetime64(np.array(values, dtype=np.uint64)))
+                       for field, values in raw.items())
+
+
+def header_columns(headers, flag_names=False):
+    """
+    columnar view of decoded headers, timestamps become UTC datetime64[us]
+
+    :param headers: output of decode_headers
+    :param flag_names: also add one boolean column per LinkFlags / FileAttributes flag name
+    """
+    columns = {
+        'valid': header_valid(headers),
+        'link_flags': headers['link_flags'],
+        'file_attrs': headers['file_attrs'],
+        'create_time': filetime_to_datetime64(headers['create_time']),
+        'access_time': filetime_to_datetime64(headers['access_time']),
+        'write_time': filetime_to_datetime64(headers['write_time']),
+        'file_size': headers['file_size'],
+        'icon_index': headers['icon_index'],
+        'show_command': headers['show_command'],
+        'hotkey_key': (headers['hotkey'] & 0xFF).astype(np.uint8),
+        'hotkey_modifiers': (headers['hotkey'] >> 8).astype(np.uint8),
+    }
+    if flag_names:
+        columns.update(flag_columns(headers['link_flags'], LINK_FLAGS_NAMES))
+        columns.update(flag_columns(headers['file_attrs'], FILE_ATTRS_FLAGS_NAMES))
+    return columns
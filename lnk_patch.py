@@ -0,0 +1,285 @@
+import collections
+import functools
+import io
+import os
+import shutil
+import struct
+import tempfile
+
+from lnk_scan import imap_paths
+from lnk_tool import ShellLink
+from lnk_writer import SHOW_COMMANDS
+from lnk_writer import datetime_to_filetime
+from lnk_writer import encode_ascii
+from lnk_writer import encode_hotkey
+from lnk_writer import encode_utf16
+from shell_link_const import *
+
+# change a few fields of existing shortcuts in place: only the bytes of the affected structure are rewritten,
+# and the sizes and offsets that point past it are shifted, nothing else is decoded or re-encoded
+
+PatchResult = collections.namedtuple('PatchResult', ['path', 'changed', 'error'])
+
+UINT16 = struct.Struct('<H')
+UINT32 = struct.Struct('<I')
+
+# fixed-size ShellLinkHeader fields: position, struct, encoder
+HEADER_FIELDS = {
+    'file_attrs': (0x18, UINT32, lambda value: value),
+    'create_time': (0x1C, struct.Struct('<Q'), datetime_to_filetime),
+    'access_time': (0x24, struct.Struct('<Q'), datetime_to_filetime),
+    'write_time': (0x2C, struct.Struct('<Q'), datetime_to_filetime),
+    'file_size': (0x34, UINT32, lambda value: value),
+    'icon_index': (0x38, UINT32, lambda value: value & 0xFFFFFFFF),
+    'show_command': (0x3C, UINT32, lambda value: SHOW_COMMANDS.get(value, value)),
+    'hotkey': (0x40, UINT16, encode_hotkey),
+}
+
+STRING_DATA_FLAGS = dict((field_name, flag_name) for flag_name, field_name in STRING_DATA_FIELDS)
+
+# LinkInfo strings: the absolute offset parse_link_info computes for them, and their character size
+LINK_INFO_STRINGS = {
+    'local_base_path': ('local_base_path_offset_abs', 1),
+    'local_base_path_unicode': ('local_base_path_unicode_offset_abs', 2),
+    'common_path_suffix': ('common_path_suffix_offset_abs', 1),
+    'common_path_suffix_unicode': ('common_path_suffix_unicode_offset_abs', 2),
+    'net_name': ('net_name_offset_abs', 1),
+    'net_name_unicode': ('net_name_unicode_offset_abs', 2),
+    'device_name': ('device_name_offset_abs', 1),
+    'device_name_unicode': ('device_name_unicode_offset_abs', 2),
+    'volume_label': ('volume_label_offset_abs', 1),
+}
+
+# offset fields inside each LinkInfo structure, relative to the start of that structure
+LINK_INFO_POINTERS = [
+    (0x0C, 'volume_id_offset'),
+    (0x10, 'local_base_path_offset'),
+    (0x14, 'common_net_rel_link_offset'),
+    (0x18, 'common_path_suffix_offset'),
+    (0x1C, 'local_base_path_offset_unicode'),
+    (0x20, 'common_path_suffix_unicode_offset'),
+]
+NET_REL_LINK_POINTERS = [
+    (0x08, 'net_name_offset'),
+    (0x0C, 'device_name_offset'),
+    (0x14, 'net_name_unicode_offset'),
+    (0x18, 'device_name_unicode_offset'),
+]
+
+
+def link_info_fixups(link_info, link_info_start):
+    # every (offset field position, base it is relative to) and size field position in the LinkInfo
+    pointers = [(link_info_start + rel_pos, link_info_start) for rel_pos, key in LINK_INFO_POINTERS
+                if link_info.get(key)]
+    sizes = [link_info_start]
+
+    volume_id_start = link_info.get('volume_id_offset_abs')
+    if volume_id_start is not None:
+        sizes.append(volume_id_start)
+        if link_info.get('volume_label_offset_abs') is not None:
+            pointers.append((volume_id_start + 0x0C, volume_id_start))
+        elif link_info.get('volume_label_unicode_offset_abs') is not None:
+            pointers.append((volume_id_start + 0x10, volume_id_start))
+
+    net_start = link_info.get('common_net_rel_link_offset_abs')
+    if net_start is not None:
+        sizes.append(net_start)
+        pointers.extend((net_start + rel_pos, net_start) for rel_pos, key in NET_REL_LINK_POINTERS
+                        if link_info.get(key))
+    return pointers, sizes
+
+
+def splice(buf, start, old_size, new_bytes, pointers=(), sizes=()):
+    # replace buf[start:start + old_size], shifting every offset that points past start and growing every
+    # structure that contains it; the offsets and sizes are read from buf as they currently are
+    delta = len(new_bytes) - old_size
+    if delta:
+        for field_pos, base in pointers:
+            value = UINT32.unpack_from(buf, field_pos)[0]
+            if base <= start < base + value:
+                UINT32.pack_into(buf, field_pos, value + delta)
+        for field_pos in sizes:
+            size = UINT32.unpack_from(buf, field_pos)[0]
+            if field_pos <= start < field_pos + size:
+                UINT32.pack_into(buf, field_pos, size + delta)
+    buf[start:start + old_size] = new_bytes
+
+
+def splice_all(buf, splices, pointers=(), sizes=()):
+    """
+    apply (start, old_size, new_bytes) splices whose starts are positions in the unpatched buffer
+    they are applied back to front, so the starts still to come never move; fixup fields that lie past an
+    applied splice are moved along with it
+    """
+    applied = []
+
+    def moved(pos):
+        return pos + sum(delta for start, delta in applied if start < pos)
+
+    # at equal starts the later one goes first, so an inserted string ends up in front of the one it precedes
+    for _, (start, old_size, new_bytes) in sorted(enumerate(splices), key=lambda item: (item[1][0], item[0]),
+                                                  reverse=True):
+        splice(buf, start, old_size, new_bytes, [(moved(field_pos), moved(base)) for field_pos, base in pointers],
+               [moved(field_pos) for field_pos in sizes])
+        applied.append((start, len(new_bytes) - old_size))
+
+
+def encode_string(value, char_size, codepage):
+    if char_size == 2:
+        if isinstance(value, bytes):
+            value = value.decode(codepage)
+        return encode_utf16(value) + b'\x00\x00'
+    return encode_ascii(value, codepage) + b'\x00'
+
+
+def terminated_size(buf, start, end, char_size):
+    # size of the NULL-terminated string at start, terminator included, as it is in the buffer
+    terminator = b'\x00' * char_size
+    term_pos = buf.find(terminator, start, end)
+    while term_pos >= 0 and (term_pos - start) % char_size:
+        term_pos = buf.find(terminator, term_pos + 1, end)
+    if term_pos < 0:
+        raise ValueError('string at 0x%x is not terminated inside the LinkInfo' % start)
+    return term_pos + char_size - start
+
+
+def link_info_string_splice(buf, link_info, link_info_end, field, value, codepage, missing_ok=False):
+    abs_key, char_size = LINK_INFO_STRINGS[field]
+    if field == 'volume_label' and link_info.get(abs_key) is None:
+        abs_key, char_size = 'volume_label_unicode_offset_abs', 2
+    start = link_info.get(abs_key)
+    if start is None or field not in link_info:
+        if missing_ok:
+            return []
+        raise ValueError('LinkInfo has no %s to patch' % field)
+
+    if callable(value):
+        value = value(link_info[field])
+    old_size = terminated_size(buf, start, link_info_end, char_size)
+    return [(start, old_size, encode_string(value, char_size, codepage))]
+
+
+def patch_link_info_strings(buf, link, changes, codepage):
+    # Windows reads the unicode copy of a string whenever there is one, so both copies are patched
+    # a callable value is applied to each copy's own old value (bytes for the ANSI copy, text for the unicode one)
+    link_info = link.link_info
+    if link_info is None:
+        raise ValueError('no LinkInfo to patch %s in' % ', '.join(sorted(changes)))
+    link_info_start = link.locate_sections()['link_info']
+    link_info_end = min(link_info_start + link_info['link_info_size'], len(buf))
+
+    splices = []
+    for field, value in changes.items():
+        splices.extend(link_info_string_splice(buf, link_info, link_info_end, field, value, codepage))
+        unicode_field = field + '_unicode'
+        if unicode_field in LINK_INFO_STRINGS and unicode_field not in changes:
+            splices.extend(link_info_string_splice(buf, link_info, link_info_end, unicode_field, value, codepage,
+                                                   missing_ok=True))
+    pointers, sizes = link_info_fixups(link_info, link_info_start)
+    splice_all(buf, splices, pointers, sizes)
+
+
+def patch_string_data(buf, link, changes, codepage):
+    pos = link.locate_sections()['StringData']
+    char_size = 2 if link.has_flag('IsUnicode') else 1
+    link_flags = link.link_flags
+
+    # walk the size fields once, noting where each changed string is, or would be inserted
+    splices = []
+    for flag_name, field_name in STRING_DATA_FIELDS:
+        present = link.has_flag(flag_name)
+        old_size = 2 + char_size * UINT16.unpack_from(buf, pos)[0] if present else 0
+        if field_name in changes:
+            value = changes[field_name]
+            if callable(value):
+                old_value = None
+                if present:
+                    link.file.seek(pos)
+                    old_value = link.parse_string_struct()
+                value = value(old_value)
+            if value is None:
+                new_bytes = b''
+                link_flags &= ~LINK_FLAGS[flag_name]
+            else:
+                encoded = encode_string(value, char_size, codepage)[:-char_size]
+                new_bytes = UINT16.pack(len(encoded) // char_size) + encoded
+                link_flags |= LINK_FLAGS[flag_name]
+            splices.append((pos, old_size, new_bytes))
+        pos += old_size
+
+    UINT32.pack_into(buf, 0x14, link_flags)
+    splice_all(buf, splices)
+
+
+def patch_header(buf, field, value):
+    field_pos, field_struct, encode = HEADER_FIELDS[field]
+    field_struct.pack_into(buf, field_pos, encode(value))
+
+
+def patch_bytes(data, changes, codepage='cp1252'):
+    """
+    apply field changes to the bytes of a shortcut and return the patched bytearray
+    the shortcut is parsed once, whatever the number of changes
+
+    :param changes: field name (as in ShellLink.info) -> new value, or a callable taking the old value
+                    StringData fields may be set to None to remove them; LinkInfo strings must already exist,
+                    and patching an ANSI LinkInfo string patches its unicode copy too
+    """
+    for field in changes:
+        if field not in HEADER_FIELDS and field not in STRING_DATA_FLAGS and field not in LINK_INFO_STRINGS:
+            raise KeyError('%r cannot be patched in place' % field)
+
+    buf = bytearray(data)
+    for field, value in changes.items():
+        if field in HEADER_FIELDS:
+            patch_header(buf, field, value)
+
+    string_data_changes = dict((field, value) for field, value in changes.items() if field in STRING_DATA_FLAGS)
+    link_info_changes = dict((field, value) for field, value in changes.items() if field in LINK_INFO_STRINGS)
+    if string_data_changes or link_info_changes:
+        link = ShellLink(None, lazy=True, source=data)
+        # StringData lies past the LinkInfo, so it is spliced first and the LinkInfo positions still hold
+        if string_data_changes:
+            patch_string_data(buf, link, string_data_changes, codepage)
+        if link_info_changes:
+            patch_link_info_strings(buf, link, link_info_changes, codepage)
+    return buf
+
+
+def atomic_write(path, data):
+    # write next to the original and rename over it, so readers never see a half-written shortcut
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                     prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with io.open(fd, mode='wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        shutil.copymode(path, temp_path)
+        getattr(os, 'replace', os.rename)(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+def patch_file(path, changes, codepage='cp1252'):
+    # never raises, like lnk_scan.parse_path
+    try:
+        with io.open(path, mode='rb') as f:
+            data = f.read()
+        patched = patch_bytes(data, changes, codepage)
+        if patched == data:
+            return PatchResult(path, False, None)
+        atomic_write(path, patched)
+        return PatchResult(path, True, None)
+    except Exception as e:
+        return PatchResult(path, False, '%s: %s' % (type(e).__name__, e))
+
+
+def patch_files(paths, changes, processes=None, chunk_size=64, codepage='cp1252'):
+    """
+    apply the same changes to many shortcuts across a process pool, yields PatchResults in completion order
+    callables in changes must be picklable (module-level functions or functools.partial) unless processes=1
+    """
+    worker = functools.partial(patch_file, changes=changes, codepage=codepage)
+    return imap_paths(worker, paths, processes, chunk_size)
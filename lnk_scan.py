@@ -0,0 +1,134 @@
+import collections
+import functools
+import multiprocessing
+import os
+import threading
+
+from lnk_stats import ParseStats
+from lnk_tool import ShellLink
+
+ScanResult = collections.namedtuple('ScanResult', ['path', 'info', 'error'])
+
+ALL_SECTIONS = [section for section, _ in ShellLink.SECTION_PARSERS]
+
+
+def find_lnk_files(root, extension='.lnk'):
+    if os.path.isfile(root):
+        yield root
+        return
+
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if file_name.lower().endswith(extension):
+                yield os.path.join(dir_path, file_name)
+
+
+def parse_path(path, sections=None, stats=None, timestamps='raw', strict=False):
+    # never raises, so one bad shortcut can't take down the rest of the batch
+    try:
+        with ShellLink(path, lazy=True, stats=stats, timestamps=timestamps, strict=strict) as link:
+            for section in sections or ALL_SECTIONS:
+                link.load_section(section)
+        return ScanResult(path, link.info, None)
+    except Exception as e:
+        return ScanResult(path, None, '%s: %s' % (type(e).__name__, e))
+
+
+def measured_parse_path(path, **kwargs):
+    # parse_path in a worker process, sending back the (section, sample) pairs it measured with the result
+    samples = []
+
+    def collect(path, section, sample):
+        if section is not None:
+            samples.append((section, sample))
+
+    return parse_path(path, stats=ParseStats(collect), **kwargs), samples
+
+
+def replay_samples(results, stats):
+    # record what measured_parse_path workers measured, as if every file had been parsed in this process
+    for result, samples in results:
+        token = stats.start_file(result.path)
+        for section, sample in samples:
+            stats.record(token, section, sample)
+        stats.finish_file(token)
+        yield result
+
+
+def parse_buffer(data, sections=None, path=None, timestamps='raw', strict=False):
+    # parse_path for shortcut bytes that never touched the filesystem
+    try:
+        with ShellLink.from_bytes(data, lazy=True, timestamps=timestamps, strict=strict) as link:
+            for section in sections or ALL_SECTIONS:
+                link.load_section(section)
+        return ScanResult(path, link.info, None)
+    except Exception as e:
+        return ScanResult(path, None, '%s: %s' % (type(e).__name__, e))
+
+
+def imap_paths(worker, paths, processes=None, chunk_size=64, max_pending=None):
+    """
+    worker(path) over every path, spread across a process pool, yielding results in completion order
+    worker must be picklable (a module-level function or functools.partial of one) unless processes=1
+    """
+    if processes == 1:
+        for path in paths:
+            yield worker(path)
+        return
+
+    # the pool's task feeder thread drains its input eagerly, so throttle it
+    if max_pending is None:
+        max_pending = 4 * chunk_size * (processes or multiprocessing.cpu_count())
+    pending = threading.Semaphore(max(max_pending, chunk_size))
+    stopped = threading.Event()
+
+    def throttled_paths():
+        for path in paths:
+            pending.acquire()
+            if stopped.is_set():
+                return
+            yield path
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(worker, throttled_paths(), chunksize=chunk_size):
+            pending.release()
+            yield result
+        pool.close()
+    finally:
+        # a consumer that stops early leaves the feeder blocked in acquire() on the pool's task handler thread,
+        # which terminate() joins: wake it up and let it finish first
+        stopped.set()
+        pending.release()
+        pool.terminate()
+        pool.join()
+
+
+def iter_lnk_paths(roots):
+    if isinstance(roots, (str, bytes, type(u''))):
+        roots = [roots]
+    return (path for root in roots for path in find_lnk_files(root))
+
+
+def scan(roots, processes=None, chunk_size=64, sections=None, max_pending=None, stats=None, timestamps='raw',
+         strict=False):
+    """
+    recursively find and parse every .lnk under the given roots, spread across a process pool
+    yields ScanResult(path, info, error) in completion order, not discovery order
+
+    :param roots: files and/or directories
+    :param processes: pool size, defaults to the number of cores; 1 parses in-process
+    :param chunk_size: paths handed to a worker at a time
+    :param sections: only decode these sections (see ShellLink.SECTION_PARSERS)
+    :param max_pending: most paths queued or in flight at once, bounds memory on huge corpora
+    :param stats: a lnk_stats.ParseStats to collect per-section costs into, samples measured in worker
+                  processes are recorded (and passed to its callback) as their results come back
+    :param timestamps: header times as 'raw' FILETIME ints (no datetime per value), 'lazy' FileTimes or 'local'
+    :param strict: fail a shortcut on the first structural bound it breaks, see ShellLink
+    """
+    if stats is not None and processes != 1:
+        worker = functools.partial(measured_parse_path, sections=sections, timestamps=timestamps, strict=strict)
+        return replay_samples(imap_paths(worker, iter_lnk_paths(roots), processes, chunk_size, max_pending), stats)
+    worker = functools.partial(parse_path, sections=sections, stats=stats, timestamps=timestamps, strict=strict)
+    return imap_paths(worker, iter_lnk_paths(roots), processes, chunk_size, max_pending)
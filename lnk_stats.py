@@ -0,0 +1,159 @@
+import collections
+import itertools
+import timeit
+
+# optional per-section instrumentation for ShellLink, see ShellLink(stats=...)
+# nothing here is touched unless a ParseStats is passed in, the file object is only wrapped when it is
+
+SectionSample = collections.namedtuple('SectionSample', ['seconds', 'bytes_read', 'reads', 'string_reads', 'seeks'])
+
+COUNTERS = ['bytes_read', 'reads', 'string_reads', 'seeks']
+
+
+class InstrumentedFile(object):
+    # counting proxy around a MemFile or MappedFile
+    def __init__(self, file):
+        self.file = file
+        self.bytes_read = 0
+        self.reads = 0
+        self.string_reads = 0
+        self.seeks = 0
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def read(self, length):
+        self.reads += 1
+        self.bytes_read += length
+        return self.file.read(length)
+
+    def read_null_terminated(self, char_size=1, limit=None):
+        start = self.file.tell()
+        self.string_reads += 1
+        out = self.file.read_null_terminated(char_size, limit)
+        self.bytes_read += self.file.tell() - start
+        return out
+
+    def seek(self, pos):
+        self.seeks += 1
+        self.file.seek(pos)
+
+    def counters(self):
+        return [getattr(self, counter) for counter in COUNTERS]
+
+
+class Histogram(object):
+    # power-of-two buckets: a value lands in the smallest 2**k above it
+    def __init__(self):
+        self.buckets = collections.Counter()
+
+    def add(self, value):
+        self.buckets[1 << int(value).bit_length() if value >= 1 else 0] += 1
+
+    def merge(self, other):
+        self.buckets.update(other.buckets)
+
+    def to_dict(self):
+        return dict(self.buckets)
+
+
+class Totals(object):
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.time_us = Histogram()
+        self.size_bytes = Histogram()
+
+    def add(self, sample):
+        self.count += 1
+        self.seconds += sample.seconds
+        for counter in COUNTERS:
+            self.counters[counter] += getattr(sample, counter)
+        self.time_us.add(sample.seconds * 1e6)
+        self.size_bytes.add(sample.bytes_read)
+
+    def merge(self, other):
+        self.count += other.count
+        self.seconds += other.seconds
+        for counter in COUNTERS:
+            self.counters[counter] += other.counters[counter]
+        self.time_us.merge(other.time_us)
+        self.size_bytes.merge(other.size_bytes)
+
+    def to_dict(self):
+        out = dict(self.counters, count=self.count, seconds=self.seconds)
+        out['time_us_histogram'] = self.time_us.to_dict()
+        out['bytes_histogram'] = self.size_bytes.to_dict()
+        return out
+
+
+def add_samples(first, second):
+    return SectionSample(*[a + b for a, b in zip(first, second)])
+
+
+class ParseStats(object):
+    """
+    collects a SectionSample (wall time, bytes consumed, read/string read/seek calls) for every section parsed,
+    aggregated per section and per file into totals and power-of-two histograms
+    callback(path, section, sample) is called for every section, and with section=None when a file is finished
+    every parse gets its own token from start_file, so parses of the same path (or of buffers, with no path)
+    are never merged into one file
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.sections = collections.OrderedDict()  # section -> Totals
+        self.files = Totals()
+        self.open_files = {}  # token -> running SectionSample, until finish_file
+        self.serials = itertools.count()
+
+    def start_file(self, path):
+        return next(self.serials), path
+
+    def measure(self, token, section, file, parser):
+        before = file.counters()
+        start = timeit.default_timer()
+        try:
+            parser()
+        finally:
+            seconds = timeit.default_timer() - start
+            sample = SectionSample(seconds, *[after - prev for after, prev in zip(file.counters(), before)])
+            self.record(token, section, sample)
+
+    def record(self, token, section, sample):
+        self.sections.setdefault(section, Totals()).add(sample)
+        running = self.open_files.get(token)
+        self.open_files[token] = sample if running is None else add_samples(running, sample)
+        if self.callback is not None:
+            self.callback(token[1], section, sample)
+
+    def finish_file(self, token):
+        # fold a file's sections into the per-file totals, once
+        sample = self.open_files.pop(token, None)
+        if sample is not None:
+            self.files.add(sample)
+            if self.callback is not None:
+                self.callback(token[1], None, sample)
+
+    def merge(self, other):
+        # combine the totals of another ParseStats, its callback isn't replayed
+        for section, totals in other.sections.items():
+            self.sections.setdefault(section, Totals()).merge(totals)
+        self.files.merge(other.files)
+
+    def to_dict(self):
+        return {
+            'sections': dict((section, totals.to_dict()) for section, totals in self.sections.items()),
+            'files': self.files.to_dict(),
+        }
+
+    def report(self):
+        lines = ['%-22s %8s %10s %10s %8s %8s %8s' % ('section', 'count', 'us/each', 'bytes', 'reads', 'strings',
+                                                      'seeks')]
+        for name, totals in list(self.sections.items()) + [('(per file)', self.files)]:
+            if totals.count:
+                lines.append('%-22s %8d %10.1f %10d %8d %8d %8d' % (
+                    name, totals.count, 1e6 * totals.seconds / totals.count, totals.counters['bytes_read'],
+                    totals.counters['reads'], totals.counters['string_reads'], totals.counters['seeks']))
+        return '\n'.join(lines)
@@ -1,12 +1,38 @@
+import bisect
 import calendar
 import io
-import os
+import mmap
 
 import datetime
 import pprint
+import struct
 
+from lnk_stats import InstrumentedFile
+from shell_items import default_decoder
+from shell_items import format_guid
 from shell_link_const import *
 
+# the fixed 0x4c byte ShellLinkHeader, unpacked in one go
+SHELL_LINK_HEADER = struct.Struct('<I16sIIQQQIIIHHII')
+assert SHELL_LINK_HEADER.size == HEADER_SIZE
+
+UNSIGNED_LITTLE_ENDIAN = dict((int_struct.size, int_struct) for int_struct in
+                              map(struct.Struct, ['<B', '<H', '<I', '<Q']))
+UINT16 = UNSIGNED_LITTLE_ENDIAN[2]
+UINT32 = UNSIGNED_LITTLE_ENDIAN[4]
+
+# fixed-size LinkInfo structure headers, shared with lnk_validate and lnk_writer: the LinkInfo header up to
+# the optional unicode offsets, VolumeID up to the label offset and CommonNetworkRelativeLink up to the
+# provider type
+LINK_INFO_HEADER = struct.Struct('<IIIIIII')
+VOLUME_ID_HEADER = struct.Struct('<IIII')
+NET_REL_LINK_HEADER = struct.Struct('<IIIII')
+
+try:
+    old_buffer = buffer
+except NameError:
+    old_buffer = None
+
 
 def format_bytes(num):
     unit = 0
@@ -24,23 +50,90 @@ def utc_to_local(datetime_utc):
     return local_dt.replace(microsecond=datetime_utc.microsecond)
 
 
+try:
+    FILETIME_INT = long  # python 2: a FILETIME doesn't always fit in a C long
+except NameError:
+    FILETIME_INT = int
+
+FILETIME_EPOCH = datetime.datetime(1601, 1, 1)
+
+
 def parse_datetime(windows_filetime_bytes):
     assert len(windows_filetime_bytes) == 8
-    windows_time = parse_int_unsigned_little_endian(windows_filetime_bytes)
+    return filetime_to_datetime(parse_int_unsigned_little_endian(windows_filetime_bytes))
+
+
+def filetime_to_datetime(windows_time):
+    # naive local time, exact to the microsecond (no float round trip)
     if not windows_time:
         return None  # undocumented but possible
-    WINDOWS_TO_UNIX_EPOCH = (datetime.datetime(1601, 1, 1) - datetime.datetime(1970, 1, 1)).total_seconds()
-    unix_time = windows_time / 1e7 + WINDOWS_TO_UNIX_EPOCH
-    return datetime.datetime.fromtimestamp(unix_time)
+    unix_seconds, ticks = divmod(windows_time - FILETIME_UNIX_EPOCH, FILETIME_TICKS_PER_SECOND)
+    return datetime.datetime.fromtimestamp(unix_seconds).replace(microsecond=ticks // 10)
+
+
+def filetime_to_utc(windows_time):
+    # naive UTC, no timezone lookup at all
+    if not windows_time:
+        return None
+    return FILETIME_EPOCH + datetime.timedelta(microseconds=windows_time // 10)
+
+
+def filetime_to_unix(windows_time):
+    if not windows_time:
+        return None
+    return (windows_time - FILETIME_UNIX_EPOCH) / float(FILETIME_TICKS_PER_SECOND)
+
+
+class FileTime(FILETIME_INT):
+    # the raw 100ns tick count, which only builds a datetime when one is asked for
+    __slots__ = ()
+
+    @property
+    def utc(self):
+        return filetime_to_utc(self)
+
+    @property
+    def local(self):
+        return filetime_to_datetime(self)
+
+    @property
+    def unix(self):
+        return filetime_to_unix(self)
+
+    def __repr__(self):
+        return 'FileTime(%d)' % self
+
+
+def lazy_filetime(windows_time):
+    return FileTime(windows_time) if windows_time else None
+
+
+# how ShellLinkHeader times are returned, see ShellLink(timestamps=...)
+TIMESTAMP_MODES = {
+    'local': filetime_to_datetime,  # naive local datetime, as always
+    'lazy': lazy_filetime,  # FileTime, converted on access via .utc / .local / .unix
+    'raw': int,  # plain 100ns ticks since 1601-01-01 UTC, 0 when unset
+}
 
 
 def parse_binary_flag_list(flag_bytes):
     flag_int = parse_int_unsigned_little_endian(flag_bytes)
-    return [bool(flag_int >> flag_index & 1) for flag_index in xrange(8 * len(flag_bytes))]
+    return [bool(flag_int >> flag_index & 1) for flag_index in range(8 * len(flag_bytes))]
+
+
+def parse_flag_dict(flag_int, flag_names):
+    return dict((flag_name, bool(flag_int >> flag_index & 1)) for flag_index, flag_name in enumerate(flag_names))
+
+
+def flag_dict_to_int(flag_dict, flag_names):
+    return sum(1 << flag_index for flag_index, flag_name in enumerate(flag_names) if flag_dict.get(flag_name))
 
 
 def parse_int_unsigned_little_endian(int_bytes):
-    return sum(ord(byte) * (0x100 ** i) for i, byte in enumerate(int_bytes))
+    int_struct = UNSIGNED_LITTLE_ENDIAN.get(len(int_bytes))
+    if int_struct is not None:
+        return int_struct.unpack(int_bytes)[0]
+    return sum(byte << (8 * i) for i, byte in enumerate(bytearray(int_bytes)))
 
 
 def parse_int_signed_little_endian(int_bytes):
@@ -50,128 +143,536 @@ def parse_int_signed_little_endian(int_bytes):
     return out
 
 
+def decode_fixed_ascii(field_bytes):
+    # fixed-size, NULL-terminated and NULL-padded string field
+    return to_bytes(field_bytes).split(b'\x00', 1)[0]
+
+
+def decode_fixed_utf16(field_bytes):
+    return to_bytes(field_bytes).decode('utf-16-le', 'replace').split(u'\x00', 1)[0]
+
+
+def to_bytes(data):
+    if isinstance(data, memoryview):
+        return data.tobytes()
+    if isinstance(data, mmap.mmap):
+        return data[:]
+    return bytes(data)
+
+
+def decode_ansi(value, codepage):
+    # non-unicode strings are in the system default code page, which the file doesn't record
+    return value.decode(codepage, 'replace') if isinstance(value, bytes) else value
+
+
+def link_info_target_path(link_info, codepage='cp1252'):
+    # always text, whichever mix of ANSI and unicode strings the LinkInfo has
+    if not link_info:
+        return None
+    suffix = decode_ansi(link_info.get('common_path_suffix_unicode', link_info.get('common_path_suffix')), codepage)
+    base = decode_ansi(link_info.get('local_base_path_unicode', link_info.get('local_base_path')), codepage)
+    if base is None:
+        base = decode_ansi(link_info.get('net_name_unicode', link_info.get('net_name')), codepage)
+        if base is None:
+            return None
+        if suffix:
+            base += u'\\'
+    return base + suffix if suffix else base
+
+
+class ParseError(ValueError):
+    """
+    a shortcut that breaks one of its own structural bounds, or can't be read within the work budget
+    check is the validity_checks name of what was broken, section is filled in by ShellLink.load_section
+    """
+
+    def __init__(self, reason, offset=None, check=None, section=None):
+        ValueError.__init__(self, reason)
+        self.reason = reason
+        self.offset = offset
+        self.check = check
+        self.section = section
+
+    def __reduce__(self):
+        return ParseError, (self.reason, self.offset, self.check, self.section)
+
+    def __str__(self):
+        out = '%s: %s' % (self.section, self.reason) if self.section else self.reason
+        return out if self.offset is None else '%s (at offset %d)' % (out, self.offset)
+
+
+# which bytes of a file have been read, kept as sorted non-overlapping [start, end) intervals
+class ByteCoverage(object):
+    def __init__(self, size):
+        self.size = size
+        self.starts = []
+        self.ends = []
+
+    def add(self, start, end):
+        if start >= end:
+            return
+        # merge with every interval that overlaps or touches [start, end)
+        lo = bisect.bisect_left(self.ends, start)
+        hi = bisect.bisect_right(self.starts, end)
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
+
+    def read_ranges(self):
+        return list(zip(self.starts, self.ends))
+
+    def unread_ranges(self):
+        out = []
+        prev = 0
+        for start, end in zip(self.starts, self.ends):
+            if start > prev:
+                out.append((prev, start))
+            prev = end
+        if prev < self.size:
+            out.append((prev, self.size))
+        return out
+
+    def unread_byte_count(self):
+        return self.size - sum(end - start for start, end in zip(self.starts, self.ends))
+
+
 class MemFile(object):
-    def __init__(self, path):
+    def __init__(self, path=None, track_coverage=False, data=None):
         self.pos = 0
-        self.seen = []
-        self.seeks = []
-        with io.open(path, mode='rb') as f:
-            self.data = f.read()
+        if data is None:
+            with io.open(path, mode='rb') as f:
+                data = f.read()
+        self.data = data
         self.size = len(self.data)
+        self.coverage = ByteCoverage(self.size) if track_coverage else None
+        self.work_left = float('inf')  # bytes that may still be read or searched
 
     def read(self, length):
         prev = self.pos
-        self.pos += length
-        assert self.pos < self.size
-        self.seen.append(range(prev, self.pos))
+        end = prev + length
+        self.work_left -= length
+        if end > self.size or length < 0 or self.work_left < 0:
+            raise self.read_error(length)
+        self.pos = end
+        if self.coverage is not None:
+            self.coverage.add(prev, self.pos)
         return self.data[prev:self.pos]
 
+    def read_error(self, length):
+        if length < 0 or self.pos + length > self.size:
+            self.work_left += length  # nothing was read after all
+            return ParseError('read of %d bytes runs outside the file' % length, self.pos, 'within_file')
+        return ParseError('work budget exhausted', self.pos, 'work_budget')
+
+    def find(self, sub, start, end):
+        return self.data.find(sub, start, end)
+
+    def peek(self, start, end):
+        # a copy of [start, end), without moving, charging the work budget or counting the bytes as read
+        return to_bytes(self.data[start:end])
+
+    def read_null_terminated(self, char_size=1, limit=None):
+        # one search for the terminator (aligned to char_size) instead of a read per character
+        # returns the string without its terminator, and leaves pos just past the terminator
+        end = self.size if limit is None else min(limit, self.size)
+        terminator = b'\x00' * char_size
+        term_pos = self.find(terminator, self.pos, end)
+        while term_pos > 0 and (term_pos - self.pos) % char_size:
+            term_pos = self.find(terminator, term_pos + 1, end)
+        if term_pos < 0:
+            self.work_left -= max(end - self.pos, 0)
+            raise ParseError('unterminated string', self.pos, 'string_terminated')
+        return self.read(term_pos + char_size - self.pos)[:-char_size]
+
     def seek(self, pos):
-        assert 0 <= pos < self.size
-        self.seeks.append(pos)
+        if not 0 <= pos <= self.size:
+            raise ParseError('seek outside the file', pos, 'within_file')
         self.pos = pos
 
     def tell(self):
         return self.pos
 
+    def close(self):
+        pass
+
+
+# zero-copy MemFile: memory-maps the file (or wraps a caller-supplied buffer) and returns views,
+# so bytes are only copied out when a field is actually decoded
+class MappedFile(MemFile):
+    def __init__(self, path=None, source=None, track_coverage=False):
+        self.pos = 0
+        self.mmap = None
+        if source is None:
+            with io.open(path, mode='rb') as f:
+                self.mmap = source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.source = source
+        try:
+            self.data = memoryview(source)
+        except TypeError:
+            # python 2 mmap only exposes the old buffer interface
+            self.data = None
+        self.size = len(source)
+        self.coverage = ByteCoverage(self.size) if track_coverage else None
+        self.work_left = float('inf')
+
+    def read(self, length):
+        prev = self.pos
+        end = prev + length
+        self.work_left -= length
+        if end > self.size or length < 0 or self.work_left < 0:
+            raise self.read_error(length)
+        self.pos = end
+        if self.coverage is not None:
+            self.coverage.add(prev, self.pos)
+        if self.data is None:
+            return old_buffer(self.source, prev, length)
+        return self.data[prev:self.pos]
+
+    def find(self, sub, start, end):
+        if hasattr(self.source, 'find'):
+            return self.source.find(sub, start, end)
+        # plain memoryviews can't be searched, so copy just the bounded window
+        found = to_bytes(self.data[start:end]).find(sub)
+        return found if found < 0 else found + start
+
+    def peek(self, start, end):
+        if self.data is None:
+            return self.source[start:end]
+        return to_bytes(self.data[start:end])
+
+    def close(self):
+        if self.mmap is not None:
+            if hasattr(self.data, 'release'):
+                self.data.release()  # python 3 won't close a map that a memoryview still exports
+            try:
+                self.mmap.close()
+            except BufferError:
+                pass  # a view handed out by read() is still alive, the map is unmapped along with it
+            self.mmap = None
+
 
 class ShellLink(object):
-    def __init__(self, path):
+    # section name -> parser, in file order
+    SECTION_PARSERS = [
+        ('ShellLinkHeader', 'parse_header'),
+        ('link_target_id_list', 'parse_id_list'),
+        ('link_info', 'parse_link_info'),
+        ('StringData', 'parse_string_data'),
+        ('ExtraData', 'parse_extra_data'),
+    ]
+
+    # ExtraData block signature -> parser
+    EXTRA_DATA_PARSERS = {
+        0xA0000001: 'parse_env_string_data',
+        0xA0000002: 'parse_console_data',
+        0xA0000003: 'parse_tracker_data',
+        0xA0000004: 'parse_console_fe_data',
+        0xA0000005: 'parse_special_folder_data',
+        0xA0000006: 'parse_env_string_data',
+        0xA0000007: 'parse_env_string_data',
+        0xA0000008: 'parse_shim_data',
+        0xA0000009: 'parse_property_store_data',
+        0xA000000B: 'parse_known_folder_data',
+        0xA000000C: 'parse_vista_and_above_id_list_data',
+    }
+
+    # decoded blocks whose raw bytes are kept too, because lnk_writer has no encoder for them
+    # (unknown signatures always keep theirs)
+    EXTRA_DATA_RAW_BLOCKS = {0xA0000009}
+
+    # smallest block each ExtraData parser can decode without reading past the end of the block
+    EXTRA_DATA_MIN_SIZES = {
+        0xA0000001: 0x0000010C,
+        0xA0000002: 0x000000CC,
+        0xA0000003: 0x00000060,
+        0xA0000004: 0x0000000C,
+        0xA0000005: 0x00000010,
+        0xA0000006: 0x0000010C,
+        0xA0000007: 0x0000010C,
+        0xA000000B: 0x0000001C,
+    }
+
+    # at most this many bytes are read or searched per file: every structure is bounded by its parent,
+    # so only the handful of LinkInfo strings that may overlap ever get read more than once
+    MAX_WORK_FACTOR = 16
+    MAX_WORK_SLACK = 0x1000
+
+    def __init__(self, path, zero_copy=False, track_coverage=False, lazy=False, extra_data_blocks=None, source=None,
+                 stats=None, timestamps='local', strict=False):
+        """
+        :param strict: raise a ParseError on the first structural bound the file breaks (a size or offset that
+                       runs outside its enclosing structure), instead of recording it as a failed validity check
+                       and skipping what can't be read safely; either way, nothing is read outside the file
+        """
+        if timestamps not in TIMESTAMP_MODES:
+            raise ValueError('timestamps must be one of %s' % ', '.join(sorted(TIMESTAMP_MODES)))
+        self.path = path
+        self.strict = strict
+        self.convert_time = TIMESTAMP_MODES[timestamps]
         self.info = {}
-        if os.path.isfile(path):
-            self.file = MemFile(path)
-            self.parse_lnk()
-
-    def read_null_terminated_string_ascii(self):
-        out = self.file.read(1)
-        while out[-1] != '\x00':
-            out += self.file.read(1)
-        out = out[:-1]
-        return out
+        self.section_offsets = None
+        self.extra_data_blocks = extra_data_blocks  # names of the ExtraData blocks to decode, None for all
+        self.properties = None
+        self.stats = stats  # lnk_stats.ParseStats, or None for no instrumentation at all
+        self.file = None
+        if source is not None:
+            # parse an in-memory buffer (bytes, bytearray, memoryview, mmap) instead of a file
+            if zero_copy:
+                self.file = MappedFile(source=source, track_coverage=track_coverage)
+            else:
+                self.file = MemFile(data=to_bytes(source), track_coverage=track_coverage)
+        elif zero_copy:
+            self.file = MappedFile(path, track_coverage=track_coverage)
+        else:
+            # a path that can't be opened raises IOError (FileNotFoundError, ...) right here
+            self.file = MemFile(path, track_coverage=track_coverage)
+        self.file.work_left = self.MAX_WORK_FACTOR * self.file.size + self.MAX_WORK_SLACK
+        if stats is not None:
+            self.file = InstrumentedFile(self.file)
+            self.stats_token = stats.start_file(path)
+        if not lazy:
+            try:
+                self.parse_lnk()
+            except Exception:
+                self.close()
+                raise
+
+    def close(self):
+        # unmaps a zero_copy file, sections that were never loaded can't be loaded afterwards
+        if self.file is not None:
+            self.file.close()
+            self.finish_stats()
+
+    def finish_stats(self):
+        # fold this parse into the per-file stats, done by parse_lnk and close
+        if self.stats is not None:
+            self.stats.finish_file(self.stats_token)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @classmethod
+    def from_bytes(cls, data, **kwargs):
+        return cls(None, source=data, **kwargs)
+
+    @classmethod
+    def from_stream(cls, stream, **kwargs):
+        # reads a binary file-like object from its current position to the end
+        return cls.from_bytes(stream.read(), **kwargs)
+
+    def locate_sections(self):
+        # find where each section starts using only the size fields, without decoding anything
+        # sections that are not present (or are to be ignored) are located at None
+        if self.section_offsets is not None:
+            return self.section_offsets
+
+        self.load_section('ShellLinkHeader')
+        offsets = {'ShellLinkHeader': 0}
+        pos = HEADER_SIZE
+
+        if self.has_flag('HasLinkTargetIDList'):
+            offsets['link_target_id_list'] = pos
+            pos += 2 + self.size_field(pos, 2)
+        else:
+            offsets['link_target_id_list'] = None
 
-    def read_null_terminated_string_utf16(self):
-        out = '\xfe\xff'
-        while out[-2:] != '\x00\x00':
-            out += self.file.read(2)
-        out = out[:-2].decode('utf16')
-        return out
+        if self.has_flag('HasLinkInfo'):
+            offsets['link_info'] = None if self.has_flag('ForceNoLinkInfo') else pos
+            pos += self.size_field(pos, 4)
+        else:
+            offsets['link_info'] = None
+
+        offsets['StringData'] = pos
+        char_size = 2 if self.has_flag('IsUnicode') else 1
+        for flag_name, _ in STRING_DATA_FIELDS:
+            if self.has_flag(flag_name):
+                pos += 2 + char_size * self.size_field(pos, 2)
+
+        offsets['ExtraData'] = pos
+        self.section_offsets = offsets
+        return offsets
+
+    def size_field(self, pos, length):
+        # a size field read while locating sections: past the end of the file it counts as 0,
+        # and whichever section is located out there fails when (and only if) it gets loaded
+        if pos + length > self.file.size:
+            return 0
+        self.file.seek(pos)
+        return parse_int_unsigned_little_endian(self.file.read(length))
+
+    def load_section(self, section):
+        # decode a single section on first access and memoize it in self.info
+        if section not in self.info:
+            try:
+                if section == 'ShellLinkHeader':
+                    offset = 0
+                else:
+                    offset = self.locate_sections()[section]
+                    if offset is None:
+                        return None
+                self.file.seek(offset)
+                parser = getattr(self, dict(self.SECTION_PARSERS)[section])
+                if self.stats is None:
+                    parser()
+                else:
+                    self.stats.measure(self.stats_token, section, self.file, parser)
+            except ParseError as e:
+                self.info.pop(section, None)
+                if e.section is None:
+                    e.section = section
+                raise
+            except Exception as e:
+                self.info.pop(section, None)
+                raise ParseError('%s: %s' % (type(e).__name__, e), self.file.tell(), None, section)
+        return self.info[section]
+
+    def parse_all(self):
+        for section, _ in self.SECTION_PARSERS:
+            self.load_section(section)
+        return self.info
+
+    @property
+    def header(self):
+        return self.load_section('ShellLinkHeader')
+
+    @property
+    def id_list(self):
+        return self.load_section('link_target_id_list')
+
+    @property
+    def link_info(self):
+        return self.load_section('link_info')
+
+    @property
+    def string_data(self):
+        return self.load_section('StringData')
+
+    @property
+    def extra_data(self):
+        return self.load_section('ExtraData')
+
+    @property
+    def target_path(self):
+        return link_info_target_path(self.link_info) or self.id_list_path
+
+    @property
+    def id_list_items(self):
+        id_list = self.id_list
+        if not id_list:
+            return []
+        item_ids = []
+        while 'item_id_%d' % (len(item_ids) + 1) in id_list:
+            item_ids.append(id_list['item_id_%d' % (len(item_ids) + 1)])
+        return item_ids
+
+    @property
+    def id_list_path(self):
+        # decoded prefixes are shared between every link parsed in this process
+        return default_decoder.path(self.id_list_items)
+
+    @property
+    def property_store(self):
+        # indexed on first access, values are only decoded when asked for
+        if self.properties is None:
+            from property_store import PropertyStore  # property_store raises this module's ParseError
+
+            block = (self.extra_data or {}).get('PropertyStoreDataBlock')
+            if block is None:
+                return None
+            self.file.seek(block['property_store_offset'])
+            self.properties = PropertyStore(to_bytes(self.file.read(block['property_store_size'])),
+                                            block['property_store_offset'])
+        return self.properties
+
+    def unread_ranges(self):
+        if self.file.coverage is None:
+            raise ValueError('coverage tracking was not enabled for this file')
+        return self.file.coverage.unread_ranges()
+
+    def has_flag(self, name):
+        return bool(self.link_flags & LINK_FLAGS[name])
+
+    def check_bound(self, validity, check, passed, offset, reason, *args):
+        # a structural bound: only a failure is recorded (as a validity check), and is fatal in strict mode
+        if not passed:
+            validity[check] = False
+            if self.strict:
+                raise ParseError(reason % args, offset, check)
+        return passed
+
+    def read_string_at(self, validity, field, offset_abs, end, char_size=1):
+        # a NULL-terminated LinkInfo string that must start and end before `end`
+        # returns None (lenient mode) if it doesn't, failing <field>_terminated
+        if not self.check_bound(validity, field + '_terminated', offset_abs < end, offset_abs,
+                                '%s starts outside its structure', field):
+            return None
+        self.file.seek(offset_abs)
+        try:
+            value = to_bytes(self.file.read_null_terminated(char_size, end))
+        except ParseError as e:
+            if e.check != 'string_terminated':
+                raise
+            self.check_bound(validity, field + '_terminated', False, offset_abs, '%s is unterminated', field)
+            return None
+        return value.decode('utf-16-le', 'replace') if char_size == 2 else value
 
     def parse_header(self):
         parsed_data = self.info.setdefault('ShellLinkHeader', {})
         validity = parsed_data.setdefault('validity_checks', {})
 
-        header_size_bytes = self.file.read(4)
-        header_size = parse_int_unsigned_little_endian(header_size_bytes)
-        validity['header_size'] = header_size == 0x0000004c
+        (header_size, link_class_identifier_bytes, link_flags, file_attrs,
+         create_time_val, access_time_val, write_time_val, file_size, icon_index, show_command_val,
+         hot_key_val, reserved_1, reserved_2, reserved_3) = SHELL_LINK_HEADER.unpack(self.file.read(HEADER_SIZE))
 
-        link_class_identifier_bytes = self.file.read(16)
+        validity['header_size'] = header_size == HEADER_SIZE
         validity['CLSID'] = link_class_identifier_bytes == CLSID
 
-        link_flags_bytes = self.file.read(4)
-        link_flags = parse_binary_flag_list(link_flags_bytes)
-        validity['link_flags_tail'] = not any(link_flags[27:])
-        parsed_data['LinkFlags'] = dict(zip(LINK_FLAGS_NAMES, link_flags))
-
-        file_attrs_bytes = self.file.read(4)
-        file_attrs = parse_binary_flag_list(file_attrs_bytes)
-        validity['file_attrs_flags_tail'] = not any(file_attrs[15:])
-        validity['file_attrs_flags_reserved_1'] = not file_attrs[3]
-        validity['file_attrs_flags_reserved_2'] = not file_attrs[6]
-        if file_attrs[7]:
-            validity['normal_file_attrs_are_blank'] = not any(attr for i, attr in enumerate(file_attrs) if i != 7)
-        parsed_data['file_attrs'] = dict(zip(FILE_ATTRS_FLAGS_NAMES, file_attrs))
-
-        create_time_bytes = self.file.read(8)
-        create_time = parse_datetime(create_time_bytes)
-        # header['create_time_fmt'] = str(create_time)
-        parsed_data['create_time'] = create_time
-
-        access_time_bytes = self.file.read(8)
-        access_time = parse_datetime(access_time_bytes)
-        # header['access_time_fmt'] = str(access_time)
-        parsed_data['access_time'] = access_time
-
-        write_time_bytes = self.file.read(8)
-        write_time = parse_datetime(write_time_bytes)
-        # header['write_time_fmt'] = str(write_time)
-        parsed_data['write_time'] = write_time
-
-        file_size_bytes = self.file.read(4)
-        file_size = parse_int_unsigned_little_endian(file_size_bytes)
+        self.link_flags = link_flags
+        validity['link_flags_tail'] = not link_flags >> len(LINK_FLAGS_NAMES)
+        parsed_data['LinkFlags'] = parse_flag_dict(link_flags, LINK_FLAGS_NAMES)
+
+        self.file_attrs = file_attrs
+        validity['file_attrs_flags_tail'] = not file_attrs >> len(FILE_ATTRS_FLAGS_NAMES)
+        validity['file_attrs_flags_reserved_1'] = not file_attrs & FILE_ATTRS_FLAGS['Reserved1']
+        validity['file_attrs_flags_reserved_2'] = not file_attrs & FILE_ATTRS_FLAGS['Reserved2']
+        if file_attrs & FILE_ATTRS_FLAGS['FILE_ATTRIBUTE_NORMAL']:
+            validity['normal_file_attrs_are_blank'] = not file_attrs & ~FILE_ATTRS_FLAGS['FILE_ATTRIBUTE_NORMAL']
+        parsed_data['file_attrs'] = parse_flag_dict(file_attrs, FILE_ATTRS_FLAGS_NAMES)
+
+        for field_name, field_offset, time_val in [('create_time', 0x1c, create_time_val),
+                                                   ('access_time', 0x24, access_time_val),
+                                                   ('write_time', 0x2c, write_time_val)]:
+            try:
+                parsed_data[field_name] = self.convert_time(time_val)
+            except (ValueError, OverflowError, OSError):
+                # beyond what a datetime can hold, only timestamps='raw' or 'lazy' keep these
+                parsed_data[field_name] = None
+                self.check_bound(validity, 'sane_' + field_name, False, field_offset, '%s is out of range',
+                                 field_name)
+
         # header['file_size_fmt'] = format_bytes(file_size)
         parsed_data['file_size'] = file_size
-
-        icon_index_bytes = self.file.read(4)
-        icon_index = parse_int_unsigned_little_endian(icon_index_bytes)
         parsed_data['icon_index'] = icon_index
+        parsed_data['show_command'] = SHOW_OPTIONS.get(show_command_val, 'SW_SHOWNORMAL')
 
-        show_command_bytes = self.file.read(4)
-        show_command = SHOW_OPTIONS.get(parse_int_unsigned_little_endian(show_command_bytes), 'SW_SHOWNORMAL')
-        parsed_data['show_command'] = show_command
-
-        hot_key_bytes = self.file.read(2)
-        if hot_key_bytes == '\x00\x00':
+        if not hot_key_val:
             parsed_data['hotkey'] = None
         else:
-            print(ord(hot_key_bytes[0]))
-            key = HOT_KEY_LOW[ord(hot_key_bytes[0])]
-            modifiers = [val for mask, val in HOT_KEY_HIGH.items() if mask & ord(hot_key_bytes[1])]
-            assert modifiers
-            parsed_data['hotkey'] = modifiers + [key]
-
-        reserved_1_bytes = self.file.read(2)
-        reserved_1 = parse_int_unsigned_little_endian(reserved_1_bytes)
-        validity['reserved_1'] = reserved_1 == 0
+            key = HOT_KEY_LOW.get(hot_key_val & 0xFF)
+            modifiers = [val for mask, val in HOT_KEY_HIGH.items() if mask & hot_key_val >> 8]
+            validity['sane_hotkey'] = key is not None and bool(modifiers)
+            parsed_data['hotkey'] = modifiers + [key] if validity['sane_hotkey'] else None
 
-        reserved_2_bytes = self.file.read(4)
-        reserved_2 = parse_int_unsigned_little_endian(reserved_2_bytes)
+        validity['reserved_1'] = reserved_1 == 0
         validity['reserved_2'] = reserved_2 == 0
-
-        reserved_3_bytes = self.file.read(4)
-        reserved_3 = parse_int_unsigned_little_endian(reserved_3_bytes)
         validity['reserved_3'] = reserved_3 == 0
 
-        validity['read_0x4c_byte_header'] = self.file.tell() == 0x0000004c
+        validity['read_0x4c_byte_header'] = self.file.tell() == HEADER_SIZE
 
     def parse_id_list(self):
         parsed_data = self.info.setdefault('link_target_id_list', {})
@@ -189,10 +690,17 @@ class ShellLink(object):
         i = 0
         remaining_size = id_list_size
         while remaining_size > 2:
-            i += 1
             item_id_size_bytes = self.file.read(2)
             item_id_size = parse_int_unsigned_little_endian(item_id_size_bytes)
-            item_data_bytes = self.file.read(item_id_size - 2)
+            # a size of 0 or 1 would never get any closer to the end of the list
+            if not self.check_bound(validity, 'sane_item_id_size', 2 <= item_id_size <= remaining_size - 2,
+                                    self.file.tell() - 2, 'ItemID of %d bytes in an IDList with %d bytes left',
+                                    item_id_size, remaining_size):
+                if item_id_size < 2:
+                    self.file.seek(self.file.tell() - 2)  # read it as the TerminalID
+                    break
+            i += 1
+            item_data_bytes = to_bytes(self.file.read(item_id_size - 2))
             parsed_data['item_id_%d' % i] = item_data_bytes
             remaining_size -= item_id_size
 
@@ -214,11 +722,19 @@ class ShellLink(object):
         link_info_size_bytes = self.file.read(4)
         link_info_size = parse_int_unsigned_little_endian(link_info_size_bytes)
         parsed_data['link_info_size'] = link_info_size
+        link_info_end = link_info_start_byte + link_info_size
+        if not self.check_bound(validity, 'link_info_within_file', link_info_end <= self.file.size,
+                                link_info_start_byte, 'LinkInfo of %d bytes runs past the end of the file',
+                                link_info_size):
+            link_info_end = self.file.size
 
         link_info_header_size_bytes = self.file.read(4)
         link_info_header_size = parse_int_unsigned_little_endian(link_info_header_size_bytes)
         validity['sane_link_info_header_size'] = link_info_header_size in [0x1c, 0x20, 0x24]
         parsed_data['link_info_header_size'] = link_info_header_size
+        self.check_bound(validity, 'link_info_header_within_link_info',
+                         link_info_start_byte + max(link_info_header_size, 0x1c) <= link_info_end,
+                         link_info_start_byte, 'LinkInfo header runs outside the LinkInfo')
 
         link_info_flags_bytes = self.file.read(4)
         link_info_flags = parse_binary_flag_list(link_info_flags_bytes)
@@ -287,9 +803,11 @@ class ShellLink(object):
         else:
             common_path_suffix_unicode_offset_abs = None
 
-        # parse the rest of the link_info structure
+        # parse the rest of the link_info structure, every offset has to land inside it
 
-        if volume_id_offset_abs is not None:
+        if volume_id_offset_abs is not None and self.check_bound(
+                validity, 'volume_id_within_link_info', volume_id_offset_abs + 0x10 <= link_info_end,
+                volume_id_offset_abs, 'VolumeID header runs outside the LinkInfo'):
             validity['volume_id_no_overlap'] = volume_id_offset_abs >= self.file.tell()
             self.file.seek(volume_id_offset_abs)
 
@@ -297,12 +815,17 @@ class ShellLink(object):
             volume_id_size = parse_int_unsigned_little_endian(volume_id_size_bytes)
             validity['sane_volume_id_size'] = volume_id_size >= 0x10
             parsed_data['volume_id_size'] = volume_id_size
+            volume_id_end = volume_id_offset_abs + volume_id_size
+            if not self.check_bound(validity, 'volume_id_within_link_info', volume_id_end <= link_info_end,
+                                    volume_id_offset_abs, 'VolumeID of %d bytes runs outside the LinkInfo',
+                                    volume_id_size):
+                volume_id_end = link_info_end
 
             drive_type_bytes = self.file.read(4)
             drive_type_key = parse_int_unsigned_little_endian(drive_type_bytes)
             validity['sane_drive_type'] = drive_type_key in DRIVE_TYPES.keys()
             parsed_data['drive_type_key'] = drive_type_key
-            parsed_data['drive_type'] = DRIVE_TYPES[drive_type_key]
+            parsed_data['drive_type'] = DRIVE_TYPES.get(drive_type_key)
 
             drive_serial_number_bytes = self.file.read(4)
             drive_serial_number = parse_int_unsigned_little_endian(drive_serial_number_bytes)
@@ -317,7 +840,7 @@ class ShellLink(object):
             parsed_data['volume_label_offset'] = volume_label_offset
             parsed_data['volume_label_offset_abs'] = volume_label_offset_abs
 
-            if volume_id_size >= 0x14:
+            if volume_id_size >= 0x14 and self.file.tell() + 4 <= volume_id_end:
                 volume_label_unicode_offset_bytes = self.file.read(4)
                 volume_label_unicode_offset = parse_int_unsigned_little_endian(volume_label_unicode_offset_bytes)
                 if volume_label_offset == 0x00000014:
@@ -330,23 +853,29 @@ class ShellLink(object):
                 volume_label_unicode_offset_abs = None
 
             if volume_label_offset_abs is not None:
-                self.file.seek(volume_label_offset_abs)
-                volume_label = self.read_null_terminated_string_ascii()
+                volume_label = self.read_string_at(validity, 'volume_label', volume_label_offset_abs, volume_id_end)
+            elif volume_label_unicode_offset_abs is not None:
+                volume_label = self.read_string_at(validity, 'volume_label', volume_label_unicode_offset_abs,
+                                                   volume_id_end, 2)
             else:
-                self.file.seek(volume_label_unicode_offset_abs)
-                volume_label = self.read_null_terminated_string_utf16()
-            parsed_data['volume_label'] = volume_label
+                volume_label = None
+                self.check_bound(validity, 'volume_label_terminated', False, volume_id_offset_abs,
+                                 'VolumeID too small for a unicode volume label')
+            if volume_label is not None:
+                parsed_data['volume_label'] = volume_label
 
             validity['volume_id_within_bounds'] = self.file.tell() <= volume_id_offset_abs + volume_id_size
 
         if local_base_path_offset_abs is not None:
             validity['local_path_no_overlap'] = local_base_path_offset_abs >= self.file.tell()
-            self.file.seek(local_base_path_offset_abs)
-
-            local_base_path = self.read_null_terminated_string_ascii()
-            parsed_data['local_base_path'] = local_base_path
-
-        if common_net_rel_link_offset_abs is not None:
+            local_base_path = self.read_string_at(validity, 'local_base_path', local_base_path_offset_abs,
+                                                  link_info_end)
+            if local_base_path is not None:
+                parsed_data['local_base_path'] = local_base_path
+
+        if common_net_rel_link_offset_abs is not None and self.check_bound(
+                validity, 'net_rel_link_within_link_info', common_net_rel_link_offset_abs + 0x14 <= link_info_end,
+                common_net_rel_link_offset_abs, 'CommonNetworkRelativeLink header runs outside the LinkInfo'):
             validity['net_rel_link_no_overlap'] = common_net_rel_link_offset_abs >= self.file.tell()
             self.file.seek(common_net_rel_link_offset_abs)
 
@@ -354,11 +883,18 @@ class ShellLink(object):
             common_net_rel_link_size = parse_int_unsigned_little_endian(common_net_rel_link_size_bytes)
             validity['sane_common_network_rel_link_size'] = common_net_rel_link_size >= 0x00000014
             parsed_data['common_network_rel_link_size'] = common_net_rel_link_size
+            common_net_rel_link_end = common_net_rel_link_offset_abs + common_net_rel_link_size
+            if not self.check_bound(validity, 'net_rel_link_within_link_info',
+                                    common_net_rel_link_end <= link_info_end, common_net_rel_link_offset_abs,
+                                    'CommonNetworkRelativeLink of %d bytes runs outside the LinkInfo',
+                                    common_net_rel_link_size):
+                common_net_rel_link_end = link_info_end
 
             common_net_rel_link_flags_bytes = self.file.read(4)
             common_net_rel_link_flags = parse_int_unsigned_little_endian(common_net_rel_link_flags_bytes)
-            validity['only_two_net_rel_link_flags'] = not any(attr for i, attr in enumerate(link_info_flags) if i >= 2)
-            parsed_data['common_net_rel_link_flags'] = dict(zip(NET_REL_LINK_FLAGS_NAMES, common_net_rel_link_flags))
+            validity['only_two_net_rel_link_flags'] = not common_net_rel_link_flags >> 2
+            parsed_data['common_net_rel_link_flags'] = parse_flag_dict(common_net_rel_link_flags,
+                                                                       NET_REL_LINK_FLAGS_NAMES)
 
             net_name_offset_bytes = self.file.read(4)
             net_name_offset = parse_int_unsigned_little_endian(net_name_offset_bytes)
@@ -368,7 +904,7 @@ class ShellLink(object):
 
             device_name_offset_bytes = self.file.read(4)
             device_name_offset = parse_int_unsigned_little_endian(device_name_offset_bytes)
-            if not common_net_rel_link_flags[0]:
+            if not common_net_rel_link_flags & 1:
                 validity['null_device_name'] = device_name_offset == 0
                 device_name_offset = None
                 device_name_offset_abs = None
@@ -379,16 +915,16 @@ class ShellLink(object):
 
             network_provider_type_val_bytes = self.file.read(4)
             network_provider_type_val = parse_int_unsigned_little_endian(network_provider_type_val_bytes)
-            if common_net_rel_link_flags[1]:
+            if common_net_rel_link_flags & 2:
                 validity['valid_network_provider_type_val'] = network_provider_type_val in NETWORK_PROVIDER_TYPES
             else:
                 network_provider_type_val = None
             parsed_data['network_provider_type_val'] = network_provider_type_val
 
             if network_provider_type_val is not None:
-                parsed_data['network_provider_type'] = NETWORK_PROVIDER_TYPES[network_provider_type_val]
+                parsed_data['network_provider_type'] = NETWORK_PROVIDER_TYPES.get(network_provider_type_val)
 
-            if net_name_offset >= 0x18:
+            if net_name_offset >= 0x18 and self.file.tell() + 4 <= common_net_rel_link_end:
                 net_name_unicode_offset_bytes = self.file.read(4)
                 net_name_unicode_offset = parse_int_unsigned_little_endian(net_name_unicode_offset_bytes)
                 net_name_unicode_offset_abs = net_name_unicode_offset + common_net_rel_link_offset_abs
@@ -398,8 +934,8 @@ class ShellLink(object):
                 net_name_unicode_offset = None
                 net_name_unicode_offset_abs = None
 
-            if net_name_offset >= 0x1c:
-                validity['no_name_means_no_unicode'] = not common_net_rel_link_flags[0]
+            if net_name_offset >= 0x1c and self.file.tell() + 4 <= common_net_rel_link_end:
+                validity['no_name_means_no_unicode'] = not common_net_rel_link_flags & 1
                 device_name_unicode_offset_bytes = self.file.read(4)
                 device_name_unicode_offset = parse_int_unsigned_little_endian(device_name_unicode_offset_bytes)
                 device_name_unicode_offset_abs = device_name_unicode_offset + common_net_rel_link_offset_abs
@@ -410,92 +946,89 @@ class ShellLink(object):
                 device_name_unicode_offset_abs = None
 
             validity['net_name_no_overlap'] = net_name_offset_abs >= self.file.tell()
-            self.file.seek(net_name_offset_abs)
-            net_name = self.read_null_terminated_string_ascii()
-            parsed_data['net_name'] = net_name
+            net_name = self.read_string_at(validity, 'net_name', net_name_offset_abs, common_net_rel_link_end)
+            if net_name is not None:
+                parsed_data['net_name'] = net_name
 
             if device_name_offset_abs is not None:
                 validity['device_name_no_overlap'] = device_name_offset_abs >= self.file.tell()
-                self.file.seek(device_name_offset_abs)
-                device_name = self.read_null_terminated_string_ascii()
-                parsed_data['device_name'] = device_name
+                device_name = self.read_string_at(validity, 'device_name', device_name_offset_abs,
+                                                  common_net_rel_link_end)
+                if device_name is not None:
+                    parsed_data['device_name'] = device_name
 
             if net_name_unicode_offset_abs is not None:
                 validity['net_name_unicode_no_overlap'] = net_name_unicode_offset_abs >= self.file.tell()
-                self.file.seek(net_name_unicode_offset_abs)
-                net_name_unicode = self.read_null_terminated_string_utf16()
-                parsed_data['net_name_unicode'] = net_name_unicode
+                net_name_unicode = self.read_string_at(validity, 'net_name_unicode', net_name_unicode_offset_abs,
+                                                       common_net_rel_link_end, 2)
+                if net_name_unicode is not None:
+                    parsed_data['net_name_unicode'] = net_name_unicode
 
             if device_name_unicode_offset_abs is not None:
                 validity['device_name_unicode_no_overlap'] = device_name_unicode_offset_abs >= self.file.tell()
-                self.file.seek(device_name_unicode_offset_abs)
-                device_name_unicode = self.read_null_terminated_string_utf16()
-                parsed_data['device_name_unicode'] = device_name_unicode
+                device_name_unicode = self.read_string_at(validity, 'device_name_unicode',
+                                                          device_name_unicode_offset_abs, common_net_rel_link_end, 2)
+                if device_name_unicode is not None:
+                    parsed_data['device_name_unicode'] = device_name_unicode
 
             validity['read_full_net'] = common_net_rel_link_offset_abs + common_net_rel_link_size == self.file.tell()
 
         validity['common_path_suffix_no_overlap'] = common_path_suffix_offset_abs >= self.file.tell()
-        self.file.seek(common_path_suffix_offset_abs)
-        common_path_suffix = self.read_null_terminated_string_ascii()
-        parsed_data['common_path_suffix'] = common_path_suffix
+        common_path_suffix = self.read_string_at(validity, 'common_path_suffix', common_path_suffix_offset_abs,
+                                                 link_info_end)
+        if common_path_suffix is not None:
+            parsed_data['common_path_suffix'] = common_path_suffix
 
         if local_base_path_unicode_offset_abs is not None:
             validity['local_base_path_unicode_no_overlap'] = local_base_path_unicode_offset_abs >= self.file.tell()
-            self.file.seek(local_base_path_unicode_offset_abs)
-            local_base_path_unicode = self.read_null_terminated_string_utf16()
-            parsed_data['local_base_path_unicode'] = local_base_path_unicode
+            local_base_path_unicode = self.read_string_at(validity, 'local_base_path_unicode',
+                                                          local_base_path_unicode_offset_abs, link_info_end, 2)
+            if local_base_path_unicode is not None:
+                parsed_data['local_base_path_unicode'] = local_base_path_unicode
 
         if common_path_suffix_unicode_offset_abs is not None:
             validity['common_path_suf_unicode_no_overlap'] = common_path_suffix_unicode_offset_abs >= self.file.tell()
-            self.file.seek(common_path_suffix_unicode_offset_abs)
-            common_path_suffix_unicode = self.read_null_terminated_string_utf16()
-            parsed_data['common_path_suffix_unicode'] = common_path_suffix_unicode
+            common_path_suffix_unicode = self.read_string_at(validity, 'common_path_suffix_unicode',
+                                                             common_path_suffix_unicode_offset_abs, link_info_end, 2)
+            if common_path_suffix_unicode is not None:
+                parsed_data['common_path_suffix_unicode'] = common_path_suffix_unicode
 
         validity['read_entire_link_info'] = link_info_size + link_info_start_byte == self.file.tell()
 
     def parse_string_struct(self):
         string_len_bytes = self.file.read(2)
         string_len = parse_int_unsigned_little_endian(string_len_bytes)
-        if self.info['ShellLinkHeader']['LinkFlags']['IsUnicode']:
-            out_string = b'\xff\xfe' + self.file.read(string_len * 2)
-            out_string = out_string.decode('utf16')
+        if self.has_flag('IsUnicode'):
+            out_string = b'\xff\xfe' + to_bytes(self.file.read(string_len * 2))
+            out_string = out_string.decode('utf16', 'replace')
         else:
-            out_string = self.file.read(string_len)
+            out_string = to_bytes(self.file.read(string_len))
         return out_string
 
     def parse_string_data(self):
         parsed_data = self.info.setdefault('StringData', {})
         validity = parsed_data.setdefault('validity_checks', {})
 
-        if self.info['ShellLinkHeader']['LinkFlags']['HasName']:
-            parsed_data['name_string'] = self.parse_string_struct()
-
-        if self.info['ShellLinkHeader']['LinkFlags']['HasRelativePath']:
-            parsed_data['relative_path'] = self.parse_string_struct()
-
-        if self.info['ShellLinkHeader']['LinkFlags']['HasWorkingDir']:
-            parsed_data['working_dir'] = self.parse_string_struct()
-
-        if self.info['ShellLinkHeader']['LinkFlags']['HasArguments']:
-            parsed_data['command_line_arguments'] = self.parse_string_struct()
-
-        if self.info['ShellLinkHeader']['LinkFlags']['HasIconLocation']:
-            parsed_data['icon_location'] = self.parse_string_struct()
+        for flag_name, field_name in STRING_DATA_FIELDS:
+            if self.has_flag(flag_name):
+                parsed_data[field_name] = self.parse_string_struct()
 
-    def parse_console_data(self):
-        parsed_data = self.info.setdefault('ExtraData', {})
-        validity = parsed_data.setdefault('validity_checks', {})
+    def parse_console_data(self, parsed_data, block_end):
+        validity = parsed_data['validity_checks']
+        validity['console_block_size'] = block_end - parsed_data['block_offset'] == 0x000000CC
 
         fill_attributes_bytes = self.file.read(2)
         fill_attributes_val = parse_int_unsigned_little_endian(fill_attributes_bytes)
         parsed_data['fill_attributes_val'] = fill_attributes_val
-        fill_attributes = [fill_info for fill_key, fill_info in FILL_ATTRIBUTES if fill_attributes_val and fill_key]
+        fill_attributes = [fill_info for fill_key, fill_info in sorted(FILL_ATTRIBUTES.items())
+                           if fill_attributes_val & fill_key]
         parsed_data['fill_attributes'] = fill_attributes
 
         popup_fill_attributes_bytes = self.file.read(2)
         popup_fill_attributes_val = parse_int_unsigned_little_endian(popup_fill_attributes_bytes)
         parsed_data['popup_fill_attributes_val'] = popup_fill_attributes_val
-        fill_attributes = [fill_info for fill_key, fill_info in FILL_ATTRIBUTES if fill_attributes_val and fill_key]
+        fill_attributes = [fill_info for fill_key, fill_info in sorted(FILL_ATTRIBUTES.items())
+                           if popup_fill_attributes_val & fill_key]
         parsed_data['popup_fill_attributes'] = fill_attributes
 
         screen_buffer_size_x_bytes = self.file.read(2)
@@ -532,20 +1065,15 @@ class ShellLink(object):
         font_family_bytes = self.file.read(4)
         font_family_val = parse_int_unsigned_little_endian(font_family_bytes)
         validity['font_family_exists'] = font_family_val in FONT_FAMILY
-        parsed_data['font_family'] = FONT_FAMILY[font_family_val]
+        parsed_data['font_family'] = FONT_FAMILY.get(font_family_val)
 
         font_weight_bytes = self.file.read(4)
         font_weight_val = parse_int_unsigned_little_endian(font_weight_bytes)
-        font_weight = 'BOLD' if font_weight_val >= 700 else 'REGULAR'
         parsed_data['font_weight_val'] = font_weight_val
+        parsed_data['font_weight'] = 'BOLD' if font_weight_val >= 700 else 'REGULAR'
 
         font_name_bytes = self.file.read(64)
-        font_name = (b'\xfe\xff' + font_name_bytes).decode('utf16')
-        parsed_data['font_name'] = font_name
-        # idk whats the byte order for this so try both for now
-        font_name_alt = (b'\xff\xfe' + font_name_bytes).decode('utf16')
-        parsed_data['font_name_alt'] = font_name_alt
-        parsed_data['font_name_helptext'] = 'idk whats the byte order for this so try both for now'
+        parsed_data['font_name'] = decode_fixed_utf16(font_name_bytes)
 
         cursor_size_bytes = self.file.read(4)
         cursor_size_val = parse_int_unsigned_little_endian(cursor_size_bytes)
@@ -587,57 +1115,174 @@ class ShellLink(object):
         parsed_data['auto_position_val'] = auto_position_val
         parsed_data['auto_position_enabled'] = auto_position
 
-        raise NotImplementedError
-
         history_buffer_size_bytes = self.file.read(4)
         history_buffer_size = parse_int_unsigned_little_endian(history_buffer_size_bytes)
+        parsed_data['history_buffer_size'] = history_buffer_size
 
         num_of_history_buffers_bytes = self.file.read(4)
         num_of_history_buffers = parse_int_unsigned_little_endian(num_of_history_buffers_bytes)
+        parsed_data['num_of_history_buffers'] = num_of_history_buffers
 
         history_no_dup_bytes = self.file.read(4)
         history_no_dup = parse_int_unsigned_little_endian(history_no_dup_bytes)
+        parsed_data['history_no_dup_val'] = history_no_dup
+        parsed_data['history_duplicates_allowed'] = bool(history_no_dup)
 
         color_table_bytes = self.file.read(64)
-        color_table = parse_int_unsigned_little_endian(color_table_bytes)
+        color_table = list(struct.unpack('<16I', color_table_bytes))
+        parsed_data['color_table'] = color_table
 
-    def parse_extra_data(self):
-        block_size_bytes = self.file.read(4)
-        block_size = parse_int_unsigned_little_endian(block_size_bytes)
-        block_signature_bytes = self.file.read(4)
-        block_signature = parse_int_unsigned_little_endian(block_signature_bytes)
+    def parse_console_fe_data(self, parsed_data, block_end):
+        validity = parsed_data['validity_checks']
+        validity['console_fe_block_size'] = block_end - parsed_data['block_offset'] == 0x0000000C
 
-        print(hex(block_signature))
-        if block_signature == 0xA0000002:
-            self.parse_console_data()
+        code_page_bytes = self.file.read(4)
+        parsed_data['code_page'] = parse_int_unsigned_little_endian(code_page_bytes)
 
-        raise NotImplementedError
+    def parse_env_string_data(self, parsed_data, block_end):
+        # Darwin, EnvironmentVariable and IconEnvironment blocks share this layout
+        validity = parsed_data['validity_checks']
+        validity['env_string_block_size'] = block_end - parsed_data['block_offset'] == 0x00000314
 
-    def parse_lnk(self):
-        # parse SHELL_LINK_HEADER
-        self.parse_header()
+        target_ansi_bytes = self.file.read(260)
+        parsed_data['target_ansi'] = decode_fixed_ascii(target_ansi_bytes)
+
+        # unicode target is optional
+        if self.file.tell() + 520 <= block_end:
+            target_unicode_bytes = self.file.read(520)
+            parsed_data['target_unicode'] = decode_fixed_utf16(target_unicode_bytes)
 
-        # parse LINK_TARGET_IDLIST
-        if self.info['ShellLinkHeader']['LinkFlags']['HasLinkTargetIDList']:
-            self.parse_id_list()
+    def parse_known_folder_data(self, parsed_data, block_end):
+        validity = parsed_data['validity_checks']
+        validity['known_folder_block_size'] = block_end - parsed_data['block_offset'] == 0x0000001C
 
-        # parse LINK_INFO
-        if not self.info['ShellLinkHeader']['LinkFlags']['ForceNoLinkInfo']:
-            self.parse_link_info()
+        known_folder_id_bytes = self.file.read(16)
+        parsed_data['known_folder_id'] = format_guid(known_folder_id_bytes)
 
-        # parse STRING_DATA
-        self.parse_string_data()
+        offset_bytes = self.file.read(4)
+        parsed_data['offset'] = parse_int_unsigned_little_endian(offset_bytes)
 
-        # parse *EXTRA_DATA
-        self.parse_extra_data()
+    def parse_property_store_data(self, parsed_data, block_end):
+        validity = parsed_data['validity_checks']
+        validity['property_store_block_size'] = block_end - parsed_data['block_offset'] >= 0x0000000C
 
-        # done!
+        # left serialized, just note where it is (see ShellLink.property_store)
+        parsed_data['property_store_offset'] = self.file.tell()
+        parsed_data['property_store_size'] = block_end - self.file.tell()
+
+    def parse_shim_data(self, parsed_data, block_end):
+        validity = parsed_data['validity_checks']
+        validity['shim_block_size'] = block_end - parsed_data['block_offset'] >= 0x00000088
+
+        layer_name_bytes = self.file.read(block_end - self.file.tell())
+        parsed_data['layer_name'] = decode_fixed_utf16(layer_name_bytes)
+
+    def parse_special_folder_data(self, parsed_data, block_end):
+        validity = parsed_data['validity_checks']
+        validity['special_folder_block_size'] = block_end - parsed_data['block_offset'] == 0x00000010
+
+        special_folder_id_bytes = self.file.read(4)
+        parsed_data['special_folder_id'] = parse_int_unsigned_little_endian(special_folder_id_bytes)
+
+        offset_bytes = self.file.read(4)
+        parsed_data['offset'] = parse_int_unsigned_little_endian(offset_bytes)
+
+    def parse_tracker_data(self, parsed_data, block_end):
+        validity = parsed_data['validity_checks']
+        validity['tracker_block_size'] = block_end - parsed_data['block_offset'] == 0x00000060
+
+        length_bytes = self.file.read(4)
+        length = parse_int_unsigned_little_endian(length_bytes)
+        validity['sane_tracker_length'] = length >= 0x00000058
+
+        version_bytes = self.file.read(4)
+        version = parse_int_unsigned_little_endian(version_bytes)
+        validity['tracker_version_zero'] = version == 0
+
+        machine_id_bytes = self.file.read(block_end - self.file.tell() - 64)
+        parsed_data['machine_id'] = decode_fixed_ascii(machine_id_bytes)
+
+        droid_bytes = self.file.read(32)
+        parsed_data['droid_volume_id'] = format_guid(droid_bytes[:16])
+        parsed_data['droid_file_id'] = format_guid(droid_bytes[16:])
+
+        droid_birth_bytes = self.file.read(32)
+        parsed_data['droid_birth_volume_id'] = format_guid(droid_birth_bytes[:16])
+        parsed_data['droid_birth_file_id'] = format_guid(droid_birth_bytes[16:])
+
+    def parse_vista_and_above_id_list_data(self, parsed_data, block_end):
+        validity = parsed_data['validity_checks']
+        validity['vista_id_list_block_size'] = block_end - parsed_data['block_offset'] >= 0x0000000A
+
+        item_ids = parsed_data['item_ids'] = []
+        item_id_size = None
+        while self.file.tell() + 2 <= block_end:
+            item_id_size_bytes = self.file.read(2)
+            item_id_size = parse_int_unsigned_little_endian(item_id_size_bytes)
+            if item_id_size < 2 or self.file.tell() + item_id_size - 2 > block_end:
+                break  # terminal id (or garbage)
+            item_ids.append(to_bytes(self.file.read(item_id_size - 2)))
+        validity['terminal_id_zeroes'] = item_id_size == 0
+
+    def parse_extra_data(self):
+        parsed_data = self.info.setdefault('ExtraData', {})
+        validity = parsed_data.setdefault('validity_checks', {})
+        block_names = parsed_data.setdefault('blocks', [])
+
+        while True:
+            block_start = self.file.tell()
+            if not self.check_bound(validity, 'terminal_block', block_start + 4 <= self.file.size, block_start,
+                                    'ExtraData ends without a TerminalBlock'):
+                break
+
+            block_size_bytes = self.file.read(4)
+            block_size = parse_int_unsigned_little_endian(block_size_bytes)
+            if block_size < 0x00000004:
+                validity['terminal_block'] = True
+                break
+            if not self.check_bound(validity, 'sane_block_size',
+                                    8 <= block_size and block_start + block_size <= self.file.size, block_start,
+                                    'ExtraData block of %d bytes runs outside the file', block_size):
+                break
+
+            block_signature_bytes = self.file.read(4)
+            block_signature = parse_int_unsigned_little_endian(block_signature_bytes)
+            block_name = EXTRA_DATA_BLOCKS.get(block_signature, '0x%08X' % block_signature)
+            block_names.append(block_name)
+
+            # only blocks that were asked for are kept, everything else is skipped by its size
+            # blocks lnk_writer can't encode (unknown ones, PropertyStoreDataBlock) hold their raw bytes (after
+            # the size and signature), so they can be written back unchanged
+            if self.extra_data_blocks is None or block_name in self.extra_data_blocks:
+                block_data = {'block_offset': block_start, 'block_size': block_size, 'validity_checks': {}}
+                if block_signature not in self.EXTRA_DATA_PARSERS or block_signature in self.EXTRA_DATA_RAW_BLOCKS:
+                    block_data['raw_data'] = self.file.peek(block_start + 8, block_start + block_size)
+                if block_signature not in self.EXTRA_DATA_PARSERS:
+                    block_data['block_signature'] = block_signature
+                    parsed_data[block_name] = block_data
+                elif self.check_bound(validity, 'sane_block_size',
+                                      block_size >= self.EXTRA_DATA_MIN_SIZES.get(block_signature, 8), block_start,
+                                      '%s of %d bytes is too small to decode', block_name, block_size):
+                    getattr(self, self.EXTRA_DATA_PARSERS[block_signature])(block_data, block_start + block_size)
+                    parsed_data[block_name] = block_data
+
+            self.file.seek(block_start + block_size)
+
+    def parse_lnk(self):
+        # parse SHELL_LINK_HEADER, LINK_TARGET_IDLIST, LINK_INFO, STRING_DATA and *EXTRA_DATA
+        self.parse_all()
+        self.finish_stats()
+
+    def dump(self):
+        # debugging aid, use lnk_export for anything machine-readable
         pprint.pprint(self.info)
 
         # check read bytes
-        print(list(enumerate(i for j in self.file.seen for i in j))[::-1])
+        if self.file.coverage is not None:
+            print(self.file.coverage.unread_ranges())
 
 
 if __name__ == '__main__':
-    ShellLink(r'C:\Users\avery\Desktop\dir.lnk')
-    ShellLink(r'C:\Users\avery\AppData\Roaming\Microsoft\Windows\Start Menu\Programs\System Tools\Command Prompt.lnk')
+    import lnk_export
+
+    lnk_export.main()
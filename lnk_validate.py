@@ -0,0 +1,269 @@
+import collections
+import functools
+import io
+
+from lnk_scan import imap_paths
+from lnk_scan import iter_lnk_paths
+from lnk_tool import LINK_INFO_HEADER
+from lnk_tool import NET_REL_LINK_HEADER
+from lnk_tool import SHELL_LINK_HEADER
+from lnk_tool import UINT16
+from lnk_tool import UINT32
+from lnk_tool import VOLUME_ID_HEADER
+from lnk_tool import ShellLink
+from shell_link_const import *
+
+# structural validation only: every size, offset, flag and terminator is checked straight off the bytes,
+# but no value (timestamp, string, flag dict, ...) is ever decoded
+# reason codes reuse the validity_checks names of the full parse wherever the check is the same
+
+ValidationResult = collections.namedtuple('ValidationResult', ['path', 'valid', 'reasons'])
+
+FILE_ATTRS_NORMAL = FILE_ATTRS_FLAGS['FILE_ATTRIBUTE_NORMAL']
+
+
+class StopValidation(Exception):
+    pass
+
+
+class Validator(object):
+    def __init__(self, data, fail_fast=False):
+        self.data = data
+        self.size = len(data)
+        self.fail_fast = fail_fast
+        self.reasons = []
+        self.end = None  # just past the TerminalBlock, once the ExtraData chain has been walked
+
+    def check(self, passed, reason):
+        if not passed:
+            self.reasons.append(reason)
+            if self.fail_fast:
+                raise StopValidation()
+        return passed
+
+    def u16(self, pos):
+        return UINT16.unpack_from(self.data, pos)[0]
+
+    def u32(self, pos):
+        return UINT32.unpack_from(self.data, pos)[0]
+
+    def terminated(self, start, end, char_size=1):
+        # is there a (char_size aligned) NULL terminator in data[start:end]
+        terminator = b'\x00' * char_size
+        term_pos = self.data.find(terminator, start, end)
+        while term_pos > 0 and (term_pos - start) % char_size:
+            term_pos = self.data.find(terminator, term_pos + 1, end)
+        return term_pos >= 0
+
+    def string_in(self, start, end, char_size, reason):
+        return self.check(start < end and self.terminated(start, end, char_size), reason)
+
+    def validate(self):
+        try:
+            if self.check(self.size >= HEADER_SIZE, 'read_0x4c_byte_header'):
+                link_flags = self.validate_header()
+                pos = HEADER_SIZE
+                if link_flags & LINK_FLAGS['HasLinkTargetIDList']:
+                    pos = self.validate_id_list(pos)
+                if pos is not None and link_flags & LINK_FLAGS['HasLinkInfo']:
+                    pos = self.validate_link_info(pos)
+                if pos is not None:
+                    pos = self.validate_string_data(pos, link_flags)
+                if pos is not None:
+                    self.validate_extra_data(pos)
+        except StopValidation:
+            pass
+        return self.reasons
+
+    def validate_header(self):
+        (header_size, clsid, link_flags, file_attrs, _, _, _, _, _, _, hot_key, reserved_1, reserved_2,
+         reserved_3) = SHELL_LINK_HEADER.unpack_from(self.data, 0)
+        self.check(header_size == HEADER_SIZE, 'header_size')
+        self.check(clsid == CLSID, 'CLSID')
+        self.check(not link_flags >> len(LINK_FLAGS_NAMES), 'link_flags_tail')
+        self.check(not file_attrs >> len(FILE_ATTRS_FLAGS_NAMES), 'file_attrs_flags_tail')
+        self.check(not file_attrs & FILE_ATTRS_FLAGS['Reserved1'], 'file_attrs_flags_reserved_1')
+        self.check(not file_attrs & FILE_ATTRS_FLAGS['Reserved2'], 'file_attrs_flags_reserved_2')
+        if file_attrs & FILE_ATTRS_NORMAL:
+            self.check(not file_attrs & ~FILE_ATTRS_NORMAL, 'normal_file_attrs_are_blank')
+        if hot_key:
+            self.check(hot_key & 0xFF in HOT_KEY_LOW and hot_key >> 8, 'sane_hotkey')
+        self.check(reserved_1 == 0, 'reserved_1')
+        self.check(reserved_2 == 0, 'reserved_2')
+        self.check(reserved_3 == 0, 'reserved_3')
+        return link_flags
+
+    def validate_id_list(self, pos):
+        if not self.check(pos + 2 <= self.size, 'read_complete_id_list'):
+            return None
+        id_list_size = self.u16(pos)
+        self.check(id_list_size > 2, 'sane_id_list_size')
+        id_list_end = pos + 2 + id_list_size
+        if not self.check(id_list_end <= self.size, 'read_complete_id_list'):
+            return None
+
+        pos += 2
+        while pos + 2 <= id_list_end:
+            item_id_size = self.u16(pos)
+            if item_id_size == 0:
+                break
+            if not self.check(item_id_size >= 2 and pos + item_id_size + 2 <= id_list_end, 'id_list_byte_count_okay'):
+                return id_list_end
+            pos += item_id_size
+        self.check(pos + 2 == id_list_end, 'id_list_byte_count_okay')
+        self.check(pos + 2 <= id_list_end and self.u16(pos) == 0, 'terminal_id_zeroes')
+        return id_list_end
+
+    def validate_link_info(self, start):
+        if not self.check(start + LINK_INFO_HEADER.size <= self.size, 'read_entire_link_info'):
+            return None
+        (link_info_size, header_size, link_info_flags, volume_id_offset, local_base_path_offset,
+         net_rel_link_offset, common_path_suffix_offset) = LINK_INFO_HEADER.unpack_from(self.data, start)
+        end = start + link_info_size
+        if not self.check(end <= self.size and link_info_size >= LINK_INFO_HEADER.size, 'read_entire_link_info'):
+            return None
+        if not self.check(header_size in (0x1c, 0x20, 0x24) and header_size <= link_info_size,
+                          'sane_link_info_header_size'):
+            return end
+        self.check(not link_info_flags >> 2, 'only_two_info_flags')
+
+        local_base_path_unicode_offset = self.u32(start + 0x1c) if header_size >= 0x20 else None
+        common_path_suffix_unicode_offset = self.u32(start + 0x20) if header_size >= 0x24 else None
+
+        def in_body(offset):
+            # offsets must land after the LinkInfo header and inside the LinkInfo
+            return header_size <= offset < link_info_size
+
+        if link_info_flags & 1:
+            if self.check(in_body(volume_id_offset), 'volume_id_no_overlap'):
+                self.validate_volume_id(start + volume_id_offset, end)
+            if self.check(in_body(local_base_path_offset), 'local_path_no_overlap'):
+                self.string_in(start + local_base_path_offset, end, 1, 'local_base_path_terminated')
+            if local_base_path_unicode_offset is not None:
+                if self.check(in_body(local_base_path_unicode_offset), 'local_base_path_unicode_no_overlap'):
+                    self.string_in(start + local_base_path_unicode_offset, end, 2,
+                                   'local_base_path_unicode_terminated')
+        else:
+            self.check(volume_id_offset == 0, 'null_volume_id')
+            self.check(local_base_path_offset == 0, 'null_local_path')
+            if local_base_path_unicode_offset is not None:
+                self.check(local_base_path_unicode_offset == 0, 'null_local_path_unicode')
+
+        if link_info_flags & 2:
+            if self.check(in_body(net_rel_link_offset), 'net_rel_link_no_overlap'):
+                self.validate_net_rel_link(start + net_rel_link_offset, end)
+        else:
+            self.check(net_rel_link_offset == 0, 'null_net_rel_link')
+
+        if self.check(in_body(common_path_suffix_offset), 'common_path_suffix_no_overlap'):
+            self.string_in(start + common_path_suffix_offset, end, 1, 'common_path_suffix_terminated')
+        if common_path_suffix_unicode_offset is not None:
+            if self.check(in_body(common_path_suffix_unicode_offset), 'common_path_suf_unicode_no_overlap'):
+                self.string_in(start + common_path_suffix_unicode_offset, end, 2,
+                               'common_path_suffix_unicode_terminated')
+        return end
+
+    def validate_volume_id(self, start, link_info_end):
+        if not self.check(start + VOLUME_ID_HEADER.size <= link_info_end, 'volume_id_within_bounds'):
+            return
+        volume_id_size, drive_type, _, volume_label_offset = VOLUME_ID_HEADER.unpack_from(self.data, start)
+        self.check(volume_id_size >= 0x10, 'sane_volume_id_size')
+        self.check(drive_type in DRIVE_TYPES, 'sane_drive_type')
+        end = start + volume_id_size
+        if not self.check(end <= link_info_end, 'volume_id_within_bounds'):
+            return
+        if volume_label_offset == 0x14:
+            if self.check(volume_id_size >= 0x14, 'sane_volume_id_size'):
+                self.string_in(start + self.u32(start + 0x10), end, 2, 'volume_label_terminated')
+        else:
+            self.string_in(start + volume_label_offset, end, 1, 'volume_label_terminated')
+
+    def validate_net_rel_link(self, start, link_info_end):
+        if not self.check(start + NET_REL_LINK_HEADER.size <= link_info_end, 'sane_common_network_rel_link_size'):
+            return
+        (net_rel_link_size, net_flags, net_name_offset, device_name_offset,
+         network_provider_type) = NET_REL_LINK_HEADER.unpack_from(self.data, start)
+        end = start + net_rel_link_size
+        if not self.check(net_rel_link_size >= 0x14 and end <= link_info_end, 'sane_common_network_rel_link_size'):
+            return
+        self.check(not net_flags >> 2, 'only_two_net_rel_link_flags')
+        if net_flags & 2:
+            self.check(network_provider_type in NETWORK_PROVIDER_TYPES, 'valid_network_provider_type_val')
+
+        # like the parser: a NetNameOffset past 0x14 means the unicode offsets follow, each one only if it fits
+        header_end = NET_REL_LINK_HEADER.size
+        net_name_unicode_offset = device_name_unicode_offset = None
+        if net_name_offset >= 0x18 and header_end + 4 <= net_rel_link_size:
+            net_name_unicode_offset = self.u32(start + header_end)
+            header_end += 4
+            if net_name_offset >= 0x1c and header_end + 4 <= net_rel_link_size:
+                device_name_unicode_offset = self.u32(start + header_end)
+                header_end += 4
+
+        if self.check(header_end <= net_name_offset < net_rel_link_size, 'net_name_no_overlap'):
+            self.string_in(start + net_name_offset, end, 1, 'net_name_terminated')
+        if net_flags & 1:
+            if self.check(header_end <= device_name_offset < net_rel_link_size, 'device_name_no_overlap'):
+                self.string_in(start + device_name_offset, end, 1, 'device_name_terminated')
+        else:
+            self.check(device_name_offset == 0, 'null_device_name')
+
+        if net_name_unicode_offset is not None:
+            if self.check(header_end <= net_name_unicode_offset < net_rel_link_size, 'net_name_unicode_no_overlap'):
+                self.string_in(start + net_name_unicode_offset, end, 2, 'net_name_unicode_terminated')
+        if net_flags & 1 and device_name_unicode_offset is not None:
+            if self.check(header_end <= device_name_unicode_offset < net_rel_link_size,
+                          'device_name_unicode_no_overlap'):
+                self.string_in(start + device_name_unicode_offset, end, 2, 'device_name_unicode_terminated')
+
+    def validate_string_data(self, pos, link_flags):
+        char_size = 2 if link_flags & LINK_FLAGS['IsUnicode'] else 1
+        for flag_name, _ in STRING_DATA_FIELDS:
+            if link_flags & LINK_FLAGS[flag_name]:
+                if not self.check(pos + 2 <= self.size and pos + 2 + char_size * self.u16(pos) <= self.size,
+                                  'string_data_within_bounds'):
+                    return None
+                pos += 2 + char_size * self.u16(pos)
+        return pos
+
+    def validate_extra_data(self, pos):
+        while True:
+            if not self.check(pos + 4 <= self.size, 'terminal_block'):
+                return
+            block_size = self.u32(pos)
+            if block_size < 4:
+                self.end = pos + 4
+                return
+            if not self.check(block_size >= 8 and pos + block_size <= self.size, 'sane_block_size'):
+                return
+            # blocks the parser decodes have a fixed part it needs, a strict parse rejects anything smaller
+            self.check(block_size >= ShellLink.EXTRA_DATA_MIN_SIZES.get(self.u32(pos + 4), 8), 'sane_block_size')
+            pos += block_size
+
+
+def validate_bytes(data, fail_fast=False):
+    """
+    structural checks only, returns the list of failed reason codes (empty if the link is well-formed)
+    with fail_fast, stops at the first failure
+    """
+    return Validator(data, fail_fast).validate()
+
+
+def validate_path(path, fail_fast=False):
+    # never raises, an unreadable file fails with reason 'unreadable'
+    try:
+        with io.open(path, mode='rb') as f:
+            data = f.read()
+    except (IOError, OSError):
+        return ValidationResult(path, False, ['unreadable'])
+    reasons = validate_bytes(data, fail_fast)
+    return ValidationResult(path, not reasons, reasons)
+
+
+def validate(roots, processes=None, chunk_size=256, fail_fast=False, max_pending=None):
+    """
+    recursively find and validate every .lnk under the given roots, spread across a process pool
+    yields ValidationResult(path, valid, reasons) in completion order
+    """
+    worker = functools.partial(validate_path, fail_fast=fail_fast)
+    return imap_paths(worker, iter_lnk_paths(roots), processes, chunk_size, max_pending)
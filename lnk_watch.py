@@ -0,0 +1,72 @@
+import collections
+import io
+import os
+import pickle
+
+from lnk_scan import iter_lnk_paths
+from lnk_scan import scan
+
+# incremental rescans of watched directories: every pass still walks and stats the tree,
+# but only shortcuts that appeared or changed since the previous pass are parsed again
+
+ChangeEvent = collections.namedtuple('ChangeEvent', ['kind', 'path', 'result'])  # kind: added/modified/deleted
+
+ADDED = 'added'
+MODIFIED = 'modified'
+DELETED = 'deleted'
+
+
+def file_state(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime, stat.st_ino
+
+
+class IncrementalScanner(object):
+    """
+    polls a set of roots, keeping a (size, mtime, inode) snapshot of every .lnk seen on the last pass
+    each poll() yields ChangeEvents: added/modified with a fresh lnk_scan.ScanResult, deleted with None
+    """
+
+    def __init__(self, roots, processes=1, chunk_size=64, sections=None, timestamps='raw'):
+        if isinstance(roots, (str, bytes, type(u''))):
+            roots = [roots]
+        self.roots = list(roots)
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.sections = sections
+        self.timestamps = timestamps
+        self.snapshot = {}  # path -> (size, mtime, inode)
+
+    def poll(self):
+        current = {}
+        for path in iter_lnk_paths(self.roots):
+            try:
+                current[path] = file_state(path)
+            except OSError:
+                pass  # deleted between the walk and the stat, it'll show up as deleted next pass if it was known
+
+        changed = {}
+        for path, state in current.items():
+            previous = self.snapshot.get(path)
+            if previous != state:
+                changed[path] = ADDED if previous is None else MODIFIED
+        deleted = [path for path in self.snapshot if path not in current]
+
+        for result in scan(sorted(changed), self.processes, self.chunk_size, self.sections,
+                           timestamps=self.timestamps):
+            yield ChangeEvent(changed[result.path], result.path, result)
+        for path in sorted(deleted):
+            yield ChangeEvent(DELETED, path, None)
+
+        # only advance once every event has been handed out, so an abandoned poll is repeated in full
+        self.snapshot = current
+
+    def save(self, snapshot_path):
+        with io.open(snapshot_path, mode='wb') as f:
+            pickle.dump(self.snapshot, f, 2)
+
+    def load(self, snapshot_path):
+        # resume from an earlier process's snapshot instead of reporting every file as added
+        with io.open(snapshot_path, mode='rb') as f:
+            self.snapshot = pickle.load(f)
+        return self
@@ -0,0 +1,487 @@
+import datetime
+import io
+import struct
+import time
+import uuid
+
+from lnk_model import HeaderRecord
+from lnk_model import IDListRecord
+from lnk_model import LinkInfoRecord
+from lnk_model import ShellLinkRecord
+from lnk_model import StringDataRecord
+from lnk_tool import LINK_INFO_HEADER
+from lnk_tool import NET_REL_LINK_HEADER
+from lnk_tool import SHELL_LINK_HEADER
+from lnk_tool import UINT16
+from lnk_tool import UINT32
+from lnk_tool import VOLUME_ID_HEADER
+from shell_link_const import *
+
+# serialize a ShellLinkRecord (see lnk_model) back into MS-SHLLINK bytes, without COM
+# every section is laid out as a list of parts (raw bytes, or a (struct, values) pair to pack),
+# so the total size is known before anything is written and the file is packed into one preallocated buffer
+
+BLOCK_HEADER = struct.Struct('<II')
+CONSOLE_DATA = struct.Struct('<HHhhhhhhIIIII64sIIIIIIII16I')
+
+SHOW_COMMANDS = dict((show_name, show_val) for show_val, show_name in SHOW_OPTIONS.items())
+HOT_KEY_LOW_CODES = dict((key_name, key_code) for key_code, key_name in HOT_KEY_LOW.items())
+HOT_KEY_HIGH_CODES = dict((modifier_name, mask) for mask, modifier_name in HOT_KEY_HIGH.items())
+FONT_FAMILY_CODES = dict((family_name, family_val) for family_val, family_name in FONT_FAMILY.items())
+EXTRA_DATA_SIGNATURES = dict((block_name, signature) for signature, block_name in EXTRA_DATA_BLOCKS.items())
+
+# ExtraData blocks whose presence is announced by a LinkFlags bit
+EXTRA_DATA_FLAGS = {
+    'EnvironmentVariableDataBlock': 'HasExpString',
+    'DarwinDataBlock': 'HasDarwinID',
+    'IconEnvironmentDataBlock': 'HasExpIcon',
+    'ShimDataBlock': 'RunWithShimLayer',
+}
+
+# ShellLinkRecord slot -> record class, for the sections a template can change
+SECTION_RECORDS = {
+    'header': HeaderRecord,
+    'id_list': IDListRecord,
+    'link_info': LinkInfoRecord,
+    'string_data': StringDataRecord,
+}
+
+# the fields the encoder reads, per section; the rest (sizes, offsets, structure flags, names looked up from
+# codes) is recomputed from these on every encode, so changing it in a template would silently do nothing
+ENCODED_FIELDS = {
+    'header': HeaderRecord.FIELDS,
+    'id_list': ('item_ids',),
+    'link_info': ('drive_type_key', 'drive_serial_number', 'volume_label', 'local_base_path',
+                  'local_base_path_unicode', 'net_name', 'net_name_unicode', 'device_name', 'device_name_unicode',
+                  'network_provider_type_val', 'common_path_suffix', 'common_path_suffix_unicode'),
+    'string_data': StringDataRecord.FIELDS,
+}
+
+# the section each encoded field lives in
+FIELD_SECTIONS = dict((field, slot) for slot, fields in ENCODED_FIELDS.items() for field in fields)
+
+
+def datetime_to_filetime(value):
+    # inverse of lnk_tool.filetime_to_datetime, which gives naive local times
+    if value is None:
+        return 0
+    if not isinstance(value, datetime.datetime):
+        return value  # already a FILETIME
+    unix_seconds = int(time.mktime(value.timetuple()))
+    return FILETIME_UNIX_EPOCH + unix_seconds * FILETIME_TICKS_PER_SECOND + value.microsecond * 10
+
+
+def encode_ascii(value, codepage):
+    if isinstance(value, bytes):
+        return value
+    return value.encode(codepage)
+
+
+def encode_utf16(value):
+    return value.encode('utf-16-le')
+
+
+def fixed(value, size):
+    # NULL-padded fixed-size field, always leaving room for a terminator
+    if len(value) >= size:
+        raise ValueError('%d byte value does not fit in a %d byte field' % (len(value), size))
+    return value + b'\x00' * (size - len(value))
+
+
+def guid_bytes(guid):
+    return uuid.UUID(guid.strip('{}')).bytes_le
+
+
+def parts_size(parts):
+    return sum(len(part) if isinstance(part, bytes) else part[0].size for part in parts)
+
+
+def pack_parts(parts, buf, pos):
+    for part in parts:
+        if isinstance(part, bytes):
+            buf[pos:pos + len(part)] = part
+            pos += len(part)
+        else:
+            part[0].pack_into(buf, pos, *part[1])
+            pos += part[0].size
+    return pos
+
+
+def encode_hotkey(hotkey):
+    if not hotkey:
+        return 0
+    modifiers = sum(HOT_KEY_HIGH_CODES[modifier_name] for modifier_name in hotkey[:-1])
+    return modifiers << 8 | HOT_KEY_LOW_CODES[hotkey[-1]]
+
+
+def link_flags_for(record):
+    # LinkFlags as stored, with every "this structure is present" bit made to agree with what is being written
+    header = record.header
+    if header is not None and header.LinkFlags is not None:
+        link_flags = header.LinkFlags
+    else:
+        link_flags = LINK_FLAGS['IsUnicode']
+
+    present = {
+        'HasLinkTargetIDList': record.id_list is not None,
+        'HasLinkInfo': record.link_info is not None,
+    }
+    for flag_name, field_name in STRING_DATA_FIELDS:
+        present[flag_name] = record.string_data is not None and getattr(record.string_data, field_name) is not None
+    blocks = record.extra_data.blocks if record.extra_data is not None else ()
+    for block_name, flag_name in EXTRA_DATA_FLAGS.items():
+        present[flag_name] = block_name in blocks
+
+    for flag_name, is_present in present.items():
+        if is_present:
+            link_flags |= LINK_FLAGS[flag_name]
+        else:
+            link_flags &= ~LINK_FLAGS[flag_name]
+    return link_flags
+
+
+def header_parts(header, link_flags):
+    if header is None:
+        header = HeaderRecord.from_dict({})
+    show_command = header.show_command
+    return [(SHELL_LINK_HEADER, (
+        HEADER_SIZE,
+        CLSID,
+        link_flags,
+        header.file_attrs or 0,
+        datetime_to_filetime(header.create_time),
+        datetime_to_filetime(header.access_time),
+        datetime_to_filetime(header.write_time),
+        header.file_size or 0,
+        (header.icon_index or 0) & 0xFFFFFFFF,
+        SHOW_COMMANDS.get(show_command, show_command) if show_command is not None else 1,
+        encode_hotkey(header.hotkey),
+        0, 0, 0,
+    ))]
+
+
+def item_id_parts(item_ids):
+    parts = []
+    for item_id in item_ids:
+        parts.append((UINT16, (len(item_id) + 2,)))
+        parts.append(bytes(item_id))
+    parts.append((UINT16, (0,)))
+    return parts
+
+
+def id_list_parts(id_list):
+    parts = item_id_parts(id_list.item_ids or ())
+    return [(UINT16, (parts_size(parts),))] + parts
+
+
+def link_info_parts(link_info, codepage):
+    # lays out the LinkInfo in the order the parser expects: VolumeID, LocalBasePath, CommonNetworkRelativeLink,
+    # CommonPathSuffix, then the unicode strings, with every offset recomputed
+    has_volume = link_info.local_base_path is not None or link_info.local_base_path_unicode is not None
+    has_net = link_info.net_name is not None or link_info.net_name_unicode is not None
+    has_unicode = link_info.local_base_path_unicode is not None or link_info.common_path_suffix_unicode is not None
+    header_size = 0x24 if has_unicode else 0x1c
+
+    body = []
+    pos = header_size
+
+    volume_id_offset = local_base_path_offset = local_base_path_unicode_offset = 0
+    if has_volume:
+        volume_id_offset = pos
+        volume_label = link_info.volume_label or b''
+        if isinstance(volume_label, bytes):
+            label = volume_label + b'\x00'
+            volume_id = [(VOLUME_ID_HEADER, (0x10 + len(label), link_info.drive_type_key or 0,
+                                             link_info.drive_serial_number or 0, 0x10)), label]
+        else:
+            label = encode_utf16(volume_label) + b'\x00\x00'
+            volume_id = [(VOLUME_ID_HEADER, (0x14 + len(label), link_info.drive_type_key or 0,
+                                             link_info.drive_serial_number or 0, 0x14)), (UINT32, (0x14,)), label]
+        body.extend(volume_id)
+        pos += parts_size(volume_id)
+
+        local_base_path_offset = pos
+        local_base_path = encode_ascii(link_info.local_base_path or b'', codepage) + b'\x00'
+        body.append(local_base_path)
+        pos += len(local_base_path)
+
+    common_net_rel_link_offset = 0
+    if has_net:
+        common_net_rel_link_offset = pos
+        net_name = encode_ascii(link_info.net_name or b'', codepage) + b'\x00'
+        device_name = link_info.device_name
+        net_flags = 0
+        if device_name is not None:
+            net_flags |= 1
+            device_name = encode_ascii(device_name, codepage) + b'\x00'
+        if link_info.network_provider_type_val is not None:
+            net_flags |= 2
+
+        if link_info.net_name_unicode is not None:
+            net_name_offset = 0x1c
+            net_name_unicode = encode_utf16(link_info.net_name_unicode) + b'\x00\x00'
+            device_name_unicode = link_info.device_name_unicode
+            if device_name_unicode is not None:
+                device_name_unicode = encode_utf16(device_name_unicode) + b'\x00\x00'
+        else:
+            net_name_offset = 0x14
+            net_name_unicode = device_name_unicode = None
+
+        strings_pos = net_name_offset + len(net_name)
+        device_name_offset = 0
+        if device_name is not None:
+            device_name_offset = strings_pos
+            strings_pos += len(device_name)
+        unicode_offsets = []
+        if net_name_unicode is not None:
+            unicode_offsets.append(strings_pos)
+            strings_pos += len(net_name_unicode)
+            unicode_offsets.append(strings_pos if device_name_unicode is not None else 0)
+            if device_name_unicode is not None:
+                strings_pos += len(device_name_unicode)
+
+        net = [(NET_REL_LINK_HEADER, (strings_pos, net_flags, net_name_offset, device_name_offset,
+                                      link_info.network_provider_type_val or 0))]
+        net.extend((UINT32, (unicode_offset,)) for unicode_offset in unicode_offsets)
+        net.extend(string for string in [net_name, device_name, net_name_unicode, device_name_unicode]
+                   if string is not None)
+        body.extend(net)
+        pos += strings_pos
+
+    common_path_suffix_offset = pos
+    common_path_suffix = encode_ascii(link_info.common_path_suffix or b'', codepage) + b'\x00'
+    body.append(common_path_suffix)
+    pos += len(common_path_suffix)
+
+    common_path_suffix_unicode_offset = 0
+    if has_unicode:
+        if link_info.local_base_path_unicode is not None:
+            local_base_path_unicode_offset = pos
+            local_base_path_unicode = encode_utf16(link_info.local_base_path_unicode) + b'\x00\x00'
+            body.append(local_base_path_unicode)
+            pos += len(local_base_path_unicode)
+        common_path_suffix_unicode_offset = pos
+        common_path_suffix_unicode = encode_utf16(link_info.common_path_suffix_unicode or u'') + b'\x00\x00'
+        body.append(common_path_suffix_unicode)
+        pos += len(common_path_suffix_unicode)
+
+    parts = [(LINK_INFO_HEADER, (pos, header_size, has_volume | has_net << 1, volume_id_offset,
+                                 local_base_path_offset, common_net_rel_link_offset, common_path_suffix_offset))]
+    if has_unicode:
+        parts.append((UINT32, (local_base_path_unicode_offset,)))
+        parts.append((UINT32, (common_path_suffix_unicode_offset,)))
+    return parts + body
+
+
+def string_data_parts(string_data, is_unicode, codepage):
+    parts = []
+    for _, field_name in STRING_DATA_FIELDS:
+        value = getattr(string_data, field_name)
+        if value is None:
+            continue
+        if is_unicode:
+            if isinstance(value, bytes):
+                value = value.decode(codepage)
+            encoded = encode_utf16(value)
+            parts.append((UINT16, (len(encoded) // 2,)))
+        else:
+            encoded = encode_ascii(value, codepage)
+            parts.append((UINT16, (len(encoded),)))
+        parts.append(encoded)
+    return parts
+
+
+def console_block(block, codepage):
+    return [(CONSOLE_DATA, (
+        block.get('fill_attributes_val', 0),
+        block.get('popup_fill_attributes_val', 0),
+        block.get('screen_buffer_size_x', 0),
+        block.get('screen_buffer_size_y', 0),
+        block.get('window_size_x', 0),
+        block.get('window_size_y', 0),
+        block.get('window_origin_x', 0),
+        block.get('window_origin_y', 0),
+        0, 0,
+        block.get('font_size', 0),
+        FONT_FAMILY_CODES.get(block.get('font_family'), 0),
+        block.get('font_weight_val', 0),
+        fixed(encode_utf16(block.get('font_name', u'')), 64),
+        block.get('cursor_size_val', 0),
+        block.get('full_screen_val', 0),
+        block.get('quick_edit_val', 0),
+        block.get('insert_mode_val', 0),
+        block.get('auto_position_val', 0),
+        block.get('history_buffer_size', 0),
+        block.get('num_of_history_buffers', 0),
+        block.get('history_no_dup_val', 0),
+    ) + tuple(block.get('color_table', [0] * 16)))]
+
+
+def console_fe_block(block, codepage):
+    return [(UINT32, (block['code_page'],))]
+
+
+def env_string_block(block, codepage):
+    return [fixed(encode_ascii(block.get('target_ansi', b''), codepage), 260),
+            fixed(encode_utf16(block.get('target_unicode', u'')), 520)]
+
+
+def known_folder_block(block, codepage):
+    return [guid_bytes(block['known_folder_id']), (UINT32, (block.get('offset', 0),))]
+
+
+def shim_block(block, codepage):
+    layer_name = encode_utf16(block['layer_name'])
+    return [fixed(layer_name, max(0x80, len(layer_name) + 2 + (-len(layer_name) - 2) % 4))]
+
+
+def special_folder_block(block, codepage):
+    return [(UINT32, (block['special_folder_id'],)), (UINT32, (block.get('offset', 0),))]
+
+
+def tracker_block(block, codepage):
+    return [(UINT32, (0x58,)), (UINT32, (0,)), fixed(encode_ascii(block.get('machine_id', b''), codepage), 16),
+            guid_bytes(block['droid_volume_id']), guid_bytes(block['droid_file_id']),
+            guid_bytes(block['droid_birth_volume_id']), guid_bytes(block['droid_birth_file_id'])]
+
+
+def vista_and_above_id_list_block(block, codepage):
+    return item_id_parts(block.get('item_ids', ()))
+
+
+# ExtraData block name -> encoder of everything after the BlockSize and BlockSignature
+EXTRA_DATA_ENCODERS = {
+    'EnvironmentVariableDataBlock': env_string_block,
+    'ConsoleDataBlock': console_block,
+    'TrackerDataBlock': tracker_block,
+    'ConsoleFEDataBlock': console_fe_block,
+    'SpecialFolderDataBlock': special_folder_block,
+    'DarwinDataBlock': env_string_block,
+    'IconEnvironmentDataBlock': env_string_block,
+    'ShimDataBlock': shim_block,
+    'KnownFolderDataBlock': known_folder_block,
+    'VistaAndAboveIDListDataBlock': vista_and_above_id_list_block,
+}
+
+
+def extra_data_parts(extra_data, codepage):
+    # decoded blocks are re-encoded from their fields, anything else is written back as the bytes it was read as
+    parts = []
+    if extra_data is not None:
+        for block_name in extra_data.blocks or ():
+            block_data = extra_data.block_data.get(block_name)
+            if block_data is not None and block_name in EXTRA_DATA_ENCODERS:
+                block = EXTRA_DATA_ENCODERS[block_name](block_data, codepage)
+            elif block_data is not None and 'raw_data' in block_data:
+                block = [bytes(block_data['raw_data'])]
+            else:
+                raise ValueError('cannot encode %s, drop it from the ExtraData blocks first' % block_name)
+            signature = EXTRA_DATA_SIGNATURES.get(block_name, block_data.get('block_signature'))
+            parts.append((BLOCK_HEADER, (8 + parts_size(block), signature)))
+            parts.extend(block)
+    parts.append((UINT32, (0,)))  # TerminalBlock
+    return parts
+
+
+def section_parts(record, slot, link_flags, codepage):
+    if slot == 'header':
+        return header_parts(record.header, link_flags)
+    section = getattr(record, slot)
+    if slot == 'extra_data':
+        return extra_data_parts(section, codepage)
+    if section is None:
+        return []
+    if slot == 'id_list':
+        return id_list_parts(section)
+    if slot == 'link_info':
+        return link_info_parts(section, codepage)
+    return string_data_parts(section, bool(link_flags & LINK_FLAGS['IsUnicode']), codepage)
+
+
+SECTION_SLOTS = ['header', 'id_list', 'link_info', 'string_data', 'extra_data']
+
+
+def encode_link(record, codepage='cp1252'):
+    """
+    serialize a ShellLinkRecord, packing every section straight into a single buffer
+    """
+    link_flags = link_flags_for(record)
+    parts = []
+    for slot in SECTION_SLOTS:
+        parts.extend(section_parts(record, slot, link_flags, codepage))
+    buf = bytearray(parts_size(parts))
+    pack_parts(parts, buf, 0)
+    return bytes(buf)
+
+
+def write_link(record, path, codepage='cp1252'):
+    with io.open(path, mode='wb') as f:
+        f.write(encode_link(record, codepage))
+
+
+class LinkTemplate(object):
+    """
+    stamps out many links from one ShellLinkRecord: each section is encoded once, and per link only the
+    sections holding a changed field are re-encoded, the rest are copied in as bytes
+    """
+
+    def __init__(self, record, codepage='cp1252'):
+        self.record = record
+        self.codepage = codepage
+        self.link_flags = link_flags_for(record)
+        self.sections = []
+        for slot in SECTION_SLOTS:
+            parts = section_parts(record, slot, self.link_flags, codepage)
+            buf = bytearray(parts_size(parts))
+            pack_parts(parts, buf, 0)
+            self.sections.append(bytes(buf))
+
+    def render(self, changes=None):
+        # changes maps field names (as in lnk_model, e.g. 'command_line_arguments', 'write_time') to new values
+        if not changes:
+            return b''.join(self.sections)
+
+        section_changes = {}
+        for field, value in changes.items():
+            if field not in FIELD_SECTIONS:
+                if any(field in record_class.FIELDS for record_class in SECTION_RECORDS.values()):
+                    raise KeyError('%r is recomputed when the link is encoded, it can\'t be changed' % field)
+                raise KeyError('%r is not a templatable field' % field)
+            section_changes.setdefault(FIELD_SECTIONS[field], {})[field] = value
+
+        record = ShellLinkRecord()
+        for slot in SECTION_SLOTS:
+            section = getattr(self.record, slot)
+            if slot in section_changes:
+                if section is None:
+                    section = SECTION_RECORDS[slot].from_dict({})
+                section = section.replace(**section_changes[slot])
+            setattr(record, slot, section)
+
+        link_flags = link_flags_for(record)
+        if link_flags != self.link_flags:
+            section_changes.setdefault('header', {})
+            if (link_flags ^ self.link_flags) & LINK_FLAGS['IsUnicode']:
+                section_changes.setdefault('string_data', {})
+
+        parts = []
+        for slot, encoded in zip(SECTION_SLOTS, self.sections):
+            if slot in section_changes:
+                parts.extend(section_parts(record, slot, link_flags, self.codepage))
+            else:
+                parts.append(encoded)
+        buf = bytearray(parts_size(parts))
+        pack_parts(parts, buf, 0)
+        return bytes(buf)
+
+    def write(self, path, changes=None):
+        with io.open(path, mode='wb') as f:
+            f.write(self.render(changes))
+
+    def write_many(self, items):
+        # items yields (path, changes) pairs, returns how many links were written
+        count = 0
+        for path, changes in items:
+            self.write(path, changes)
+            count += 1
+        return count
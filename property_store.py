@@ -0,0 +1,211 @@
+import collections
+import struct
+
+from lnk_tool import ParseError
+from shell_items import format_guid
+
+# [MS-PROPSTORE] serialized property storage, as found in a PropertyStoreDataBlock
+
+STORAGE_VERSION = 0x53505331  # 'SPS1'
+
+# storages with this format id name their properties with strings instead of integers
+STRING_NAMED_FORMAT_ID = '{D5CDD505-2E9C-101B-9397-08002B2CF9AE}'
+
+# (format id, property id) -> canonical name, for the keys commonly found in shortcuts
+PROPERTY_KEY_NAMES = {
+    ('{B725F130-47EF-101A-A5F1-02608C9EEBAC}', 4): 'System.ItemTypeText',
+    ('{B725F130-47EF-101A-A5F1-02608C9EEBAC}', 10): 'System.ItemNameDisplay',
+    ('{B725F130-47EF-101A-A5F1-02608C9EEBAC}', 12): 'System.Size',
+    ('{B725F130-47EF-101A-A5F1-02608C9EEBAC}', 13): 'System.FileAttributes',
+    ('{B725F130-47EF-101A-A5F1-02608C9EEBAC}', 14): 'System.DateModified',
+    ('{B725F130-47EF-101A-A5F1-02608C9EEBAC}', 15): 'System.DateCreated',
+    ('{B725F130-47EF-101A-A5F1-02608C9EEBAC}', 16): 'System.DateAccessed',
+    ('{28636AA6-953D-11D2-B5D6-00C04FD918D0}', 30): 'System.ParsingPath',
+    ('{E3E0584C-B788-4A5A-BB20-7F5A44C9ACDD}', 6): 'System.ItemFolderPathDisplay',
+    ('{E3E0584C-B788-4A5A-BB20-7F5A44C9ACDD}', 7): 'System.ItemPathDisplay',
+    ('{9F4C2855-9F79-4B39-A8D0-E1D42DE1D5F3}', 2): 'System.AppUserModel.RelaunchCommand',
+    ('{9F4C2855-9F79-4B39-A8D0-E1D42DE1D5F3}', 5): 'System.AppUserModel.ID',
+}
+PROPERTY_NAME_KEYS = dict((name, key) for key, name in PROPERTY_KEY_NAMES.items())
+
+VT_VECTOR = 0x1000
+
+# [MS-OLEPS] 2.15 TypedPropertyValue: fixed-size scalar types
+FIXED_SIZE_TYPES = {
+    0x0002: struct.Struct('<h'),  # VT_I2
+    0x0003: struct.Struct('<i'),  # VT_I4
+    0x0004: struct.Struct('<f'),  # VT_R4
+    0x0005: struct.Struct('<d'),  # VT_R8
+    0x0006: struct.Struct('<q'),  # VT_CY, in units of 1/10000
+    0x0007: struct.Struct('<d'),  # VT_DATE, days since 1899-12-30
+    0x000A: struct.Struct('<I'),  # VT_ERROR
+    0x0010: struct.Struct('<b'),  # VT_I1
+    0x0011: struct.Struct('<B'),  # VT_UI1
+    0x0012: struct.Struct('<H'),  # VT_UI2
+    0x0013: struct.Struct('<I'),  # VT_UI4
+    0x0014: struct.Struct('<q'),  # VT_I8
+    0x0015: struct.Struct('<Q'),  # VT_UI8
+    0x0016: struct.Struct('<i'),  # VT_INT
+    0x0017: struct.Struct('<I'),  # VT_UINT
+    0x0040: struct.Struct('<Q'),  # VT_FILETIME, left as raw 100ns ticks
+}
+
+UINT32 = struct.Struct('<I')
+
+
+def pad4(size):
+    return (size + 3) & ~3
+
+
+# smallest encoding of one vector element, types missing here can't be vector elements
+MIN_ELEMENT_SIZES = dict((value_type, pad4(fixed.size)) for value_type, fixed in FIXED_SIZE_TYPES.items())
+MIN_ELEMENT_SIZES.update({
+    0x0008: 4,  # VT_BSTR
+    0x000B: 4,  # VT_BOOL
+    0x001E: 4,  # VT_LPSTR
+    0x001F: 4,  # VT_LPWSTR
+    0x0041: 4,  # VT_BLOB
+    0x0048: 16,  # VT_CLSID
+})
+
+
+class PropertyStore(object):
+    """
+    indexes every property (format id, property id or name) up front, but only decodes a typed value
+    when that property is actually asked for
+    """
+
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.offset = offset  # where data starts in the file, so ParseError offsets point into the file
+        self.index = collections.OrderedDict()  # (format id, id or name) -> (value start, value end)
+        self.decoded = {}
+        self.build_index()
+
+    def u32(self, pos):
+        return UINT32.unpack_from(self.data, pos)[0]
+
+    def error(self, reason, pos, check):
+        return ParseError(reason, self.offset + pos, check, 'PropertyStoreDataBlock')
+
+    def need(self, pos, size, end, what):
+        # every read stays inside the property value it belongs to
+        if pos + size > end:
+            raise self.error('%s runs past the end of its property value' % what, pos, 'property_value_within_bounds')
+
+    def build_index(self):
+        pos = 0
+        while pos + 4 <= len(self.data):
+            storage_size = self.u32(pos)
+            if storage_size == 0:
+                break
+            if storage_size < 24 or pos + storage_size > len(self.data):
+                raise self.error('bad property storage size %d' % storage_size, pos, 'sane_property_storage_size')
+            if self.u32(pos + 4) != STORAGE_VERSION:
+                raise self.error('bad property storage version', pos, 'property_storage_version')
+            format_id = format_guid(self.data[pos + 8:pos + 24])
+            string_named = format_id == STRING_NAMED_FORMAT_ID
+
+            value_pos = pos + 24
+            storage_end = pos + storage_size
+            while value_pos + 4 <= storage_end:
+                value_size = self.u32(value_pos)
+                if value_size == 0:
+                    break
+                if value_size < 9 or value_pos + value_size > storage_end:
+                    raise self.error('bad property value size %d' % value_size, value_pos, 'sane_property_value_size')
+                value_end = value_pos + value_size
+                if string_named:
+                    name_size = self.u32(value_pos + 4)
+                    self.need(value_pos + 9, name_size, value_end, 'property name')
+                    name_bytes = bytes(bytearray(self.data[value_pos + 9:value_pos + 9 + name_size]))
+                    key = name_bytes.decode('utf-16-le', 'replace').rstrip(u'\x00')
+                    value_start = value_pos + 9 + name_size
+                else:
+                    key = self.u32(value_pos + 4)
+                    value_start = value_pos + 9
+                self.index[(format_id, key)] = (value_start, value_end)
+                value_pos = value_end
+
+            pos += storage_size
+
+    def keys(self):
+        return list(self.index)
+
+    def names(self):
+        return [PROPERTY_KEY_NAMES.get(key, key) for key in self.index]
+
+    def __contains__(self, key):
+        return PROPERTY_NAME_KEYS.get(key, key) in self.index
+
+    def get(self, key, default=None):
+        # key is a (format id, property id or name) tuple, or a canonical name like 'System.ItemNameDisplay'
+        key = PROPERTY_NAME_KEYS.get(key, key)
+        if key not in self.index:
+            return default
+        if key not in self.decoded:
+            start, end = self.index[key]
+            self.decoded[key] = self.decode_typed_value(start, end)[0]
+        return self.decoded[key]
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return self.get(key)
+
+    def to_dict(self):
+        return dict((PROPERTY_KEY_NAMES.get(key, key), self.get(key)) for key in self.index)
+
+    def decode_typed_value(self, pos, end):
+        # returns (value, position after the value)
+        self.need(pos, 4, end, 'value type')
+        value_type = struct.unpack_from('<H', self.data, pos)[0]
+        pos += 4  # type and padding
+        if value_type & VT_VECTOR:
+            self.need(pos, 4, end, 'vector count')
+            element_type = value_type & ~VT_VECTOR
+            count = self.u32(pos)
+            pos += 4
+            # the count comes straight from the file, so it has to fit in what is left of the value
+            min_size = MIN_ELEMENT_SIZES.get(element_type)
+            if count and (min_size is None or count > (end - pos) // min_size):
+                raise self.error('vector of %d elements of type 0x%04X does not fit in its property value' %
+                                 (count, element_type), pos - 4, 'sane_property_vector_count')
+            out = []
+            for _ in range(count):
+                value, next_pos = self.decode_scalar(element_type, pos, end)
+                if not pos < next_pos <= end:
+                    raise self.error('vector element runs past the end of its property value', pos,
+                                     'property_value_within_bounds')
+                out.append(value)
+                pos = next_pos
+            return out, pos
+        return self.decode_scalar(value_type, pos, end)
+
+    def decode_scalar(self, value_type, pos, end):
+        if value_type in (0x0000, 0x0001):  # VT_EMPTY, VT_NULL
+            return None, pos
+        if value_type in FIXED_SIZE_TYPES:
+            fixed = FIXED_SIZE_TYPES[value_type]
+            self.need(pos, fixed.size, end, 'fixed-size value')
+            return fixed.unpack_from(self.data, pos)[0], pos + pad4(fixed.size)
+        if value_type == 0x000B:  # VT_BOOL
+            self.need(pos, 2, end, 'VT_BOOL')
+            return struct.unpack_from('<H', self.data, pos)[0] != 0, pos + 4
+        if value_type == 0x0048:  # VT_CLSID
+            self.need(pos, 16, end, 'VT_CLSID')
+            return format_guid(self.data[pos:pos + 16]), pos + 16
+        if value_type in (0x0008, 0x001F):  # VT_BSTR, VT_LPWSTR: length in characters, including the NULL
+            self.need(pos, 4, end, 'string length')
+            char_count = self.u32(pos)
+            raw = bytes(bytearray(self.data[pos + 4:min(pos + 4 + 2 * char_count, end)]))
+            return raw.decode('utf-16-le', 'replace').rstrip(u'\x00'), pos + 4 + pad4(2 * char_count)
+        if value_type in (0x001E, 0x0041):  # VT_LPSTR, VT_BLOB: length in bytes
+            self.need(pos, 4, end, 'string length')
+            size = self.u32(pos)
+            raw = bytes(bytearray(self.data[pos + 4:min(pos + 4 + size, end)]))
+            if value_type == 0x001E:
+                raw = raw.split(b'\x00', 1)[0]
+            return raw, pos + 4 + pad4(size)
+        # anything else is returned undecoded
+        return bytes(bytearray(self.data[pos:end])), end
@@ -0,0 +1,137 @@
+import collections
+import struct
+import uuid
+
+# decode the shell items of an IDList (LinkTargetIDList or VistaAndAboveIDList) back into a path
+
+ShellItem = collections.namedtuple('ShellItem', ['kind', 'name'])
+
+ROOT_FOLDER_NAMES = {
+    '{20D04FE0-3AEA-1069-A2D8-08002B30309D}': 'My Computer',
+    '{208D2C60-3AEA-1069-A2D7-08002B30309D}': 'My Network Places',
+    '{F02C1A0D-BE21-4350-88B0-7367FC96EF3C}': 'Network',
+    '{450D8FBA-AD25-11D0-98A8-0800361B1103}': 'My Documents',
+    '{59031A47-3F72-44A7-89C5-5595FE6B30EE}': 'Users Files',
+    '{645FF040-5081-101B-9F08-00AA002F954E}': 'Recycle Bin',
+    '{21EC2020-3AEA-1069-A2DD-08002B30309D}': 'Control Panel',
+}
+
+# these roots don't contribute anything to a filesystem path
+TRANSPARENT_ROOTS = {'My Computer', 'My Network Places', 'Network'}
+
+FILE_ENTRY_EXTENSION_SIGNATURE = b'\x04\x00\xef\xbe'  # 0xBEEF0004, holds the long (unicode) name
+
+
+def format_guid(guid_bytes):
+    # any buffer: bytes, a memoryview or a python 2 buffer
+    return '{%s}' % str(uuid.UUID(bytes_le=bytes(bytearray(guid_bytes)))).upper()
+
+
+def read_cstring(data, pos, char_size=1):
+    terminator = b'\x00' * char_size
+    end = data.find(terminator, pos)
+    while char_size > 1 and end > 0 and (end - pos) % char_size:
+        end = data.find(terminator, end + 1)
+    if end < 0:
+        end = len(data)
+    raw = data[pos:end]
+    return raw.decode('utf-16-le', 'replace') if char_size == 2 else raw.decode('cp1252', 'replace')
+
+
+def decode_file_entry_long_name(item):
+    ext_pos = item.find(FILE_ENTRY_EXTENSION_SIGNATURE)
+    if ext_pos < 4:
+        return None
+    ext_start = ext_pos - 4
+    version = struct.unpack_from('<H', item, ext_start + 2)[0]
+    if version < 3:
+        return None
+    if version >= 9:
+        name_offset = 0x2E
+    elif version >= 8:
+        name_offset = 0x2A
+    elif version >= 7:
+        name_offset = 0x26
+    else:
+        name_offset = 0x14
+    if ext_start + name_offset >= len(item):
+        return None
+    return read_cstring(item, ext_start + name_offset, 2)
+
+
+def decode_item(item):
+    # item is the raw ItemID data, without its 2-byte size
+    if not item:
+        return ShellItem('unknown', None)
+    class_type = ord(item[0:1])
+
+    if class_type == 0x1F and len(item) >= 18:
+        clsid = format_guid(item[2:18])
+        return ShellItem('root', ROOT_FOLDER_NAMES.get(clsid, '::' + clsid))
+
+    if class_type & 0x70 == 0x20:
+        return ShellItem('volume', read_cstring(item, 1))
+
+    if class_type & 0x70 == 0x30 and len(item) > 12:
+        long_name = decode_file_entry_long_name(item)
+        if long_name:
+            return ShellItem('file', long_name)
+        return ShellItem('file', read_cstring(item, 12, 2 if class_type & 0x04 else 1))
+
+    if class_type & 0x70 == 0x40 and len(item) > 3:
+        return ShellItem('network', read_cstring(item, 3))
+
+    return ShellItem('unknown', '0x%02X' % class_type)
+
+
+def join_items(shell_items):
+    path = u''
+    for kind, name in shell_items:
+        if kind == 'root':
+            if name not in TRANSPARENT_ROOTS:
+                path = name
+        elif kind in ('volume', 'network'):
+            path = name
+        elif name:
+            if path and not path.endswith('\\'):
+                path += '\\'
+            path += name
+    return path or None
+
+
+class IDListDecoder(object):
+    """
+    decodes item id lists into shell items, memoizing every decoded prefix in a trie keyed by the raw item bytes,
+    so prefixes shared across a corpus (My Computer, C:\\, Users, ...) are decoded once and the results shared
+    """
+
+    def __init__(self, max_prefixes=100000):
+        self.max_prefixes = max_prefixes
+        self.trie = {}
+        self.prefix_count = 0
+
+    def lookup(self, item_ids):
+        if self.prefix_count > self.max_prefixes:
+            self.trie = {}
+            self.prefix_count = 0
+
+        node = self.trie
+        entry = ((), None, node)
+        for item in item_ids:
+            child = node.get(item)
+            if child is None:
+                prefix_items = entry[0] + (decode_item(item),)
+                child = node[item] = (prefix_items, join_items(prefix_items), {})
+                self.prefix_count += 1
+            entry = child
+            node = entry[2]
+        return entry
+
+    def decode(self, item_ids):
+        return self.lookup(item_ids)[0]
+
+    def path(self, item_ids):
+        return self.lookup(item_ids)[1]
+
+
+default_decoder = IDListDecoder()
@@ -1,4 +1,9 @@
-CLSID = '\x01\x14\x02\x00\x00\x00\x00\x00\xc0\x00\x00\x00\x00\x00\x00F'
+HEADER_SIZE = 0x0000004c
+
+CLSID = b'\x01\x14\x02\x00\x00\x00\x00\x00\xc0\x00\x00\x00\x00\x00\x00F'
+
+FILETIME_UNIX_EPOCH = 116444736000000000  # 1970-01-01 in 100ns ticks since 1601-01-01
+FILETIME_TICKS_PER_SECOND = 10000000
 
 LINK_FLAGS_NAMES = [
     'HasLinkTargetIDList',  # LinkTargetIDList struct follows the ShellLinkHeader struct
@@ -30,6 +35,17 @@ LINK_FLAGS_NAMES = [
     'KeepLocalIDListForUNCTarget',  # tldr
 ]
 
+LINK_FLAGS = dict((flag_name, 1 << flag_index) for flag_index, flag_name in enumerate(LINK_FLAGS_NAMES))
+
+# StringData fields, in the order they appear in the file
+STRING_DATA_FIELDS = [
+    ('HasName', 'name_string'),
+    ('HasRelativePath', 'relative_path'),
+    ('HasWorkingDir', 'working_dir'),
+    ('HasArguments', 'command_line_arguments'),
+    ('HasIconLocation', 'icon_location'),
+]
+
 FILE_ATTRS_FLAGS_NAMES = [
     'FILE_ATTRIBUTE_READONLY',  # can read, cannot write/del target file (if dir cannot delete)
     'FILE_ATTRIBUTE_HIDDEN',  # target is hidden
@@ -48,6 +64,8 @@ FILE_ATTRS_FLAGS_NAMES = [
     'FILE_ATTRIBUTE_ENCRYPTED',  # encrypted (if dir, all new subdirs will be too
 ]
 
+FILE_ATTRS_FLAGS = dict((flag_name, 1 << flag_index) for flag_index, flag_name in enumerate(FILE_ATTRS_FLAGS_NAMES))
+
 HOT_KEY_LOW = {
     0x30: '0',
     0x31: '1',
@@ -147,6 +165,7 @@ DRIVE_TYPES = {
 }
 
 NETWORK_PROVIDER_TYPES = {
+    0x00020000: 'WNNC_NET_LANMAN',  # not in [MS-SHLLINK], but what Windows writes for SMB shares
     0x001A0000: 'WNNC_NET_AVID',
     0x001B0000: 'WNNC_NET_DOCUSPACE',
     0x001C0000: 'WNNC_NET_MANGOSOFT',
@@ -190,6 +209,20 @@ NETWORK_PROVIDER_TYPES = {
     0x00430000: 'WNNC_NET_GOOGLE',
 }
 
+EXTRA_DATA_BLOCKS = {
+    0xA0000001: 'EnvironmentVariableDataBlock',  # path to environment variable information
+    0xA0000002: 'ConsoleDataBlock',  # display settings for a console window
+    0xA0000003: 'TrackerDataBlock',  # data for the Link Tracking service to find a moved target
+    0xA0000004: 'ConsoleFEDataBlock',  # code page for a console window
+    0xA0000005: 'SpecialFolderDataBlock',  # location of a special folder
+    0xA0000006: 'DarwinDataBlock',  # application identifier for installing the target
+    0xA0000007: 'IconEnvironmentDataBlock',  # icon path built from environment variables
+    0xA0000008: 'ShimDataBlock',  # name of a shim layer to apply
+    0xA0000009: 'PropertyStoreDataBlock',  # serialized property storage, see [MS-PROPSTORE]
+    0xA000000B: 'KnownFolderDataBlock',  # location of a known folder
+    0xA000000C: 'VistaAndAboveIDListDataBlock',  # alternate IDList
+}
+
 FILL_ATTRIBUTES = {
     0x0001: 'FOREGROUND_BLUE',  # The foreground text color contains blue.
     0x0002: 'FOREGROUND_GREEN',  # The foreground text color contains green.
@@ -0,0 +1,39 @@
+import asyncio
+import warnings
+
+import pytest
+
+from lnk_async import parse_bytes
+from lnk_async import parse_reader
+from test_lnk_tool import local_link
+
+
+def reader_for(data):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+def test_parse_reader():
+    async def main():
+        return await parse_reader(reader_for(local_link()), path='notepad.lnk')
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', DeprecationWarning)
+        result = asyncio.run(main())
+    assert result.error is None
+    assert result.info['link_info']['local_base_path'] == b'C:\\Windows\\notepad.exe'
+
+
+def test_parse_bytes_reports_errors():
+    result = asyncio.run(parse_bytes(b'\x4c\x00\x00\x00'))
+    assert result.info is None and 'ParseError' in result.error
+
+
+def test_oversized_stream_is_refused():
+    async def main():
+        return await parse_reader(reader_for(local_link()), max_size=16)
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
@@ -0,0 +1,14 @@
+from lnk_bench import generate_corpus
+from lnk_validate import validate_path
+
+
+def test_generated_corpus_is_reproducible_and_valid(tmp_path):
+    first, second = tmp_path / 'first', tmp_path / 'second'
+    first.mkdir()
+    second.mkdir()
+    paths = generate_corpus(str(first), count=20, seed=3)
+    again = generate_corpus(str(second), count=20, seed=3)
+    for path, other in zip(paths, again):
+        with open(path, 'rb') as f, open(other, 'rb') as g:
+            assert f.read() == g.read()
+        assert validate_path(path).reasons == []
@@ -0,0 +1,60 @@
+import sqlite3
+
+import pytest
+
+from lnk_cache import ParseCache
+
+
+def test_hit_after_miss(tmp_path, corpus):
+    with ParseCache(str(tmp_path / 'cache.db')) as cache:
+        first = cache.get(corpus[0])
+        assert cache.get(corpus[0]) == first
+        assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_partial_parse_is_not_returned_for_a_full_parse(tmp_path, corpus):
+    db_path = str(tmp_path / 'cache.db')
+    with ParseCache(db_path, sections=['ShellLinkHeader']) as cache:
+        assert set(cache.get(corpus[0]).info) == {'ShellLinkHeader'}
+    with ParseCache(db_path) as cache:
+        assert 'StringData' in cache.get(corpus[0]).info
+        assert cache.misses == 1
+    with ParseCache(db_path, sections=['ShellLinkHeader']) as cache:
+        assert set(cache.get(corpus[0]).info) == {'ShellLinkHeader'}
+        assert cache.hits == 1
+
+
+@pytest.mark.parametrize('options', [{'timestamps': 'raw'}, {'strict': True}])
+def test_other_options_miss(tmp_path, corpus, options):
+    db_path = str(tmp_path / 'cache.db')
+    with ParseCache(db_path) as cache:
+        list(cache.scan(corpus, processes=1))
+    with ParseCache(db_path, **options) as cache:
+        results = list(cache.scan(corpus, processes=1))
+        assert (cache.hits, cache.misses) == (0, len(corpus))
+    if 'timestamps' in options:
+        assert all(isinstance(result.info['ShellLinkHeader']['write_time'], int) for result in results)
+
+
+def test_vanished_file_does_not_stop_the_scan(tmp_path, corpus, monkeypatch):
+    # a file listed by find_lnk_files but deleted before it could be stat'ed
+    missing = str(tmp_path / 'deleted.lnk')
+    monkeypatch.setattr('lnk_cache.find_lnk_files', lambda root: iter([corpus[0], missing, corpus[1]]))
+    with ParseCache(str(tmp_path / 'cache.db')) as cache:
+        results = dict((result.path, result) for result in cache.scan('ignored', processes=1))
+        assert results[missing].info is None and 'Error' in results[missing].error
+        assert results[corpus[1]].error is None
+        assert cache.misses == 2
+
+
+def test_stopping_early_commits(tmp_path, corpus):
+    db_path = str(tmp_path / 'cache.db')
+    cache = ParseCache(db_path)
+    results = cache.scan(corpus, processes=1)
+    next(results)
+    next(results)
+    results.close()
+    db = sqlite3.connect(db_path)
+    assert db.execute('SELECT COUNT(*) FROM parsed').fetchone()[0] == 2
+    db.close()
+    cache.close()
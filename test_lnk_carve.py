@@ -0,0 +1,49 @@
+import pytest
+
+from lnk_carve import carve
+from lnk_carve import extract
+from test_lnk_tool import SPEC_SAMPLE
+
+# two whole copies of the sample around a truncated one, in 0xFF filler so nothing else validates
+FIRST, TRUNCATED, LAST = 1000, 1496, 1896
+IMAGE = b'\xff' * FIRST + SPEC_SAMPLE + b'\xff' * 37 + SPEC_SAMPLE[:300] + b'\xff' * 100 + SPEC_SAMPLE
+
+
+@pytest.fixture()
+def image(tmp_path):
+    path = tmp_path / 'image.bin'
+    path.write_bytes(IMAGE)
+    return str(path)
+
+
+# chunk boundaries in the filler, on a signature, one byte into one and straddling the last
+@pytest.mark.parametrize('chunk_size', [64, FIRST, FIRST + 1, LAST + 10, len(IMAGE), 1 << 20])
+def test_chunk_boundaries(image, chunk_size):
+    results = sorted(carve(image, processes=1, chunk_size=chunk_size))
+    assert [(result.offset, result.size, result.error) for result in results] == [
+        (FIRST, len(SPEC_SAMPLE), None), (LAST, len(SPEC_SAMPLE), None)]
+    assert all(result.info['link_info']['local_base_path'] == b'C:\\test\\a.txt' for result in results)
+
+
+def test_max_link_size(image):
+    assert sorted(result.offset for result in carve(image, processes=1, max_link_size=len(SPEC_SAMPLE))) == [
+        FIRST, LAST]
+    assert list(carve(image, processes=1, max_link_size=len(SPEC_SAMPLE) - 1)) == []
+
+
+def test_locate_only(image):
+    results = sorted(carve(image, processes=2, chunk_size=512, parse=False))
+    assert [(result.offset, result.info) for result in results] == [(FIRST, None), (LAST, None)]
+
+
+def test_sections(image):
+    result = next(carve(image, processes=1, sections=['StringData']))
+    assert set(result.info) == {'ShellLinkHeader', 'StringData'}
+
+
+def test_extract(image, tmp_path):
+    out_dir = tmp_path / 'carved'
+    out_dir.mkdir()
+    extract(image, str(out_dir), processes=1, parse=False)
+    assert sorted(path.name for path in out_dir.iterdir()) == ['%012X.lnk' % FIRST, '%012X.lnk' % LAST]
+    assert all(path.read_bytes() == SPEC_SAMPLE for path in out_dir.iterdir())
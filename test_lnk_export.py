@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+
+from lnk_export import flatten
+from lnk_model import ShellLinkRecord
+from lnk_tool import ShellLink
+from lnk_writer import encode_link
+
+
+def network_link(**link_info):
+    link_info.setdefault('net_name', b'\\\\fileserver\\share')
+    link_info.setdefault('network_provider_type_val', 0x00020000)
+    return encode_link(ShellLinkRecord.from_info({'ShellLinkHeader': {}, 'link_info': link_info, 'StringData': {},
+                                                  'ExtraData': {}}))
+
+
+def test_network_target_path_with_suffix():
+    link = ShellLink.from_bytes(network_link(common_path_suffix=b'reports\\q3.xlsx'))
+    assert link.target_path == u'\\\\fileserver\\share\\reports\\q3.xlsx'
+    assert isinstance(link.target_path, type(u''))
+
+
+def test_network_target_path_decodes_with_code_page():
+    link = ShellLink.from_bytes(network_link(net_name=b'\\\\b\xfcro\\share', common_path_suffix=b'\xe9t\xe9.txt'))
+    assert link.target_path == u'\\\\b\xfcro\\share\\\xe9t\xe9.txt'
+
+
+def test_network_target_path_without_suffix():
+    link = ShellLink.from_bytes(network_link(common_path_suffix=b''))
+    assert link.target_path == u'\\\\fileserver\\share'
+
+
+def test_flatten_network_link():
+    link = ShellLink.from_bytes(network_link(common_path_suffix=b'reports\\q3.xlsx'))
+    record = flatten('q3.lnk', link.info, None)
+    assert record['target_path'] == u'\\\\fileserver\\share\\reports\\q3.xlsx'
+    assert record['net_name'] == u'\\\\fileserver\\share'
+
+
+def test_closed_pipe_stops_the_export(corpus):
+    # like `lnk_export.py ... | head -1`, with enough records to fill the pipe
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lnk_export.py')
+    export = subprocess.Popen([sys.executable, script, '-j', '2', '--chunk-size', '4'] + corpus * 20,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    export.stdout.readline()
+    export.stdout.close()
+    try:
+        export.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        export.kill()
+        raise
+    assert b'Traceback' not in export.stderr.read()
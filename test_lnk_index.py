@@ -0,0 +1,92 @@
+import pytest
+
+from lnk_index import LinkIndex
+from lnk_model import ShellLinkRecord
+from lnk_watch import IncrementalScanner
+from lnk_writer import encode_link
+
+
+def target_link(local_base_path, working_dir, drive_serial_number=0x1234):
+    return encode_link(ShellLinkRecord.from_info({
+        'ShellLinkHeader': {},
+        'link_info': {'local_base_path': local_base_path, 'common_path_suffix': b'', 'drive_type': 'DRIVE_FIXED',
+                      'drive_serial_number': drive_serial_number, 'volume_label': b''},
+        'StringData': {'working_dir': working_dir},
+    }))
+
+
+@pytest.fixture()
+def links(tmp_path):
+    paths = {}
+    for name, local_base_path, working_dir, serial in [
+            ('notepad', b'C:\\Windows\\notepad.exe', u'C:\\Windows', 0x1234),
+            ('report', b'C:\\Users\\Public\\Report.docx', u'C:\\Users\\Public', 0x1234),
+            ('old', b'C:\\UsersOld\\a.txt', u'C:\\UsersOld', 0xBEEF)]:
+        path = tmp_path / (name + '.lnk')
+        path.write_bytes(target_link(local_base_path, working_dir, serial))
+        paths[name] = str(path)
+    return paths
+
+
+def test_lookups(links, tmp_path):
+    index = LinkIndex.build(str(tmp_path), processes=1)
+    assert len(index) == 3
+    assert index.lookup('local_base_path', u'C:\\Windows\\notepad.exe') == [links['notepad']]
+    assert index.lookup('local_base_path', u'c:\\windows\\NOTEPAD.exe') == []
+    assert index.lookup('local_base_path', u'c:\\windows\\NOTEPAD.exe', case_sensitive=False) == [links['notepad']]
+    assert index.lookup('drive_serial_number', 0x1234) == sorted([links['notepad'], links['report']])
+    assert index.values('working_dir') == {u'C:\\Windows': 1, u'C:\\Users\\Public': 1, u'C:\\UsersOld': 1}
+
+
+def test_prefix(links, tmp_path):
+    index = LinkIndex.build(str(tmp_path), processes=1)
+    assert index.prefix('local_base_path', u'C:\\Users') == sorted([links['report'], links['old']])
+    assert index.prefix('local_base_path', u'c:\\users\\', case_sensitive=False) == [links['report']]
+    assert index.prefix('working_dir', u'D:') == []
+    with pytest.raises(ValueError):
+        index.prefix('drive_serial_number', 12)
+    with pytest.raises(KeyError):
+        index.prefix('target_path', u'C:')
+
+
+def test_remove_and_re_add(links, tmp_path):
+    index = LinkIndex.build(str(tmp_path), processes=1)
+    assert index.remove(links['report'])
+    assert not index.remove(links['report'])
+    assert len(index) == 2
+    assert index.prefix('local_base_path', u'C:\\Users') == [links['old']]
+    assert u'C:\\Users\\Public' not in index.values('working_dir')
+
+    index.add(links['old'], {'link_info': {'local_base_path': b'D:\\moved.txt'}})
+    assert index.lookup('local_base_path', u'C:\\UsersOld\\a.txt') == []
+    assert index.lookup('local_base_path', u'd:\\MOVED.txt', case_sensitive=False) == [links['old']]
+    assert index.lookup('working_dir', u'C:\\UsersOld') == []
+    assert len(index) == 2
+
+
+def test_follows_the_watcher(links, tmp_path):
+    watcher = IncrementalScanner(str(tmp_path))
+    index = LinkIndex().apply_changes(watcher.poll())
+    assert len(index) == 3
+
+    with open(links['notepad'], 'wb') as f:
+        f.write(target_link(b'C:\\Windows\\System32\\notepad.exe', u'C:\\Windows\\System32'))
+    (tmp_path / 'report.lnk').unlink()
+    (tmp_path / 'broken.lnk').write_bytes(b'\x4c\x00\x00\x00')
+    index.apply_changes(watcher.poll())
+
+    assert len(index) == 2
+    assert index.prefix('local_base_path', u'C:\\Windows\\System32\\') == [links['notepad']]
+    assert index.lookup('local_base_path', u'C:\\Windows\\notepad.exe') == []
+    assert index.lookup('working_dir', u'C:\\Users\\Public') == []
+
+
+def test_save_and_load(links, tmp_path):
+    index = LinkIndex.build(str(tmp_path), processes=1)
+    index.remove(links['notepad'])
+    index.save(str(tmp_path / 'index.pickle'))
+    loaded = LinkIndex.load(str(tmp_path / 'index.pickle'))
+    assert len(loaded) == 2
+    assert loaded.prefix('local_base_path', u'C:\\Users') == sorted([links['report'], links['old']])
+    loaded.add(links['notepad'], {'link_info': {'local_base_path': b'C:\\Windows\\notepad.exe'}})
+    assert loaded.lookup('local_base_path', u'C:\\Windows\\notepad.exe') == [links['notepad']]
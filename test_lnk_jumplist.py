@@ -0,0 +1,232 @@
+import binascii
+import struct
+
+import pytest
+
+from lnk_jumplist import CompoundFile
+from lnk_jumplist import iter_jump_list
+from lnk_jumplist import parse_dest_list
+from lnk_jumplist import scan_jump_lists
+from lnk_tool import ParseError
+from test_lnk_tool import SPEC_SAMPLE
+from test_lnk_tool import local_link
+
+# the containers are laid out here from MS-CFB and the published DestList write-ups, not from lnk_jumplist's structs
+CFB_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+SECTOR_SIZE = 512
+MINI_SECTOR_SIZE = 64
+MINI_STREAM_CUTOFF = 0x1000
+DIRECTORY_ENTRY_SIZE = 128
+FAT_SECTOR = 0xFFFFFFFD
+END_OF_CHAIN = 0xFFFFFFFE
+FREE_SECTOR = 0xFFFFFFFF
+NO_STREAM = 0xFFFFFFFF
+
+
+def sectors_for(data, size):
+    return (len(data) + size - 1) // size
+
+
+def pad(data, size):
+    return data + b'\x00' * (-len(data) % size)
+
+
+def compound_file(streams):
+    """
+    a version 3 compound file holding (name, data) streams, laid out as
+    FAT, directory, mini FAT, mini stream, then the streams too big for the mini stream
+    """
+    mini_fat, mini_stream, big_streams, starts = [], b'', [], []
+    for name, data in streams:
+        if len(data) < MINI_STREAM_CUTOFF:
+            start = len(mini_stream) // MINI_SECTOR_SIZE
+            count = sectors_for(data, MINI_SECTOR_SIZE)
+            mini_fat.extend(list(range(start + 1, start + count)) + [END_OF_CHAIN])
+            mini_stream += pad(data, MINI_SECTOR_SIZE)
+            starts.append(start)
+        else:
+            big_streams.append(data)
+            starts.append(None)
+
+    fat = [FAT_SECTOR]
+
+    def allocate(data):
+        start, count = len(fat), sectors_for(data, SECTOR_SIZE)
+        fat.extend(list(range(start + 1, start + count)) + [END_OF_CHAIN])
+        return start
+
+    def entry(name, object_type, start, size):
+        name_bytes = (name + u'\x00').encode('utf-16-le')
+        return (name_bytes.ljust(64, b'\x00') +
+                struct.pack('<HBB3I', len(name_bytes), object_type, 1, NO_STREAM, NO_STREAM, NO_STREAM) +
+                b'\x00' * 36 +  # clsid, state bits, creation and modification times
+                struct.pack('<IQ', start, size))
+
+    num_entries = len(streams) + 1
+    directory_size = (num_entries + 3) // 4 * 4 * DIRECTORY_ENTRY_SIZE
+    first_dir_sector = allocate(b'\x00' * directory_size)
+    mini_fat_data = struct.pack('<%dI' % len(mini_fat), *mini_fat)
+    first_mini_fat_sector = allocate(mini_fat_data) if mini_fat else END_OF_CHAIN
+    mini_stream_start = allocate(mini_stream) if mini_stream else END_OF_CHAIN
+    big_starts = [allocate(data) for data in big_streams]
+
+    entries = [entry(u'Root Entry', 5, mini_stream_start, len(mini_stream))]
+    for (name, data), start in zip(streams, starts):
+        entries.append(entry(name, 2, big_starts.pop(0) if start is None else start, len(data)))
+    directory = b''.join(entries).ljust(directory_size, b'\x00')
+
+    assert len(fat) <= SECTOR_SIZE // 4
+    header = (CFB_SIGNATURE + b'\x00' * 16 +
+              struct.pack('<5H', 0x3E, 3, 0xFFFE, 9, 6) +  # versions, byte order, sector and mini sector shifts
+              b'\x00' * 6 +
+              struct.pack('<9I', 0, 1, first_dir_sector, 0, MINI_STREAM_CUTOFF, first_mini_fat_sector,
+                          sectors_for(mini_fat_data, SECTOR_SIZE), END_OF_CHAIN, 0) +
+              struct.pack('<109I', 0, *[FREE_SECTOR] * 108))  # the header DIFAT: the FAT is sector 0
+    fat_data = struct.pack('<128I', *(fat + [FREE_SECTOR] * (128 - len(fat))))
+    body = [fat_data, directory, mini_fat_data, mini_stream] + big_streams
+    return header + b''.join(pad(part, SECTOR_SIZE) for part in body if part)
+
+
+def unhex(*lines):
+    return binascii.unhexlify(''.join(lines).replace(' ', ''))
+
+
+DEST_LIST_IDS = unhex(
+    '3412000000000000',  # 0x00 checksum
+    '11111111111111111111111111111111',  # 0x08 volume droid
+    '22222222222222222222222222222222',  # 0x18 file droid
+    '33333333333333333333333333333333',  # 0x28 birth volume droid
+    '44444444444444444444444444444444',  # 0x38 birth file droid
+    '63687269732d78707300000000000000',  # 0x48 hostname 'chris-xps'
+)
+
+# windows 10: the path length is at 0x7c, the path at 0x7e and a 4 byte trailer follows it
+DEST_LIST_V3 = unhex(
+    '04000000 02000000 01000000 00000000',  # version 4, 2 entries, 1 pinned, ?
+    '0200000000000000 0100000000000000',  # last entry number, revision
+) + DEST_LIST_IDS + unhex(
+    '01000000 00000000',  # 0x58 entry number 1, ?
+    'd0e9eef21515c901',  # 0x60 last access
+    'ffffffff ffffffff 03000000',  # 0x68 not pinned, ?, 0x70 access count 3
+    '0000000000000000 0d00',  # 0x74 ?, 0x7c path length 13
+    '43003a005c0074006500730074005c00 61002e00740078007400',  # C:\test\a.txt
+    '00000000',
+) + DEST_LIST_IDS + unhex(
+    '02000000 00000000',  # entry number 2
+    'd0e9eef21515c901',
+    '00000000 ffffffff 01000000',  # pinned first, access count 1
+    '0000000000000000 1600',  # path length 22
+    '43003a005c00570069006e0064006f00 770073005c006e006f00740065007000 610064002e00650078006500',
+    '00000000',
+)
+
+# windows 7: the path length is at 0x70, the path at 0x72 and nothing follows it
+DEST_LIST_V1 = unhex(
+    '01000000 01000000 00000000 00000000',  # version 1, 1 entry
+    '0700000000000000 0100000000000000',
+) + DEST_LIST_IDS + unhex(
+    '07000000 00000000',  # entry number 7
+    'd0e9eef21515c901',
+    'ffffffff 00000000 0800',  # 0x68 not pinned, ?, 0x70 path length 8
+    '43003a005c0061002e00740078007400',  # C:\a.txt
+)
+
+SPEC_ACCESS_TIME = 0x01C91515F2EEE9D0
+
+
+def automatic_jump_list():
+    return compound_file([
+        (u'1', SPEC_SAMPLE),
+        (u'2', local_link()),
+        (u'a', SPEC_SAMPLE + b'\x00' * MINI_STREAM_CUTOFF),  # big enough to live outside the mini stream
+        (u'DestList', DEST_LIST_V3),
+    ])
+
+
+def test_compound_file_streams():
+    cfb = CompoundFile(automatic_jump_list())
+    streams = cfb.streams()
+    assert list(streams) == [u'1', u'2', u'a', u'DestList']
+    assert cfb.read_stream(streams[u'1']) == SPEC_SAMPLE
+    assert cfb.read_stream(streams[u'a']) == SPEC_SAMPLE + b'\x00' * MINI_STREAM_CUTOFF
+
+
+def test_automatic_destinations(tmp_path):
+    path = tmp_path / '5d696d521de238c3.automaticDestinations-ms'
+    path.write_bytes(automatic_jump_list())
+    entries = dict((entry.entry, entry) for entry in iter_jump_list(str(path)))
+    assert sorted(entries) == [u'1', u'2', u'a']
+    assert all(entry.error is None for entry in entries.values())
+    assert entries[u'1'].info['link_info']['local_base_path'] == b'C:\\test\\a.txt'
+    assert entries[u'2'].info['link_info']['local_base_path'] == b'C:\\Windows\\notepad.exe'
+
+    record = entries[u'1'].dest_list
+    assert (record.entry_number, record.path, record.hostname) == (1, u'C:\\test\\a.txt', b'chris-xps')
+    assert (record.last_access, record.pin_status, record.access_count) == (SPEC_ACCESS_TIME, None, 3)
+    assert entries[u'2'].dest_list.pin_status == 0
+    assert entries[u'a'].dest_list is None
+
+
+def test_dest_list_versions():
+    record = parse_dest_list(DEST_LIST_V1)[7]
+    assert (record.path, record.access_count, record.last_access) == (u'C:\\a.txt', None, SPEC_ACCESS_TIME)
+    records = parse_dest_list(DEST_LIST_V3)
+    assert [(records[n].path, records[n].access_count) for n in (1, 2)] == [
+        (u'C:\\test\\a.txt', 3), (u'C:\\Windows\\notepad.exe', 1)]
+    assert records[1].file_droid == records[2].file_droid
+    assert parse_dest_list(DEST_LIST_V3, timestamps='lazy')[1].last_access.utc.year == 2008
+
+
+def test_truncated_dest_list_keeps_what_fits():
+    assert sorted(parse_dest_list(DEST_LIST_V3[:-10])) == [1]
+    assert parse_dest_list(DEST_LIST_V3[:31]) == {}
+
+
+def test_broken_link_stream_is_reported(tmp_path):
+    path = tmp_path / 'broken.automaticDestinations-ms'
+    path.write_bytes(compound_file([(u'1', SPEC_SAMPLE[:200]), (u'2', SPEC_SAMPLE)]))
+    entries = list(iter_jump_list(str(path), strict=True))
+    assert [(entry.entry, entry.error is None) for entry in entries] == [(u'1', False), (u'2', True)]
+    assert 'ParseError' in entries[0].error
+
+
+def test_sector_chain_cycle_is_a_parse_error():
+    data = bytearray(automatic_jump_list())
+    directory_sector = struct.unpack_from('<I', data, 0x30)[0]
+    struct.pack_into('<I', data, SECTOR_SIZE + 4 * directory_sector, directory_sector)  # points at itself
+    with pytest.raises(ParseError):
+        CompoundFile(bytes(data))
+
+
+@pytest.mark.parametrize('size', [8, 100, SECTOR_SIZE, 1500])
+def test_truncated_compound_file_yields_one_error(tmp_path, size):
+    path = tmp_path / 'truncated.automaticDestinations-ms'
+    path.write_bytes(automatic_jump_list()[:size])
+    entries = list(iter_jump_list(str(path)))
+    assert len(entries) == 1 and entries[0].info is None and entries[0].error
+
+
+def custom_jump_list():
+    # category headers between the shortcuts, and a truncated shortcut that is skipped
+    return (b'\x02\x00\x00\x00\x01\x00\x00\x00' + SPEC_SAMPLE + b'\xab\xfb\xbf\xba' + SPEC_SAMPLE[:120] +
+            b'\xab\xfb\xbf\xba' + local_link() + b'\xab\xfb\xbf\xba')
+
+
+def test_custom_destinations(tmp_path):
+    path = tmp_path / '5d696d521de238c3.customDestinations-ms'
+    data = custom_jump_list()
+    path.write_bytes(data)
+    entries = list(iter_jump_list(str(path), sections=['link_info']))
+    assert [entry.entry for entry in entries] == [8, data.index(local_link())]
+    assert [entry.info['link_info']['local_base_path'] for entry in entries] == [
+        b'C:\\test\\a.txt', b'C:\\Windows\\notepad.exe']
+    assert all(entry.dest_list is None and entry.error is None for entry in entries)
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_scan_jump_lists(tmp_path, processes):
+    (tmp_path / 'a.automaticDestinations-ms').write_bytes(automatic_jump_list())
+    (tmp_path / 'b.customDestinations-ms').write_bytes(custom_jump_list())
+    (tmp_path / 'c.lnk').write_bytes(SPEC_SAMPLE)
+    entries = list(scan_jump_lists(str(tmp_path), processes=processes))
+    assert len(entries) == 5 and all(entry.error is None for entry in entries)
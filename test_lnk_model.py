@@ -0,0 +1,27 @@
+import pytest
+
+from lnk_model import HeaderRecord
+from lnk_model import LinkInfoRecord
+from lnk_model import ShellLinkRecord
+
+
+def test_check_bits_are_fixed():
+    checks = list(LinkInfoRecord.VALIDITY_CHECKS)
+    first = LinkInfoRecord.from_dict({'validity_checks': {'read_full_net': False}})
+    second = LinkInfoRecord.from_dict({'validity_checks': {'sane_drive_type': True, 'read_full_net': False}})
+    assert first.failed == second.failed
+    assert LinkInfoRecord.VALIDITY_CHECKS == checks
+
+
+def test_unknown_check_is_refused():
+    with pytest.raises(ValueError):
+        HeaderRecord.from_dict({'validity_checks': {'made_up_check': True}})
+    assert 'made_up_check' not in HeaderRecord.VALIDITY_CHECKS
+
+
+def test_round_trip():
+    info = {'ShellLinkHeader': {'LinkFlags': {'IsUnicode': True}, 'file_size': 3,
+                                'validity_checks': {'CLSID': True, 'sane_hotkey': False}}}
+    record = ShellLinkRecord.from_info(info).header
+    assert record.failed_checks() == ['sane_hotkey']
+    assert record.to_dict()['validity_checks'] == {'CLSID': True, 'sane_hotkey': False}
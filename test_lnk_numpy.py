@@ -0,0 +1,52 @@
+import datetime
+
+import pytest
+
+from lnk_scan import parse_buffer
+from lnk_tool import ShellLink
+from shell_link_const import FILETIME_UNIX_EPOCH
+from test_lnk_tool import SPEC_SAMPLE
+
+np = pytest.importorskip('numpy')
+lnk_numpy = pytest.importorskip('lnk_numpy')
+
+
+def test_decode_headers(corpus_data):
+    headers = lnk_numpy.decode_headers([SPEC_SAMPLE] + corpus_data + [SPEC_SAMPLE[:0x20], b''])
+    assert len(headers) == len(corpus_data) + 3
+    assert lnk_numpy.header_valid(headers).tolist() == [True] * (len(corpus_data) + 1) + [False, False]
+
+
+def test_header_columns_match_the_parser():
+    header = ShellLink.from_bytes(SPEC_SAMPLE, timestamps='lazy').header
+    columns = lnk_numpy.header_columns(lnk_numpy.decode_headers([SPEC_SAMPLE]), flag_names=True)
+    for field in ('create_time', 'access_time', 'write_time'):
+        assert columns[field][0] == np.datetime64(header[field].utc.replace(tzinfo=None), 'us')
+    assert columns['file_size'][0] == header['file_size']
+    assert columns['HasLinkTargetIDList'][0] and not columns['HasArguments'][0]
+    assert columns['FILE_ATTRIBUTE_ARCHIVE'][0]
+
+
+def test_out_of_range_filetimes_are_nat():
+    times = lnk_numpy.filetime_to_datetime64([0, FILETIME_UNIX_EPOCH, 2 ** 63 - 1, 2 ** 63, 2 ** 64 - 1])
+    assert np.isnat(times).tolist() == [True, False, False, True, True]
+    assert times[1] == np.datetime64('1970-01-01T00:00:00', 'us')
+    assert times[2] > np.datetime64('1970-01-01T00:00:00', 'us')
+
+
+@pytest.mark.parametrize('timestamps', ['raw', 'lazy'])
+def test_filetime_columns(timestamps):
+    results = [parse_buffer(SPEC_SAMPLE, path='a.lnk', timestamps=timestamps),
+               parse_buffer(SPEC_SAMPLE[:10], path='b.lnk', timestamps=timestamps)]
+    paths, columns = lnk_numpy.filetime_columns(results)
+    assert paths == ['a.lnk', 'b.lnk']
+    write_time = ShellLink.from_bytes(SPEC_SAMPLE, timestamps='lazy').header['write_time'].utc
+    assert columns['write_time'][0].astype(datetime.datetime) == write_time.replace(tzinfo=None)
+    assert np.isnat(columns['write_time'][1])
+
+
+def test_read_headers(tmp_path):
+    (tmp_path / 'a.lnk').write_bytes(SPEC_SAMPLE)
+    (tmp_path / 'b.lnk').write_bytes(SPEC_SAMPLE[:30])
+    headers = lnk_numpy.read_headers([str(tmp_path / 'a.lnk'), str(tmp_path / 'b.lnk')])
+    assert lnk_numpy.header_valid(headers).tolist() == [True, False]
@@ -0,0 +1,130 @@
+import lnk_patch
+from lnk_model import ShellLinkRecord
+from lnk_patch import patch_bytes
+from lnk_patch import patch_file
+from lnk_tool import ShellLink
+from lnk_validate import validate_bytes
+from lnk_writer import encode_link
+from test_lnk_tool import SPEC_SAMPLE
+
+
+def failed_checks(data):
+    link = ShellLink.from_bytes(bytes(data), strict=True)
+    return sorted((section, check) for section, parsed_data in link.info.items()
+                  for check, passed in parsed_data.get('validity_checks', {}).items() if not passed)
+
+
+def unicode_link():
+    return encode_link(ShellLinkRecord.from_info({
+        'ShellLinkHeader': {},
+        'link_info': {'local_base_path': b'?', 'local_base_path_unicode': u'C:\\\u65e5\u672c\\a.txt',
+                      'common_path_suffix': b'', 'net_name': b'\\\\old\\share',
+                      'net_name_unicode': u'\\\\old\\share'},
+        'StringData': {'working_dir': u'C:\\'},
+    }))
+
+
+def test_patching_ansi_string_patches_unicode_copy():
+    data = unicode_link()
+    patched = patch_bytes(data, {'local_base_path': u'D:\\new\\b.txt'})
+    link_info = ShellLink.from_bytes(bytes(patched)).link_info
+    assert link_info['local_base_path'] == b'D:\\new\\b.txt'
+    assert link_info['local_base_path_unicode'] == u'D:\\new\\b.txt'
+    assert ShellLink.from_bytes(bytes(patched)).target_path == u'D:\\new\\b.txt'
+    assert failed_checks(patched) == failed_checks(data)
+
+
+def test_callable_gets_each_copy():
+    def rename_server(old):
+        if isinstance(old, bytes):
+            return old.replace(b'old', b'fileserver01')
+        return old.replace(u'old', u'fileserver01')
+
+    patched = patch_bytes(unicode_link(), {'net_name': rename_server})
+    link_info = ShellLink.from_bytes(bytes(patched)).link_info
+    assert link_info['net_name'] == b'\\\\fileserver01\\share'
+    assert link_info['net_name_unicode'] == u'\\\\fileserver01\\share'
+    assert link_info['local_base_path_unicode'] == u'C:\\\u65e5\u672c\\a.txt'
+    assert ShellLink.from_bytes(bytes(patched)).string_data['working_dir'] == u'C:\\'
+
+
+def test_splices_in_spec_sample_revalidate():
+    changes = {'local_base_path': u'D:\\archive\\2008\\a.txt', 'volume_label': u'ARCHIVE', 'relative_path': None,
+               'command_line_arguments': u'/p', 'show_command': 'SW_SHOWMINNOACTIVE'}
+    patched = bytes(patch_bytes(SPEC_SAMPLE, changes))
+    assert validate_bytes(patched) == []
+    assert failed_checks(patched) == []
+    link = ShellLink.from_bytes(patched)
+    assert link.link_info['local_base_path'] == b'D:\\archive\\2008\\a.txt'
+    assert link.link_info['volume_label'] == b'ARCHIVE'
+    assert link.string_data == {'working_dir': u'C:\\test', 'command_line_arguments': u'/p', 'validity_checks': {}}
+    assert link.header['show_command'] == 'SW_SHOWMINNOACTIVE'
+    assert patched.endswith(SPEC_SAMPLE[0x167:])  # the TrackerDataBlock just moves
+
+    restored = patch_bytes(patched, {'local_base_path': u'C:\\test\\a.txt', 'volume_label': u'',
+                                     'relative_path': u'.\\a.txt', 'command_line_arguments': None,
+                                     'show_command': 'SW_SHOWNORMAL'})
+    assert restored == SPEC_SAMPLE
+
+
+def to_drive_e(old):
+    # called with the ANSI bytes and then the unicode text
+    return (b'E:' if isinstance(old, bytes) else u'E:') + old[2:]
+
+
+def test_splices_across_corpus_revalidate(corpus_data):
+    for data in corpus_data:
+        changes = {'working_dir': u'E:\\moved', 'name_string': None}
+        if (ShellLink.from_bytes(data).link_info or {}).get('local_base_path') is not None:
+            changes['local_base_path'] = to_drive_e
+        patched = bytes(patch_bytes(data, changes))
+        assert validate_bytes(patched) == []
+        assert failed_checks(patched) == failed_checks(data)
+        link = ShellLink.from_bytes(patched)
+        assert link.string_data['working_dir'] in (u'E:\\moved', b'E:\\moved')
+        if 'local_base_path' in changes:
+            assert link.link_info['local_base_path'].startswith(b'E:')
+
+
+def test_changes_apply_together_as_they_would_one_by_one(corpus_data):
+    # inserted, removed and resized strings in both sections, patched from one parse of the original
+    def sequential(data, changes):
+        for field, value in changes.items():
+            data = patch_bytes(bytes(data), {field: value})
+        return data
+
+    for data in [SPEC_SAMPLE, unicode_link()] + corpus_data[:20]:
+        link_info = ShellLink.from_bytes(data).link_info or {}
+        changes = {'name_string': u'a name', 'relative_path': None, 'icon_location': u'%SystemRoot%\\x.ico',
+                   'working_dir': u'E:\\moved'}
+        for field in ('local_base_path', 'common_path_suffix', 'net_name', 'volume_label'):
+            if field in link_info:
+                changes[field] = to_drive_e
+        patched = patch_bytes(data, changes)
+        assert patched == sequential(data, changes)
+        assert validate_bytes(bytes(patched)) == []
+
+
+def test_parses_once(monkeypatch):
+    parses = []
+
+    class CountingShellLink(ShellLink):
+        def __init__(self, *args, **kwargs):
+            parses.append(args)
+            super(CountingShellLink, self).__init__(*args, **kwargs)
+
+    monkeypatch.setattr(lnk_patch, 'ShellLink', CountingShellLink)
+    patch_bytes(unicode_link(), {'local_base_path': u'D:\\b.txt', 'net_name': u'\\\\new\\share',
+                                 'working_dir': u'D:\\', 'command_line_arguments': u'-x', 'file_size': 3})
+    assert len(parses) == 1
+
+
+def test_patch_file(tmp_path):
+    path = tmp_path / 'a.lnk'
+    path.write_bytes(SPEC_SAMPLE)
+    assert patch_file(str(path), {'working_dir': u'C:\\test'}) == (str(path), False, None)
+    result = patch_file(str(path), {'working_dir': u'C:\\other'})
+    assert result.changed and result.error is None
+    assert ShellLink(str(path)).string_data['working_dir'] == u'C:\\other'
+    assert patch_file(str(path), {'item_ids': ()}).error.startswith('KeyError')
+    assert [p.name for p in tmp_path.iterdir()] == ['a.lnk']
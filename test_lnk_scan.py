@@ -0,0 +1,88 @@
+import struct
+import threading
+
+import pytest
+
+from lnk_scan import find_lnk_files
+from lnk_scan import parse_buffer
+from lnk_scan import scan
+from test_lnk_tool import SPEC_SAMPLE
+from test_lnk_tool import local_link
+
+
+@pytest.fixture()
+def tree(tmp_path):
+    # nested directories, an upper-case extension, a file that isn't a shortcut and one that doesn't parse
+    (tmp_path / 'b' / 'c').mkdir(parents=True)
+    (tmp_path / 'a.lnk').write_bytes(SPEC_SAMPLE)
+    (tmp_path / 'b' / 'NOTEPAD.LNK').write_bytes(local_link())
+    (tmp_path / 'b' / 'c' / 'broken.lnk').write_bytes(SPEC_SAMPLE[:100])
+    (tmp_path / 'b' / 'readme.txt').write_bytes(SPEC_SAMPLE)
+    return tmp_path
+
+
+def test_find_lnk_files(tree):
+    assert list(find_lnk_files(str(tree))) == [str(tree / 'a.lnk'), str(tree / 'b' / 'NOTEPAD.LNK'),
+                                               str(tree / 'b' / 'c' / 'broken.lnk')]
+    assert list(find_lnk_files(str(tree / 'b' / 'readme.txt'))) == [str(tree / 'b' / 'readme.txt')]
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_scan_reports_every_file(tree, processes):
+    results = dict((result.path, result) for result in scan(str(tree), processes=processes, chunk_size=1))
+    assert sorted(results) == sorted(find_lnk_files(str(tree)))
+    assert results[str(tree / 'a.lnk')].info['link_info']['local_base_path'] == b'C:\\test\\a.txt'
+    assert results[str(tree / 'b' / 'NOTEPAD.LNK')].error is None
+    broken = results[str(tree / 'b' / 'c' / 'broken.lnk')]
+    assert broken.info is None and broken.error.startswith('ParseError')
+
+
+def test_scan_matches_in_process(corpus):
+    in_process = dict((result.path, result) for result in scan(corpus, processes=1))
+    pooled = dict((result.path, result) for result in scan(corpus, processes=2, chunk_size=4, max_pending=8))
+    assert pooled == in_process
+
+
+def test_scan_several_roots(tree):
+    roots = [str(tree / 'a.lnk'), str(tree / 'b' / 'c')]
+    assert sorted(result.path for result in scan(roots, processes=1)) == [
+        str(tree / 'a.lnk'), str(tree / 'b' / 'c' / 'broken.lnk')]
+
+
+def test_sections(tree):
+    result, = scan(str(tree / 'a.lnk'), processes=1, sections=['ShellLinkHeader', 'StringData'])
+    assert sorted(result.info) == ['ShellLinkHeader', 'StringData']
+    assert type(result.info['ShellLinkHeader']['write_time']) is int  # raw FILETIME ticks by default
+
+
+def test_strict(tmp_path):
+    data = bytearray(SPEC_SAMPLE)
+    struct.pack_into('<I', data, 0x167, 0xFFFFFFF0)  # TrackerDataBlock BlockSize
+    path = tmp_path / 'hostile.lnk'
+    path.write_bytes(bytes(data))
+    lenient, = scan(str(path), processes=1)
+    assert lenient.error is None
+    assert not lenient.info['ExtraData']['validity_checks']['sane_block_size']
+    strict, = scan(str(path), processes=1, strict=True)
+    assert strict.info is None and strict.error.startswith('ParseError: ExtraData')
+
+
+def test_parse_buffer():
+    assert parse_buffer(SPEC_SAMPLE, ['link_info'], path='x').info['link_info']['volume_label'] == b''
+    assert parse_buffer(b'L\x00\x00\x00').error.startswith('ParseError')
+
+
+def test_stopping_early_shuts_the_pool_down(corpus):
+    # the generator is closed after one result while the feeder is still throttled on max_pending
+    done = threading.Event()
+
+    def consume():
+        results = scan(corpus * 10, processes=2, chunk_size=4, max_pending=16)
+        next(results)
+        results.close()
+        done.set()
+
+    thread = threading.Thread(target=consume)
+    thread.daemon = True
+    thread.start()
+    assert done.wait(60)
@@ -0,0 +1,51 @@
+import pytest
+
+from lnk_scan import scan
+from lnk_stats import InstrumentedFile
+from lnk_stats import ParseStats
+from lnk_tool import MemFile
+from lnk_tool import ShellLink
+
+
+def test_every_buffer_parse_is_its_own_file(corpus):
+    with open(corpus[0], 'rb') as f:
+        data = f.read()
+    stats = ParseStats()
+    for _ in range(3):
+        ShellLink.from_bytes(data, stats=stats)
+    assert stats.files.count == 3
+    assert not stats.open_files
+
+
+def test_lazy_link_is_finished_on_close(corpus):
+    finished = []
+    stats = ParseStats(lambda path, section, sample: section is None and finished.append(path))
+    with ShellLink(corpus[0], lazy=True, stats=stats) as link:
+        link.header
+        assert not finished
+    assert finished == [corpus[0]]
+    assert stats.sections['ShellLinkHeader'].count == 1
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_scan_collects_stats(corpus, processes):
+    seen = []
+    stats = ParseStats(lambda path, section, sample: seen.append((path, section)))
+    results = list(scan(corpus, processes=processes, chunk_size=4, stats=stats))
+    assert len(results) == len(corpus)
+    assert stats.files.count == len(corpus)
+    assert stats.sections['ShellLinkHeader'].count == len(corpus)
+    assert sorted(path for path, section in seen if section is None) == sorted(corpus)
+    assert not stats.open_files
+
+
+def test_merge():
+    first, second = ParseStats(), ParseStats()
+    for stats in (first, second):
+        token = stats.start_file('a.lnk')
+        file = InstrumentedFile(MemFile(data=b'\x00' * 8))
+        stats.measure(token, 'ShellLinkHeader', file, lambda: file.read(8))
+        stats.finish_file(token)
+    first.merge(second)
+    assert first.files.count == 2
+    assert first.sections['ShellLinkHeader'].counters['bytes_read'] == 16
@@ -0,0 +1,277 @@
+import binascii
+import datetime
+import pickle
+import random
+import struct
+
+import pytest
+
+from lnk_model import ShellLinkRecord
+from lnk_scan import parse_path
+from lnk_tool import ByteCoverage
+from lnk_tool import FileTime
+from lnk_tool import MappedFile
+from lnk_tool import ParseError
+from lnk_tool import ShellLink
+from lnk_writer import encode_link
+
+# the shortcut to C:\test\a.txt worked through in [MS-SHLLINK] section 3
+SPEC_SAMPLE = binascii.unhexlify(''.join('''
+4C 00 00 00 01 14 02 00 00 00 00 00 C0 00 00 00 00 00 00 46 9B 00 08 00 20 00 00 00 D0 E9 EE F2
+15 15 C9 01 D0 E9 EE F2 15 15 C9 01 D0 E9 EE F2 15 15 C9 01 00 00 00 00 00 00 00 00 01 00 00 00
+00 00 00 00 00 00 00 00 00 00 00 00 BD 00 14 00 1F 50 E0 4F D0 20 EA 3A 69 10 A2 D8 08 00 2B 30
+30 9D 19 00 2F 43 3A 5C 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 46 00 31 00 00
+00 00 00 2C 39 69 A3 10 00 74 65 73 74 00 00 32 00 07 00 04 00 EF BE 2C 39 65 A3 2C 39 69 A3 26
+00 00 00 03 1E 00 00 00 00 F5 1E 00 00 00 00 00 00 00 00 00 00 74 00 65 00 73 00 74 00 00 00 14
+00 48 00 32 00 00 00 00 00 2C 39 69 A3 20 00 61 2E 74 78 74 00 34 00 07 00 04 00 EF BE 2C 39 69
+A3 2C 39 69 A3 26 00 00 00 2D 6E 00 00 00 00 96 01 00 00 00 00 00 00 00 00 00 00 61 00 2E 00 74
+00 78 00 74 00 00 00 14 00 00 00 3C 00 00 00 1C 00 00 00 01 00 00 00 1C 00 00 00 2D 00 00 00 00
+00 00 00 3B 00 00 00 11 00 00 00 03 00 00 00 81 8A 7A 30 10 00 00 00 00 43 3A 5C 74 65 73 74 5C
+61 2E 74 78 74 00 00 07 00 2E 00 5C 00 61 00 2E 00 74 00 78 00 74 00 07 00 43 00 3A 00 5C 00 74
+00 65 00 73 00 74 00 60 00 00 00 03 00 00 A0 58 00 00 00 00 00 00 00 63 68 72 69 73 2D 78 70 73
+00 00 00 00 00 00 00 40 78 C7 94 47 FA C7 46 B3 56 5C 2D C6 B6 D1 15 EC 46 CD 7B 22 7F DD 11 94
+99 00 13 72 16 87 4A 40 78 C7 94 47 FA C7 46 B3 56 5C 2D C6 B6 D1 15 EC 46 CD 7B 22 7F DD 11 94
+99 00 13 72 16 87 4A 00 00 00 00
+'''.split()))
+
+
+def local_link():
+    return encode_link(ShellLinkRecord.from_info({
+        'ShellLinkHeader': {},
+        'link_info': {'local_base_path': b'C:\\Windows\\notepad.exe', 'common_path_suffix': b''},
+        'StringData': {'working_dir': u'C:\\Windows'},
+        'ExtraData': {},
+    }))
+
+
+def test_mapped_file_close(tmp_path):
+    path = tmp_path / 'notepad.lnk'
+    path.write_bytes(local_link())
+    mapped = MappedFile(str(path))
+    mapped.read(4)
+    mmap = mapped.mmap
+    mapped.close()
+    assert mmap.closed
+
+
+def test_zero_copy_link_is_a_context_manager(tmp_path):
+    path = tmp_path / 'notepad.lnk'
+    path.write_bytes(local_link())
+    with ShellLink(str(path), zero_copy=True) as link:
+        assert link.target_path == u'C:\\Windows\\notepad.exe'
+        mmap = link.file.mmap
+    assert mmap.closed
+    assert link.string_data['working_dir'] == u'C:\\Windows'  # loaded sections outlive the map
+
+
+def test_close_in_memory_link():
+    with ShellLink.from_bytes(local_link()) as link:
+        link.header
+    link.close()
+
+
+def test_spec_sample():
+    link = ShellLink.from_bytes(SPEC_SAMPLE, strict=True, timestamps='raw')
+    header = link.header
+    assert header['file_attrs']['FILE_ATTRIBUTE_ARCHIVE'] and header['show_command'] == 'SW_SHOWNORMAL'
+    assert header['write_time'] == 0x01C91515F2EEE9D0
+    assert link.link_info['local_base_path'] == b'C:\\test\\a.txt'
+    assert link.link_info['drive_type'] == 'DRIVE_FIXED' and link.link_info['drive_serial_number'] == 0x307A8A81
+    assert link.string_data == {'relative_path': u'.\\a.txt', 'working_dir': u'C:\\test', 'validity_checks': {}}
+    assert link.extra_data['TrackerDataBlock']['machine_id'] == b'chris-xps'
+    assert link.target_path == u'C:\\test\\a.txt'
+
+
+@pytest.mark.parametrize('strict', [True, False])
+def test_every_truncation_is_a_parse_error(strict):
+    for size in range(len(SPEC_SAMPLE)):
+        try:
+            link = ShellLink.from_bytes(SPEC_SAMPLE[:size], strict=strict)
+        except ParseError:
+            continue
+        assert not strict
+        assert not ShellLinkRecord.from_shell_link(link).valid, size
+
+
+# (struct format, offset into SPEC_SAMPLE, value, the check strict mode fails)
+HOSTILE_FIELDS = [
+    ('<H', 0x4E, 0xFFF0, 'sane_item_id_size'),  # first ItemIDSize
+    ('<I', 0x10B, 0xFFFFFFFF, 'link_info_within_file'),  # LinkInfoSize
+    ('<I', 0x11B, 0x1000, 'local_base_path_terminated'),  # LocalBasePathOffset
+    ('<I', 0x127, 0x7FFFFFFF, 'volume_id_within_link_info'),  # VolumeIDSize
+    ('<I', 0x133, 0xFFFF, 'volume_label_terminated'),  # VolumeLabelOffset
+    ('<H', 0x147, 0xFFFF, 'within_file'),  # RELATIVE_PATH CountCharacters
+    ('<I', 0x167, 0xFFFFFFF0, 'sane_block_size'),  # TrackerDataBlock BlockSize
+    ('<I', 0x167, 5, 'sane_block_size'),
+]
+
+
+@pytest.mark.parametrize('fmt, offset, value, check', HOSTILE_FIELDS)
+def test_hostile_sizes_and_offsets(fmt, offset, value, check):
+    data = bytearray(SPEC_SAMPLE)
+    struct.pack_into(fmt, data, offset, value)
+    with pytest.raises(ParseError) as e:
+        ShellLink.from_bytes(bytes(data), strict=True)
+    assert e.value.check == check
+
+
+def test_mutated_input_only_raises_parse_error(corpus_data):
+    # a bounded, seeded fuzz: anything but a ParseError escaping the parser is a bug
+    rng = random.Random(0)
+    samples = [SPEC_SAMPLE] + corpus_data
+    for _ in range(1500):
+        data = bytearray(rng.choice(samples))
+        for _ in range(rng.randint(1, 4)):
+            data[rng.randrange(len(data))] = rng.randrange(256)
+        for strict in (True, False):
+            try:
+                link = ShellLink.from_bytes(bytes(data), strict=strict)
+                link.target_path
+            except ParseError:
+                pass
+
+
+@pytest.mark.parametrize('zero_copy', [False, True])
+def test_missing_file_raises(tmp_path, zero_copy):
+    with pytest.raises(IOError):
+        ShellLink(str(tmp_path / 'missing.lnk'), zero_copy=zero_copy)
+    with pytest.raises(IOError):
+        ShellLink(str(tmp_path), lazy=True, zero_copy=zero_copy)
+
+
+@pytest.fixture()
+def decoded(monkeypatch):
+    # the sections decoded so far, in order
+    sections = []
+    for section, name in ShellLink.SECTION_PARSERS:
+        def record(self, section=section, parse=getattr(ShellLink, name)):
+            sections.append(section)
+            return parse(self)
+        monkeypatch.setattr(ShellLink, name, record)
+    return sections
+
+
+def test_lazy_link_decodes_only_what_is_asked_for(decoded):
+    link = ShellLink.from_bytes(SPEC_SAMPLE, lazy=True)
+    assert decoded == [] and link.info == {}
+    assert link.target_path == u'C:\\test\\a.txt'
+    assert decoded == ['ShellLinkHeader', 'link_info']
+    # memoized, and the same values a full parse gives
+    assert link.link_info is link.link_info and link.header is link.info['ShellLinkHeader']
+    assert decoded == ['ShellLinkHeader', 'link_info']
+    assert link.extra_data['TrackerDataBlock']['machine_id'] == b'chris-xps'
+    assert decoded == ['ShellLinkHeader', 'link_info', 'ExtraData']
+    info = link.parse_all()
+    assert sorted(decoded) == sorted(section for section, _ in ShellLink.SECTION_PARSERS)
+    assert info == ShellLink.from_bytes(SPEC_SAMPLE).info
+
+
+def test_lazy_link_falls_back_to_the_id_list(decoded):
+    data = bytearray(SPEC_SAMPLE)
+    struct.pack_into('<I', data, 0x14, 0x81)  # HasLinkTargetIDList | IsUnicode, no LinkInfo or strings
+    link = ShellLink.from_bytes(bytes(data[:0x10B]) + b'\x00' * 4, lazy=True)
+    assert link.target_path == u'C:\\test\\a.txt'
+    assert link.link_info is None
+    assert decoded == ['ShellLinkHeader', 'link_target_id_list']
+
+
+def test_lazy_link_keeps_broken_sections_to_themselves():
+    data = bytearray(SPEC_SAMPLE)
+    struct.pack_into('<I', data, 0x167, 0xFFFFFFF0)  # TrackerDataBlock BlockSize
+    link = ShellLink.from_bytes(bytes(data), lazy=True, strict=True)
+    assert link.target_path == u'C:\\test\\a.txt'
+    for _ in range(2):  # a failed section isn't memoized, loading it again fails again
+        with pytest.raises(ParseError) as e:
+            link.extra_data
+        assert e.value.section == 'ExtraData' and e.value.check == 'sane_block_size'
+    assert 'ExtraData' not in link.info
+
+
+def test_byte_coverage_merges_intervals():
+    coverage = ByteCoverage(100)
+    assert coverage.unread_ranges() == [(0, 100)]
+    for start, end in [(10, 20), (30, 40), (5, 5), (50, 60), (20, 25), (35, 52)]:
+        coverage.add(start, end)
+    # the empty read adds nothing, touching and overlapping reads merge
+    assert coverage.read_ranges() == [(10, 25), (30, 60)]
+    assert coverage.unread_ranges() == [(0, 10), (25, 30), (60, 100)]
+    assert coverage.unread_byte_count() == 55
+    coverage.add(0, 100)
+    assert coverage.read_ranges() == [(0, 100)] and coverage.unread_ranges() == []
+
+
+@pytest.mark.parametrize('zero_copy', [False, True])
+def test_coverage_of_a_parse(zero_copy):
+    link = ShellLink.from_bytes(SPEC_SAMPLE + b'\xff' * 8, track_coverage=True, zero_copy=zero_copy)
+    # every byte of the link is read, the slack after its terminal block isn't
+    assert link.file.coverage.read_ranges() == [(0, len(SPEC_SAMPLE))]
+    assert link.unread_ranges() == [(len(SPEC_SAMPLE), len(SPEC_SAMPLE) + 8)]
+
+    link = ShellLink.from_bytes(SPEC_SAMPLE, track_coverage=True, lazy=True, zero_copy=zero_copy)
+    link.header
+    assert link.unread_ranges() == [(0x4C, len(SPEC_SAMPLE))]
+    # locating ExtraData reads only the size fields in front of it
+    link.extra_data
+    assert link.unread_ranges() == [(0x4E, 0x10B), (0x10F, 0x147), (0x149, 0x157), (0x159, 0x167)]
+
+
+def test_coverage_is_off_by_default():
+    link = ShellLink.from_bytes(SPEC_SAMPLE)
+    assert link.file.coverage is None
+    with pytest.raises(ValueError):
+        link.unread_ranges()
+
+
+def test_scan_reports_a_missing_file(tmp_path):
+    result = parse_path(str(tmp_path / 'deleted.lnk'))
+    assert result.info is None and result.error.startswith('FileNotFoundError')
+
+
+SPEC_TIME = 0x01C91515F2EEE9D0  # all three header times of the spec sample
+SPEC_TIME_UTC = datetime.datetime(2008, 9, 12, 20, 27, 17, 101000)
+
+
+def with_write_time(ticks):
+    data = bytearray(SPEC_SAMPLE)
+    struct.pack_into('<Q', data, 0x2C, ticks)
+    return bytes(data)
+
+
+def test_timestamp_modes():
+    raw = ShellLink.from_bytes(SPEC_SAMPLE, timestamps='raw').header
+    assert [raw[field] for field in ('create_time', 'access_time', 'write_time')] == [SPEC_TIME] * 3
+    assert type(raw['write_time']) is int
+
+    lazy = ShellLink.from_bytes(SPEC_SAMPLE, timestamps='lazy').header['write_time']
+    assert isinstance(lazy, FileTime) and lazy == SPEC_TIME
+    assert lazy.utc == SPEC_TIME_UTC
+    assert lazy.unix == pytest.approx((SPEC_TIME_UTC - datetime.datetime(1970, 1, 1)).total_seconds())
+    assert lazy.local == datetime.datetime.fromtimestamp(lazy.unix)
+    assert pickle.loads(pickle.dumps(lazy, 2)).utc == SPEC_TIME_UTC  # survives the trip back from a worker
+
+    local = ShellLink.from_bytes(SPEC_SAMPLE).header['write_time']
+    assert local == lazy.local and local.microsecond == 101000
+
+    with pytest.raises(ValueError):
+        ShellLink.from_bytes(SPEC_SAMPLE, timestamps='utc')
+
+
+def test_timestamps_keep_every_microsecond():
+    ticks = SPEC_TIME + 1234567  # 123456.7 microseconds later, the last digit is below what a datetime holds
+    for timestamps in ('local', 'lazy'):
+        header = ShellLink.from_bytes(with_write_time(ticks), timestamps=timestamps).header
+        value = header['write_time'] if timestamps == 'local' else header['write_time'].local
+        assert value.microsecond == 224456
+
+
+def test_unset_and_out_of_range_timestamps():
+    for timestamps, unset in (('raw', 0), ('lazy', None), ('local', None)):
+        assert ShellLink.from_bytes(with_write_time(0), timestamps=timestamps).header['write_time'] == unset
+
+    data = with_write_time(0xFFFFFFFFFFFFFFFF)
+    local = ShellLink.from_bytes(data).header
+    assert local['write_time'] is None and not local['validity_checks']['sane_write_time']
+    assert ShellLink.from_bytes(data, timestamps='raw').header['write_time'] == 0xFFFFFFFFFFFFFFFF
+    with pytest.raises(ParseError) as e:
+        ShellLink.from_bytes(data, strict=True)
+    assert e.value.check == 'sane_write_time'
@@ -0,0 +1,104 @@
+import random
+import struct
+
+import pytest
+
+from lnk_tool import ParseError
+from lnk_tool import ShellLink
+from lnk_validate import Validator
+from lnk_validate import validate
+from lnk_validate import validate_bytes
+from lnk_validate import validate_path
+from test_lnk_tool import SPEC_SAMPLE
+
+
+def test_well_formed_links_pass(corpus_data):
+    for data in [SPEC_SAMPLE] + corpus_data:
+        validator = Validator(data)
+        assert validator.validate() == []
+        assert validator.end == len(data)
+
+
+def test_trailing_bytes_are_not_part_of_the_link():
+    validator = Validator(SPEC_SAMPLE + b'\xff' * 16)
+    assert validator.validate() == []
+    assert validator.end == len(SPEC_SAMPLE)
+
+
+def test_every_truncation_fails():
+    for size in range(len(SPEC_SAMPLE)):
+        assert validate_bytes(SPEC_SAMPLE[:size]), size
+
+
+def test_fail_fast_stops_at_the_first_reason():
+    data = bytearray(SPEC_SAMPLE)
+    struct.pack_into('<I', data, 0x44, 1)  # Reserved2
+    struct.pack_into('<I', data, 0x167, 0xFFFF)  # TrackerDataBlock BlockSize
+    assert validate_bytes(bytes(data)) == ['reserved_2', 'sane_block_size']
+    assert validate_bytes(bytes(data), fail_fast=True) == ['reserved_2']
+
+
+def test_link_info_offsets_must_stay_inside_link_info():
+    data = bytearray(SPEC_SAMPLE)
+    struct.pack_into('<I', data, 0x11B, 0x3C)  # LocalBasePathOffset == LinkInfoSize
+    assert validate_bytes(bytes(data)) == ['local_path_no_overlap']
+    struct.pack_into('<I', data, 0x11B, 0x3B)
+    assert validate_bytes(bytes(data)) == []
+
+
+def net_rel_link(net_name_offset, unicode_offsets, strings):
+    # a CommonNetworkRelativeLink with no device name, the given unicode offsets after the header, then strings
+    size = 0x14 + 4 * len(unicode_offsets) + len(strings)
+    return (struct.pack('<IIIII', size, 0, net_name_offset, 0, 0) +
+            struct.pack('<%dI' % len(unicode_offsets), *unicode_offsets) + strings)
+
+
+def test_net_name_unicode_offset_follows_the_parser():
+    # NetNameOffset 0x18 means just NetNameOffsetUnicode follows the header, so the strings may start at 0x18
+    data = net_rel_link(0x18, [0x1a], b'x\x00' + u'x\x00'.encode('utf-16-le'))
+    validator = Validator(data)
+    validator.validate_net_rel_link(0, len(data))
+    assert validator.reasons == []
+    # below 0x18 there are no unicode offsets at all
+    data = net_rel_link(0x16, [], b'\x00\x00x\x00')
+    validator = Validator(data)
+    validator.validate_net_rel_link(0, len(data))
+    assert validator.reasons == []
+
+
+def test_extra_data_block_too_small_to_decode():
+    def with_block(signature, size):
+        block = struct.pack('<II', size, signature) + b'\x00' * (size - 8)
+        return SPEC_SAMPLE[:-4] + block + b'\x00' * 4
+
+    assert validate_bytes(with_block(0xA0000002, 0x10)) == ['sane_block_size']  # ConsoleDataBlock is 0xcc
+    assert validate_bytes(with_block(0xA0000002, 0xCC)) == []
+    assert validate_bytes(with_block(0xA0000099, 0x10)) == []  # unknown blocks are only skipped
+    with pytest.raises(ParseError):
+        ShellLink.from_bytes(with_block(0xA0000002, 0x10), strict=True)
+
+
+def test_accepted_links_parse(corpus_data):
+    # whatever the validator lets through, a strict parse accepts too (timestamps aren't structure, so raw)
+    rng = random.Random(1)
+    samples = [SPEC_SAMPLE] + corpus_data
+    for _ in range(1500):
+        data = bytearray(rng.choice(samples))
+        for _ in range(rng.randint(1, 4)):
+            data[rng.randrange(len(data))] = rng.randrange(256)
+        data = bytes(data)
+        if not validate_bytes(data):
+            try:
+                ShellLink.from_bytes(data, timestamps='raw', strict=True)
+            except ParseError as e:
+                raise AssertionError('validated, but %s' % e)
+
+
+def test_validate_path(tmp_path):
+    good, bad = tmp_path / 'good.lnk', tmp_path / 'bad.lnk'
+    good.write_bytes(SPEC_SAMPLE)
+    bad.write_bytes(SPEC_SAMPLE[:100])
+    assert validate_path(str(good)) == (str(good), True, [])
+    assert validate_path(str(bad)).reasons == ['read_complete_id_list']
+    assert validate_path(str(tmp_path / 'missing.lnk')).reasons == ['unreadable']
+    assert sorted(result.valid for result in validate([str(tmp_path)], processes=1)) == [False, True]
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+from lnk_watch import ADDED
+from lnk_watch import DELETED
+from lnk_watch import MODIFIED
+from lnk_watch import IncrementalScanner
+from test_lnk_tool import SPEC_SAMPLE
+from test_lnk_tool import local_link
+
+
+def changes(scanner):
+    return sorted((event.kind, os.path.basename(event.path)) for event in scanner.poll())
+
+
+@pytest.fixture()
+def watched(tmp_path):
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'a.lnk').write_bytes(SPEC_SAMPLE)
+    (tmp_path / 'sub' / 'b.lnk').write_bytes(local_link())
+    return tmp_path
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_reports_only_what_changed(watched, processes):
+    scanner = IncrementalScanner(str(watched), processes=processes)
+    events = list(scanner.poll())
+    assert sorted((event.kind, os.path.basename(event.path)) for event in events) == [(ADDED, 'a.lnk'),
+                                                                                      (ADDED, 'b.lnk')]
+    assert all(event.result.error is None and event.result.path == event.path for event in events)
+    assert changes(scanner) == []
+
+    (watched / 'sub' / 'b.lnk').write_bytes(SPEC_SAMPLE)
+    (watched / 'a.lnk').unlink()
+    (watched / 'c.lnk').write_bytes(SPEC_SAMPLE[:50])
+    events = dict((os.path.basename(event.path), event) for event in scanner.poll())
+    assert dict((name, event.kind) for name, event in events.items()) == {
+        'a.lnk': DELETED, 'b.lnk': MODIFIED, 'c.lnk': ADDED}
+    assert events['a.lnk'].result is None
+    assert events['b.lnk'].result.info['link_info']['local_base_path'] == b'C:\\test\\a.txt'
+    assert events['c.lnk'].result.info is None and events['c.lnk'].result.error
+    assert changes(scanner) == []
+
+
+def test_touching_a_file_counts_as_a_change(watched):
+    scanner = IncrementalScanner(str(watched))
+    list(scanner.poll())
+    stat = os.stat(str(watched / 'a.lnk'))
+    os.utime(str(watched / 'a.lnk'), (stat.st_atime, stat.st_mtime + 10))
+    assert changes(scanner) == [(MODIFIED, 'a.lnk')]
+
+
+def test_abandoned_poll_is_repeated(watched):
+    scanner = IncrementalScanner(str(watched))
+    events = scanner.poll()
+    next(events)
+    events.close()
+    assert changes(scanner) == [(ADDED, 'a.lnk'), (ADDED, 'b.lnk')]
+
+
+def test_sections_and_timestamps(watched):
+    scanner = IncrementalScanner(str(watched / 'a.lnk'), sections=['ShellLinkHeader'], timestamps='lazy')
+    event, = scanner.poll()
+    assert list(event.result.info) == ['ShellLinkHeader']
+    assert event.result.info['ShellLinkHeader']['write_time'].utc.year == 2008
+
+
+def test_save_and_load(watched, tmp_path_factory):
+    snapshot = str(tmp_path_factory.mktemp('state') / 'snapshot.pickle')
+    scanner = IncrementalScanner(str(watched))
+    list(scanner.poll())
+    scanner.save(snapshot)
+
+    (watched / 'sub' / 'b.lnk').unlink()
+    resumed = IncrementalScanner(str(watched)).load(snapshot)
+    assert changes(resumed) == [(DELETED, 'b.lnk')]
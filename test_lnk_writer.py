@@ -0,0 +1,86 @@
+import struct
+
+import pytest
+
+from lnk_model import ShellLinkRecord
+from lnk_tool import ShellLink
+from lnk_writer import LinkTemplate
+from lnk_writer import encode_link
+from test_lnk_tool import SPEC_SAMPLE
+
+# a one-property store: System.ItemNameDisplay = u'a'
+PROPERTY_STORE = (struct.pack('<II', 0x31, 0x53505331) +
+                  b'\x30\xf1\x25\xb7\xef\x47\x1a\x10\xa5\xf1\x02\x60\x8c\x9e\xeb\xac' +
+                  struct.pack('<IIBHHI', 0x15, 10, 0, 0x001F, 0, 2) + b'a\x00\x00\x00' + b'\x00' * 8)
+
+
+def link_with_blocks(blocks):
+    extra_data = dict(blocks, blocks=sorted(blocks))
+    return encode_link(ShellLinkRecord.from_info({'ShellLinkHeader': {}, 'StringData': {'name_string': u'x'},
+                                                  'ExtraData': extra_data}))
+
+
+def reencode(data, **kwargs):
+    return encode_link(ShellLinkRecord.from_shell_link(ShellLink.from_bytes(data, **kwargs)))
+
+
+@pytest.mark.parametrize('timestamps', ['local', 'raw'])
+def test_corpus_round_trips(corpus_data, timestamps):
+    for data in corpus_data:
+        assert reencode(data, timestamps=timestamps) == data
+
+
+def test_spec_sample_round_trips():
+    assert reencode(SPEC_SAMPLE) == SPEC_SAMPLE
+
+
+def test_property_store_block_round_trips():
+    data = link_with_blocks({'PropertyStoreDataBlock': {'raw_data': PROPERTY_STORE}})
+    link = ShellLink.from_bytes(data)
+    assert link.property_store['System.ItemNameDisplay'] == u'a'
+    assert reencode(data) == data
+
+
+def test_unknown_block_round_trips():
+    data = link_with_blocks({'0xA0000077': {'raw_data': b'\x01\x02\x03\x04', 'block_signature': 0xA0000077},
+                             'KnownFolderDataBlock': {'known_folder_id': '{FDD39AD0-238F-46AF-ADB4-6C85480369C7}'}})
+    link = ShellLink.from_bytes(data)
+    assert link.extra_data['blocks'] == ['0xA0000077', 'KnownFolderDataBlock']
+    assert link.extra_data['0xA0000077']['raw_data'] == b'\x01\x02\x03\x04'
+    assert reencode(data) == data
+
+
+def test_decoded_blocks_keep_no_raw_bytes():
+    data = link_with_blocks({'PropertyStoreDataBlock': {'raw_data': PROPERTY_STORE},
+                             'KnownFolderDataBlock': {'known_folder_id': '{FDD39AD0-238F-46AF-ADB4-6C85480369C7}'}})
+    extra_data = ShellLink.from_bytes(data).extra_data
+    assert 'raw_data' not in extra_data['KnownFolderDataBlock']
+    assert extra_data['PropertyStoreDataBlock']['raw_data'] == PROPERTY_STORE
+    assert 'raw_data' not in ShellLink.from_bytes(SPEC_SAMPLE).extra_data['TrackerDataBlock']
+
+
+def test_block_that_was_not_parsed_is_refused():
+    data = link_with_blocks({'PropertyStoreDataBlock': {'raw_data': PROPERTY_STORE}})
+    link = ShellLink.from_bytes(data, extra_data_blocks=['KnownFolderDataBlock'])
+    with pytest.raises(ValueError):
+        encode_link(ShellLinkRecord.from_shell_link(link))
+
+
+def test_template_renders_changes():
+    template = LinkTemplate(ShellLinkRecord.from_shell_link(ShellLink.from_bytes(SPEC_SAMPLE, timestamps='raw')))
+    assert template.render() == SPEC_SAMPLE
+    data = template.render({'local_base_path': b'C:\\test\\b.txt', 'command_line_arguments': u'-v'})
+    link = ShellLink.from_bytes(data)
+    assert link.link_info['local_base_path'] == b'C:\\test\\b.txt'
+    assert link.string_data['command_line_arguments'] == u'-v'
+
+
+@pytest.mark.parametrize('field', ['volume_id_offset', 'local_base_path_offset_abs', 'link_info_size',
+                                   'id_list_size', 'drive_type', 'common_net_rel_link_flags'])
+def test_template_refuses_recomputed_fields(field):
+    template = LinkTemplate(ShellLinkRecord.from_shell_link(ShellLink.from_bytes(SPEC_SAMPLE, timestamps='raw')))
+    with pytest.raises(KeyError) as e:
+        template.render({field: 0x40})
+    assert 'recomputed' in str(e.value)
+    with pytest.raises(KeyError):
+        template.render({'no_such_field': 1})
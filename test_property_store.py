@@ -0,0 +1,67 @@
+import struct
+import uuid
+
+import pytest
+
+from lnk_tool import ParseError
+from property_store import PropertyStore
+
+SUMMARY_FORMAT_ID = '{B725F130-47EF-101A-A5F1-02608C9EEBAC}'
+
+
+def storage(values, format_id=SUMMARY_FORMAT_ID):
+    # a serialized property storage of integer-named (property id, typed value bytes) pairs
+    body = b''.join(struct.pack('<IIB', 9 + len(value), property_id, 0) + value for property_id, value in values)
+    body += struct.pack('<I', 0)
+    header = struct.pack('<II', 24 + len(body), 0x53505331) + uuid.UUID(format_id.strip('{}')).bytes_le
+    return header + body + struct.pack('<I', 0)
+
+
+def lpwstr(text):
+    encoded = (text + u'\x00').encode('utf-16-le')
+    return struct.pack('<HHI', 0x001F, 0, len(encoded) // 2) + encoded + b'\x00' * (-len(encoded) % 4)
+
+
+def test_decode_values():
+    store = PropertyStore(storage([(10, lpwstr(u'report.xlsx')),
+                                   (12, struct.pack('<HHQ', 0x0015, 0, 12345)),
+                                   (4, struct.pack('<HHI', 0x1013, 0, 2) + struct.pack('<II', 7, 8))]))
+    assert store['System.ItemNameDisplay'] == u'report.xlsx'
+    assert store['System.Size'] == 12345
+    assert store.get((SUMMARY_FORMAT_ID, 4)) == [7, 8]
+
+
+@pytest.mark.parametrize('element_type', [0x0000, 0x0001, 0x0999])
+def test_vector_of_elements_that_take_no_space(element_type):
+    # VT_VECTOR | VT_NULL with a huge count used to spin forever without moving
+    store = PropertyStore(storage([(10, struct.pack('<HHI', 0x1000 | element_type, 0, 0x0FFFFFFF))]))
+    with pytest.raises(ParseError) as e:
+        store.get('System.ItemNameDisplay')
+    assert e.value.check == 'sane_property_vector_count'
+
+
+def test_vector_count_larger_than_the_value():
+    store = PropertyStore(storage([(10, struct.pack('<HHI', 0x1013, 0, 3) + struct.pack('<II', 7, 8))]))
+    with pytest.raises(ParseError):
+        store.get('System.ItemNameDisplay')
+
+
+def test_vector_element_runs_past_the_value():
+    element = struct.pack('<I', 0x1000) + b'ab'
+    store = PropertyStore(storage([(10, struct.pack('<HHI', 0x101E, 0, 1) + element)]))
+    with pytest.raises(ParseError) as e:
+        store.get('System.ItemNameDisplay')
+    assert e.value.check == 'property_value_within_bounds'
+
+
+def test_truncated_scalar():
+    store = PropertyStore(storage([(12, struct.pack('<HHI', 0x0015, 0, 1))]))
+    with pytest.raises(ParseError):
+        store.get('System.Size')
+
+
+def test_bad_storage_size_offset_is_absolute():
+    data = storage([(12, struct.pack('<HHQ', 0x0015, 0, 1))])
+    with pytest.raises(ParseError) as e:
+        PropertyStore(struct.pack('<I', len(data) + 1) + data[4:], offset=0x200)
+    assert e.value.offset == 0x200
@@ -0,0 +1,79 @@
+import binascii
+
+import pytest
+
+from shell_items import IDListDecoder
+from shell_items import ShellItem
+from shell_items import decode_item
+from shell_items import format_guid
+
+# raw ItemID data (without the 2-byte size), as explorer writes it
+MY_COMPUTER = binascii.unhexlify('1f50e04fd020ea3a6910a2d808002b30309d')
+UNKNOWN_ROOT = binascii.unhexlify('1f50' + '00' * 16)
+VOLUME = b'\x2fC:\\' + b'\x00' * 19
+SHORT_NAME_ONLY = binascii.unhexlify('32 00 00000000 00000000 2000 412e54585400'.replace(' ', ''))
+
+
+def file_entry(short_name, long_name, version=9, class_type=0x32):
+    # a file entry item with a 0xBEEF0004 extension block holding the long name (at 0x2e for version 9)
+    extension = (b'\x00\x00' + bytearray([version, 0]) + b'\x04\x00\xef\xbe' + b'\x00' * (0x2E - 8) +
+                 (long_name + u'\x00').encode('utf-16-le') + b'\x00\x00')
+    head = bytearray([class_type]) + b'\x00' * 11 + short_name + b'\x00' * (2 - len(short_name) % 2)
+    return bytes(head + extension)
+
+
+def test_format_guid():
+    assert format_guid(MY_COMPUTER[2:]) == '{20D04FE0-3AEA-1069-A2D8-08002B30309D}'
+    assert format_guid(memoryview(MY_COMPUTER)[2:]) == '{20D04FE0-3AEA-1069-A2D8-08002B30309D}'
+
+
+def test_root_items():
+    assert decode_item(MY_COMPUTER) == ShellItem('root', 'My Computer')
+    assert decode_item(UNKNOWN_ROOT) == ShellItem('root', '::{00000000-0000-0000-0000-000000000000}')
+    # too short to hold its CLSID
+    assert decode_item(MY_COMPUTER[:10]) == ShellItem('unknown', '0x1F')
+
+
+def test_volume_items():
+    assert decode_item(VOLUME) == ShellItem('volume', u'C:\\')
+    assert decode_item(VOLUME[:3]) == ShellItem('volume', u'C:')
+    assert decode_item(VOLUME[:1]) == ShellItem('volume', u'')
+
+
+def test_file_entry_items():
+    assert decode_item(SHORT_NAME_ONLY) == ShellItem('file', u'A.TXT')
+    assert decode_item(file_entry(b'REPORT~1.DOC', u'Report 2024.docx')) == ShellItem('file', u'Report 2024.docx')
+    # extensions before version 3 don't carry a long name
+    assert decode_item(file_entry(b'REPORT~1.DOC', u'Report.docx', version=2)) == ShellItem('file', u'REPORT~1.DOC')
+    # unicode short name
+    item = bytes(bytearray([0x36]) + b'\x00' * 11 + u'a.txt\x00'.encode('utf-16-le'))
+    assert decode_item(item) == ShellItem('file', u'a.txt')
+
+
+@pytest.mark.parametrize('size, name', [(13, u'A'), (16, u'A.TX'), (30, u'A.TXT'), (70, u'a l')])
+def test_truncated_file_entry(size, name):
+    # cut before the long name, the short name is used; either name keeps whatever of it fits
+    item = file_entry(b'A.TXT', u'a long name.txt')
+    assert decode_item(item[:size]) == ShellItem('file', name)
+
+
+def test_too_short_file_entry_is_unknown():
+    assert decode_item(SHORT_NAME_ONLY[:12]) == ShellItem('unknown', '0x32')
+
+
+def test_unknown_items():
+    assert decode_item(b'') == ShellItem('unknown', None)
+    assert decode_item(b'\x71\x00\x00\x00') == ShellItem('unknown', '0x71')
+    assert decode_item(b'\x41\x00') == ShellItem('unknown', '0x41')
+    assert decode_item(b'\x41\x00\x00\\\\server\\share\x00') == ShellItem('network', u'\\\\server\\share')
+
+
+def test_decoder_joins_and_shares_prefixes():
+    decoder = IDListDecoder()
+    windows = file_entry(b'WINDOWS', u'Windows')
+    notepad = file_entry(b'NOTEPAD.EXE', u'notepad.exe')
+    assert decoder.path([MY_COMPUTER, VOLUME, windows, notepad]) == u'C:\\Windows\\notepad.exe'
+    assert decoder.path([MY_COMPUTER, VOLUME, windows]) == u'C:\\Windows'
+    assert decoder.prefix_count == 4
+    assert decoder.path([UNKNOWN_ROOT, windows]) == u'::{00000000-0000-0000-0000-000000000000}\\Windows'
+    assert decoder.path([]) is None